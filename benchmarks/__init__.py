@@ -0,0 +1,5 @@
+"""Prism benchmarks.
+
+Simulated Lifx and YeeLight devices, see ``simulator``, and a benchmark
+harness measuring prism against them, see ``benchmark``.
+"""
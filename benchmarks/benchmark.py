@@ -0,0 +1,296 @@
+"""Benchmark prism against simulated devices, see ``simulator``.
+
+Runs the asyncio protocol clients, ``prism.lifx_client.aio`` and
+``prism.yeelight_client.aio``, and the blocking clients, ``prism.lifx_client``
+and ``prism.yeelight_client``, against simulated devices. Blocking discovery,
+lifxlan and yeelight, can not be pointed at other addresses than the real
+network, blocking lights are created from the addresses asyncio discovery found.
+
+For every protocol and device count, measures:
+
+* discovery, seconds and lights found, includes waiting ``--discovery-timeout``
+* poll, seconds to refresh state of all known lights without discovery, both clients
+* ``/lights``, latency of the ``/lights`` endpoint, in milliseconds
+* set_state, state changes per second, set concurrently like ``Prism.set_states``, both clients
+* memory, bytes allocated by discovery and still held, and peak
+
+Results are written as json, and compared with a baseline if given, exit code
+is 1 if any result regressed more than ``--tolerance``::
+
+    python -m benchmarks.benchmark --devices 1 10 100 500 --output results.json
+    python -m benchmarks.benchmark --devices 1 10 100 500 --baseline results.json
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import logging as loggr
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+from lifxlan import Light
+
+from prism import aio
+from prism import prism as service  # application is created, discovery only starts on first request
+from prism.light import LightProtocol, LightState
+from prism.lifx_client import aio as lifx_aio
+from prism.lifx_client import lifx
+from prism.yeelight_client import aio as yeelight_aio
+from prism.yeelight_client import yeelight
+from prism.yeelight_client.connection import get_connection, release_connection
+
+from .simulator import ADDRESS, Simulator
+
+_PROTOCOLS = {
+    'lifx': lifx_aio,
+    'yeelight': yeelight_aio
+}
+
+_BLOCKING_PROTOCOLS = {
+    'lifx': lifx,
+    'yeelight': yeelight
+}
+
+_MAX_WORKERS = 32  # same as ``Prism`` state change executor
+_MAX_WRITE_RATE = 1000  # per light, state changes are not throttled below what devices manage
+
+_LOWER_IS_BETTER = ('discovery_seconds', 'poll_seconds', 'blocking_poll_seconds', 'lights_p50_ms', 'lights_p99_ms',
+                    'memory_bytes')
+_HIGHER_IS_BETTER = ('lights_found', 'set_state_per_second', 'blocking_set_state_per_second')
+
+
+def main(arguments=None):
+    """Run benchmarks, see module documentation.
+
+    :param arguments: ``[String]`` command line arguments, default ``sys.argv``
+    :returns: ``Integer`` exit code
+    """
+    parser = argparse.ArgumentParser(description='Benchmark prism against simulated devices.')
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 10, 100], help='device counts, 1-500')
+    parser.add_argument('--protocols', nargs='+', choices=sorted(_PROTOCOLS), default=sorted(_PROTOCOLS))
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds before device responds')
+    parser.add_argument('--jitter', type=float, default=0.002, help='seconds latency varies, plus/minus')
+    parser.add_argument('--loss', type=float, default=0.0, help='0-1 probability a datagram is lost')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for jitter and loss')
+    parser.add_argument('--discovery-timeout', type=float, default=1.0, help='seconds to wait for discovery')
+    parser.add_argument('--requests', type=int, default=1000, help='/lights responses to time')
+    parser.add_argument('--rounds', type=int, default=3, help='state changes per light')
+    parser.add_argument('--output', help='write results to json file')
+    parser.add_argument('--baseline', help='compare results with json file from earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression, 0.25 is 25%%')
+    parser.add_argument('--verbose', action='store_true', help='log prism warnings, e.g. lost packets')
+    arguments = parser.parse_args(arguments)
+
+    loggr.basicConfig(level=loggr.WARNING if arguments.verbose else loggr.ERROR)
+
+    results = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'configuration': {
+            'latency': arguments.latency,
+            'jitter': arguments.jitter,
+            'loss': arguments.loss,
+            'seed': arguments.seed,
+            'discovery_timeout': arguments.discovery_timeout,
+            'requests': arguments.requests,
+            'rounds': arguments.rounds
+        },
+        'benchmarks': []
+    }
+
+    for devices in arguments.devices:
+        for protocol in arguments.protocols:
+            result = benchmark(protocol, devices, arguments)
+            results['benchmarks'].append(result)
+            print(_format(result), flush=True)
+
+    results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(json.load(baseline_file), results, arguments.tolerance)
+
+        for regression in regressions:
+            print('REGRESSION {protocol} devices={devices} {metric}: {baseline} -> {value}'.format(**regression))
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+def benchmark(protocol, devices, arguments):
+    """Benchmark one protocol with simulated devices.
+
+    :param protocol: ``String`` protocol, key in ``_PROTOCOLS``
+    :param devices: ``Integer`` number of simulated devices
+    :param arguments: ``Namespace`` parsed command line arguments
+    :returns: ``Dict`` result
+    """
+    client = _PROTOCOLS[protocol]
+    blocking_client = _BLOCKING_PROTOCOLS[protocol]
+    simulator = Simulator(
+        latency=arguments.latency, jitter=arguments.jitter, loss=arguments.loss, seed=arguments.seed,
+        **{protocol: devices})
+
+    LightProtocol.set_max_write_rate(_MAX_WRITE_RATE)
+
+    with simulator:
+        _reset(client)
+        _reset(blocking_client)
+        client.configure(ADDRESS, simulator.lifx_port if protocol == 'lifx' else simulator.yeelight_port)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        lights = aio.run(client.discover(arguments.discovery_timeout),
+                         timeout=arguments.discovery_timeout + aio.DEFAULT_TIMEOUT)
+        discovery_seconds = time.perf_counter() - start
+        memory_bytes, memory_peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        client.refresh_lights()
+        poll_seconds = time.perf_counter() - start
+
+        latencies = _lights_latencies(lights, arguments.requests)
+        set_state_per_second, failures = _set_state_throughput(lights, arguments.rounds)
+
+        _add_blocking_lights(protocol, lights, simulator)
+        start = time.perf_counter()
+        blocking_lights = blocking_client.refresh_lights()
+        blocking_poll_seconds = time.perf_counter() - start
+
+        blocking_set_state_per_second, blocking_failures = _set_state_throughput(blocking_lights, arguments.rounds)
+        _reset(blocking_client)
+
+    return {
+        'protocol': protocol,
+        'devices': devices,
+        'lights_found': len(lights),
+        'discovery_seconds': round(discovery_seconds, 4),
+        'poll_seconds': round(poll_seconds, 4),
+        'lights_p50_ms': round(latencies[len(latencies) // 2] * 1000, 4),
+        'lights_p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 4),
+        'lights_mean_ms': round(statistics.mean(latencies) * 1000, 4),
+        'set_state_per_second': round(set_state_per_second, 1),
+        'set_state_failures': failures,
+        'blocking_poll_seconds': round(blocking_poll_seconds, 4),
+        'blocking_set_state_per_second': round(blocking_set_state_per_second, 1),
+        'blocking_set_state_failures': blocking_failures,
+        'memory_bytes': memory_bytes,
+        'memory_peak_bytes': memory_peak_bytes
+    }
+
+
+def _reset(client):
+    """Forget lights, and connections, from earlier benchmark."""
+    if client is yeelight:
+        for light in client.get_cached_lights():
+            release_connection(light._connection)  # pylint: disable=protected-access
+    client._cache.clear()  # pylint: disable=protected-access
+    getattr(client, '_connections', {}).clear()
+
+
+def _add_blocking_lights(protocol, lights, simulator):
+    """Add lights found by asyncio discovery to blocking client, at simulator address."""
+    for light in lights:
+        address = light.snapshot()['address']
+        if protocol == 'lifx':
+            raw_light = Light(light.get_id(), address['ip'], port=simulator.lifx_port)
+            lifx._cache.add(lifx.LifxLight(light.get_name(), raw_light))  # pylint: disable=protected-access
+        else:
+            connection = get_connection(address['ip'], address['port'])
+            yeelight._cache.add(  # pylint: disable=protected-access
+                yeelight.YeelightLight(light.get_name(), light.get_id(), connection))
+
+
+def _lights_latencies(lights, requests):
+    """Time ``/lights`` endpoint with lights in registry, returns sorted latencies in seconds."""
+    application = service.prism
+    # started as far as endpoints know, background discovery of real network would replace lights
+    application._started = os.getpid()  # pylint: disable=protected-access
+    application._registry.update(lights)  # pylint: disable=protected-access
+
+    latencies = []
+    with service.app.test_request_context('/lights'):
+        for _ in range(requests):
+            start = time.perf_counter()
+            service.get_lights()
+            latencies.append(time.perf_counter() - start)
+
+    return sorted(latencies)
+
+
+def _set_state_throughput(lights, rounds):
+    """Set state for all lights concurrently, ``rounds`` times per light.
+
+    :returns: (``Float``, ``Integer``) state changes per second, and failures
+    """
+    results = []
+
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        start = time.perf_counter()
+        for index in range(rounds):  # one round at a time, concurrent changes to one light are coalesced
+            state = LightState(power=True, brightness=50 if index % 2 else 100, kelvin=3500)
+            results += list(executor.map(lambda light, state=state: light.set_state(state), lights))
+        seconds = time.perf_counter() - start
+
+    return len(results) / seconds if seconds else 0.0, results.count(False)
+
+
+def compare(baseline, results, tolerance):
+    """Compare results with baseline, results for devices not in both are ignored.
+
+    :param baseline: ``Dict`` earlier results
+    :param results: ``Dict`` current results
+    :param tolerance: ``Float`` allowed relative regression
+    :returns: ``[Dict]`` regressions
+    """
+    earlier = {(result['protocol'], result['devices']): result for result in baseline['benchmarks']}
+
+    regressions = []
+    for result in results['benchmarks']:
+        previous = earlier.get((result['protocol'], result['devices']))
+        if previous is None:
+            continue
+
+        for metric in _LOWER_IS_BETTER + _HIGHER_IS_BETTER:
+            if metric not in previous:
+                continue
+
+            if metric in _LOWER_IS_BETTER:
+                regressed = result[metric] > previous[metric] * (1 + tolerance)
+            else:
+                regressed = result[metric] < previous[metric] * (1 - tolerance)
+
+            if regressed:
+                regressions.append({
+                    'protocol': result['protocol'],
+                    'devices': result['devices'],
+                    'metric': metric,
+                    'baseline': previous[metric],
+                    'value': result[metric]
+                })
+
+    return regressions
+
+
+def _format(result):
+    return '{protocol:8} devices={devices:<4} found={lights_found:<4} discovery={discovery_seconds:.3f}s ' \
+           'poll={poll_seconds:.3f}s /lights p50={lights_p50_ms:.3f}ms p99={lights_p99_ms:.3f}ms ' \
+           'set_state={set_state_per_second:.0f}/s blocking poll={blocking_poll_seconds:.3f}s ' \
+           'set_state={blocking_set_state_per_second:.0f}/s memory={memory_bytes}B'.format(**result)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""Simulated Lifx and YeeLight devices on loopback.
+
+Lifx devices answer Lifx LAN protocol on one shared UDP port, devices are told
+apart by target mac address, like devices on a real network are. YeeLight
+devices answer discovery search on one shared UDP port, and each device listens
+for commands on its own TCP port.
+
+Devices run in a separate process, so simulating hundreds of devices does not
+compete with prism for the interpreter. Every response is delayed by
+``latency`` plus/minus ``jitter`` seconds, and every UDP datagram, in either
+direction, is lost with probability ``loss``. TCP is reliable, commands are
+only delayed.
+
+Example::
+
+    with Simulator(lifx=100, yeelight=100, latency=0.01) as simulator:
+        lifx_aio.configure('127.0.0.1', simulator.lifx_port)
+        yeelight_aio.configure('127.0.0.1', simulator.yeelight_port)
+"""
+
+import asyncio
+import json
+import multiprocessing
+import random
+
+from prism.lifx_client import packets
+
+ADDRESS = '127.0.0.1'
+MAX_DEVICES = 500
+
+_START_TIMEOUT = 30  # seconds to wait for devices to start listening
+
+
+class Simulator:
+    """Simulated devices, running in a background process while started."""
+
+    def __init__(self, lifx=0, yeelight=0, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        """Create and initialize ``Simulator``, devices are started with ``start``.
+
+        :param lifx: ``Integer`` number of Lifx devices, 0-500
+        :param yeelight: ``Integer`` number of YeeLight devices, 0-500
+        :param latency: ``Float`` seconds before device responds
+        :param jitter: ``Float`` seconds latency varies, plus/minus
+        :param loss: ``Float`` 0-1 probability a datagram is lost
+        :param seed: ``Integer`` random seed, for repeatable jitter and loss
+        """
+        if not 0 <= lifx <= MAX_DEVICES or not 0 <= yeelight <= MAX_DEVICES:
+            raise ValueError('device count must be 0-{}'.format(MAX_DEVICES))
+
+        if not 0 <= loss < 1:
+            raise ValueError('loss must be at least 0 and less than 1')
+
+        self._configuration = {
+            'lifx': lifx,
+            'yeelight': yeelight,
+            'latency': latency,
+            'jitter': min(jitter, latency),  # never respond before request
+            'loss': loss,
+            'seed': seed
+        }
+        self._process = None
+        self.lifx_port = None
+        self.yeelight_port = None
+
+    def start(self):
+        """Start devices, returns when all devices are listening.
+
+        :returns: ``Simulator`` self
+        """
+        context = multiprocessing.get_context('spawn')  # do not fork threads, or event loops, of caller
+        connection, child_connection = context.Pipe()
+
+        self._process = context.Process(
+            target=_serve, args=(self._configuration, child_connection), name='prism-simulator', daemon=True)
+        self._process.start()
+
+        if not connection.poll(_START_TIMEOUT):
+            self.stop()
+            raise RuntimeError('simulated devices did not start within {}s'.format(_START_TIMEOUT))
+
+        self.lifx_port, self.yeelight_port = connection.recv()
+        return self
+
+    def stop(self):
+        """Stop devices."""
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        """Start devices, see ``start``."""
+        return self.start()
+
+    def __exit__(self, *_):
+        """Stop devices, see ``stop``."""
+        self.stop()
+
+
+def _serve(configuration, connection):
+    """Run devices until process is terminated, ports are sent on connection when listening."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    network = _Network(configuration['latency'], configuration['jitter'], configuration['loss'], configuration['seed'])
+    ports = loop.run_until_complete(_start(loop, network, configuration['lifx'], configuration['yeelight']))
+
+    connection.send(ports)
+    loop.run_forever()
+
+
+async def _start(loop, network, lifx, yeelight):
+    lifx_devices = {_mac(index): _LifxDevice('lifx-{:04d}'.format(index)) for index in range(lifx)}
+    lifx_transport, _ = await loop.create_datagram_endpoint(
+        lambda: _LifxResponder(network, lifx_devices), local_addr=(ADDRESS, 0))
+
+    yeelight_devices = []
+    for index in range(yeelight):
+        device = _YeelightDevice(index)
+        server = await asyncio.start_server(
+            lambda reader, writer, device=device: _serve_yeelight(network, device, reader, writer), ADDRESS, 0)
+        device.port = server.sockets[0].getsockname()[1]
+        yeelight_devices.append(device)
+
+    yeelight_transport, _ = await loop.create_datagram_endpoint(
+        lambda: _YeelightSearchResponder(network, yeelight_devices), local_addr=(ADDRESS, 0))
+
+    return lifx_transport.get_extra_info('sockname')[1], yeelight_transport.get_extra_info('sockname')[1]
+
+
+def _mac(index):
+    return 'd0:73:d5:{:02x}:{:02x}:{:02x}'.format((index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF)
+
+
+class _Network:
+    """Latency, jitter and loss, shared by all devices."""
+
+    def __init__(self, latency, jitter, loss, seed):
+        self._latency = latency
+        self._jitter = jitter
+        self._loss = loss
+        self._random = random.Random(seed)
+
+    def lost(self):
+        return self._loss > 0 and self._random.random() < self._loss
+
+    def delay(self):
+        return self._latency + self._random.uniform(-self._jitter, self._jitter)
+
+    def sendto(self, transport, data, address):
+        """Send datagram after delay, unless lost."""
+        if not self.lost():
+            asyncio.get_running_loop().call_later(self.delay(), transport.sendto, data, address)
+
+
+class _LifxDevice:
+    def __init__(self, label):
+        self.label = label
+        self.color = packets.Color(0, 0, 65535, 3500)
+        self.power = True
+
+
+class _LifxResponder(asyncio.DatagramProtocol):
+    """Lifx devices sharing one UDP endpoint."""
+
+    def __init__(self, network, devices):
+        self._network = network
+        self._devices = devices
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data, addr):
+        packet = packets.unpack(data)
+
+        if packet is None or self._network.lost():
+            return
+
+        if packet.type == packets.GET_SERVICE:  # broadcast, all devices respond
+            port = self._transport.get_extra_info('sockname')[1]
+            for mac in self._devices:
+                self._respond(packet, mac, packets.STATE_SERVICE, packets.state_service(port), addr)
+            return
+
+        device = self._devices.get(packet.target)
+        if device is None:
+            return
+
+        if packet.type == packets.LIGHT_GET:
+            self._respond(packet, packet.target, packets.LIGHT_STATE,
+                          packets.light_state(device.color, device.power, device.label), addr)
+        elif packet.type == packets.LIGHT_SET_COLOR:
+            device.color, _ = packets.parse_set_color(packet.payload)
+            self._respond(packet, packet.target, packets.ACKNOWLEDGEMENT, b'', addr)
+        elif packet.type == packets.LIGHT_SET_POWER:
+            device.power, _ = packets.parse_set_power(packet.payload)
+            self._respond(packet, packet.target, packets.ACKNOWLEDGEMENT, b'', addr)
+
+    def _respond(self, request, mac, message_type, payload, addr):
+        response = packets.pack(message_type, payload, target=mac, source=request.source, sequence=request.sequence)
+        self._network.sendto(self._transport, response, addr)
+
+
+class _YeelightDevice:
+    def __init__(self, index):
+        self.id = '0x{:016x}'.format(index)  # pylint: disable=invalid-name
+        self.name = 'yeelight-{:04d}'.format(index)
+        self.port = None
+        self.properties = {'power': 'on', 'bright': '100', 'ct': '4000', 'rgb': '16777215'}
+
+    def execute(self, method, params):
+        """Execute command, returns ``result`` of response."""
+        if method == 'get_prop':
+            return [self.properties.get(prop, '') for prop in params]
+
+        if method == 'set_power':
+            self.properties['power'] = params[0]
+        elif method == 'set_bright':
+            self.properties['bright'] = str(int(params[0]))
+        elif method == 'set_ct_abx':
+            self.properties['ct'] = str(params[0])
+        elif method == 'set_rgb':
+            self.properties['rgb'] = str(params[0])
+
+        return ['ok']
+
+
+class _YeelightSearchResponder(asyncio.DatagramProtocol):
+    """YeeLight devices sharing one UDP endpoint for discovery search."""
+
+    def __init__(self, network, devices):
+        self._network = network
+        self._devices = devices
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data, addr):
+        if not data.startswith(b'M-SEARCH') or self._network.lost():
+            return
+
+        for device in self._devices:
+            headers = dict(device.properties, id=device.id, name=device.name, model='color',
+                           location='yeelight://{}:{}'.format(ADDRESS, device.port))
+            response = 'HTTP/1.1 200 OK\r\n' + ''.join('{}: {}\r\n'.format(*header) for header in headers.items())
+            self._network.sendto(self._transport, response.encode(), addr)
+
+
+async def _serve_yeelight(network, device, reader, writer):
+    """Answer pipelined commands on one connection, in order, until closed."""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            command = json.loads(line)
+            result = device.execute(command['method'], command['params'])
+
+            await asyncio.sleep(network.delay())
+            writer.write(json.dumps({'id': command['id'], 'result': result}).encode() + b'\r\n')
+    except (OSError, ValueError, KeyError):
+        pass
+    finally:
+        writer.close()
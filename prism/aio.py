@@ -0,0 +1,115 @@
+"""Asyncio module, non-blocking light protocols.
+
+Asyncio protocol clients do all device i/o on one event loop, running in a
+background thread, so many concurrent device operations do not need a thread
+each. ``run`` adapts coroutines for the blocking SMRT endpoints, and
+``AsyncLightProtocol`` implements ``LightProtocol`` on top of async
+``get_state`` and ``set_state``.
+"""
+
+import asyncio
+import concurrent.futures
+import logging as loggr
+import threading
+
+from .light import LightProtocol
+
+log = loggr.getLogger('smrt')
+
+DEFAULT_TIMEOUT = 10  # seconds
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Get event loop for asyncio protocol clients, started on first use.
+
+    :returns: ``AbstractEventLoop`` running in background thread
+    """
+    global _loop  # pylint: disable=global-statement
+
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='prism-asyncio', daemon=True).start()
+            log.debug('asyncio event loop started')
+
+    return _loop
+
+
+def run(coroutine, timeout=DEFAULT_TIMEOUT):
+    """Run coroutine on event loop, and wait for result.
+
+    Must not be called from the event loop itself.
+
+    :param coroutine: coroutine to run
+    :param timeout: ``Integer`` seconds to wait for result
+    :returns: coroutine result
+    :raises concurrent.futures.TimeoutError: if coroutine did not complete in time
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+class AsyncLightProtocol(LightProtocol):
+    """Interface for asyncio light clients, see ``LightProtocol``.
+
+    Implementations provide ``_get_state_async`` and ``_set_state_async``,
+    blocking ``LightProtocol`` functions run them on the event loop.
+    """
+
+    async def set_state_async(self, state):
+        """Set state for light source, without coalescing.
+
+        :param state: ``LightState`` new state for light
+        :returns: ``Boolean`` successful
+        """
+        successful = await self._set_state_async(state)
+
+        if successful:
+            self.update_state(state)
+
+        return successful
+
+    async def get_state_async(self):
+        """Read state from light source, and update last known state.
+
+        :returns: ``LightState`` object.
+        """
+        state = await self._get_state_async()
+        self.update_state(state)
+        return self.get_state()
+
+    def _read_state(self):
+        """See ``LightProtocol.get_state`` documentation."""
+        return run(self._get_state_async())
+
+    def _set_state(self, state):
+        """See ``LightProtocol.set_state`` documentation."""
+        return run(self._set_state_async(state))
+
+    def _apply(self, commands):
+        """See ``LightProtocol.apply_plan`` documentation."""
+        return run(self._apply_async(commands))
+
+    async def _apply_async(self, commands):
+        """See ``LightProtocol.apply_plan`` documentation, default is to set compiled state."""
+        return await self._set_state_async(commands)
+
+    def _probe(self):
+        """See ``LightProtocol._probe`` documentation."""
+        run(self.get_state_async())  # raises if light does not respond
+        return True
+
+    async def _set_state_async(self, state):
+        """See ``AsyncLightProtocol.set_state_async`` documentation."""
+        raise NotImplementedError('Client is missing "_set_state_async" function implementation')
+
+    async def _get_state_async(self):
+        """See ``AsyncLightProtocol.get_state_async`` documentation."""
+        raise NotImplementedError('Client is missing "_get_state_async" function implementation')
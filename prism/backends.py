@@ -0,0 +1,153 @@
+"""Backends module, where the light registry is kept.
+
+With several worker processes, each worker would discover lights on its own,
+multiplying broadcast traffic, and answer with its own view of the lights. A
+registry backend decides which worker discovers lights, the leader, and how
+other workers, followers, get the leader's view.
+
+``LocalBackend`` keeps the registry in process, every worker is a leader. This
+is the default, and the only choice for a single worker.
+
+``SharedBackend`` elects one leader among workers on the same host with an
+exclusive ``flock``. The leader publishes a snapshot of all lights to a file,
+by default in shared memory, ``/dev/shm``. Followers load the snapshot when it
+changes. When the leader exits its lock is released, and the next worker to try
+becomes leader. A lock is only held by the process that took it, a process forked
+from the leader is not leader.
+"""
+
+import fcntl
+import logging as loggr
+import os
+import threading
+
+from . import persistence
+
+log = loggr.getLogger('smrt')
+
+LOCAL = 'local'
+SHARED = 'shared'
+
+DEFAULT_SHARED_PATH = '/dev/shm/prism-registry.json'
+
+
+def create(name, path=None):
+    """Create registry backend.
+
+    :param name: ``String`` ``LOCAL`` or ``SHARED``
+    :param path: ``String`` snapshot file for ``SHARED``, default ``DEFAULT_SHARED_PATH``
+    :returns: ``LocalBackend`` or ``SharedBackend``
+    """
+    if name == SHARED:
+        return SharedBackend(path or DEFAULT_SHARED_PATH)
+    return LocalBackend()
+
+
+class LocalBackend:
+    """Registry in this process only, see module documentation."""
+
+    @staticmethod
+    def elect():
+        """Try to become leader, i.e. the process that discovers lights and publishes them.
+
+        :returns: ``Boolean`` leader
+        """
+        return True
+
+    @staticmethod
+    def is_leader():
+        """Get if this process is leader, without trying to become leader, see ``elect``.
+
+        :returns: ``Boolean`` leader
+        """
+        return True
+
+    def publish(self, lights):
+        """Publish lights to followers, see ``load``.
+
+        :param lights: ``[LightProtocol]`` all known lights
+        """
+
+    def load(self):
+        """Load lights published by leader.
+
+        :returns: ``[Dict]`` light snapshots, or ``None`` if unchanged since last load, or not loaded
+        """
+        return None
+
+
+class SharedBackend:
+    """Registry shared by workers on one host, see module documentation."""
+
+    def __init__(self, path):
+        """Create and initialize ``SharedBackend``.
+
+        :param path: ``String`` snapshot file, lock file is next to it
+        """
+        self._path = path
+        self._lock_path = '{}.lock'.format(path)
+        self._lock_file = None  # open, and locked, while leader
+        self._lock_pid = None  # process that took the lock, forked processes inherit the file but not leadership
+        self._loaded = None  # (inode, modified) of last loaded snapshot
+        self._lock = threading.Lock()
+
+    def elect(self):
+        """See ``LocalBackend.elect`` documentation, leadership is kept until process exits."""
+        if self.is_leader():
+            return True
+
+        with self._lock:
+            if self._lock_file is not None and self._lock_pid != os.getpid():
+                self._lock_file.close()  # inherited, lock stays with the process that took it
+                self._lock_file = None
+
+            if self._lock_file is None:
+                self._lock_file = self._try_lock()
+                if self._lock_file is not None:
+                    self._lock_pid = os.getpid()
+                    log.info('elected leader for shared registry %s, pid=%i', self._path, os.getpid())
+
+        return self.is_leader()
+
+    def is_leader(self):
+        """See ``LocalBackend.is_leader`` documentation."""
+        return self._lock_file is not None and self._lock_pid == os.getpid()
+
+    def _try_lock(self):
+        try:
+            lock_file = open(self._lock_path, 'a', encoding='utf-8')
+        except OSError as err:
+            log.warning('could not open registry lock %s: %s', self._lock_path, err)
+            return None
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()  # another process is leader
+            return None
+
+        return lock_file
+
+    def publish(self, lights):
+        """See ``LocalBackend.publish`` documentation."""
+        persistence.save(self._path, lights)
+
+    def load(self):
+        """See ``LocalBackend.load`` documentation, costs one ``stat`` if unchanged.
+
+        A snapshot that could not be loaded is not tried again, followers keep
+        their lights until leader publishes next snapshot.
+        """
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None  # nothing published yet
+
+        modified = (stat.st_ino, stat.st_mtime_ns)  # snapshot is replaced, not rewritten
+
+        with self._lock:
+            if modified == self._loaded:
+                return None
+            self._loaded = modified
+
+        return persistence.load(self._path)
@@ -0,0 +1,145 @@
+"""Color module, converts colors between prism and vendor color spaces.
+
+Prism colors are RGB, 0-255 per channel, Lifx colors are HSBK, 0-65535 hue,
+saturation and brightness plus kelvin, and YeeLight colors are RGB packed into
+one integer.
+
+Functions convert batches, i.e. lists of colors, so state for all lights in a
+refresh, or a group, is converted in one call. Conversions are plain Python,
+prism does not depend on numpy, and round to nearest instead of truncating.
+"""
+
+KELVIN_MIN = 2500  # ``LightState`` kelvin range
+KELVIN_MAX = 9000
+
+_MAX_16 = 65535
+
+
+def hsv_to_rgb(colors):
+    """Convert HSV colors to RGB.
+
+    :param colors: ``[(Float, Float, Float)]`` hue, saturation and value, 0-1
+    :returns: ``[[Integer, Integer, Integer]]`` red, green and blue, 0-255
+    """
+    converted = []
+    append = converted.append
+
+    for hue, saturation, value in colors:
+        value *= 255  # scaled once, instead of per channel
+        if saturation == 0:
+            channel = int(value + 0.5)
+            append([channel, channel, channel])
+            continue
+
+        sector = int(hue * 6)
+        fraction = hue * 6 - sector
+        low = int(value * (1 - saturation) + 0.5)
+        falling = int(value * (1 - saturation * fraction) + 0.5)
+        rising = int(value * (1 - saturation * (1 - fraction)) + 0.5)
+        value = int(value + 0.5)
+
+        sector %= 6
+        if sector == 0:
+            append([value, rising, low])
+        elif sector == 1:
+            append([falling, value, low])
+        elif sector == 2:
+            append([low, value, rising])
+        elif sector == 3:
+            append([low, falling, value])
+        elif sector == 4:
+            append([rising, low, value])
+        else:
+            append([value, low, falling])
+
+    return converted
+
+
+def rgb_to_hsv(colors):
+    """Convert RGB colors to HSV.
+
+    :param colors: ``[[Integer, Integer, Integer]]`` red, green and blue, 0-255
+    :returns: ``[(Float, Float, Float)]`` hue, saturation and value, 0-1
+    """
+    converted = []
+
+    for red, green, blue in colors:
+        high = max(red, green, blue)
+        spread = high - min(red, green, blue)
+
+        if spread == 0:
+            converted.append((0.0, 0.0, high / 255))
+            continue
+
+        if high == red:
+            hue = ((green - blue) / spread) % 6
+        elif high == green:
+            hue = (blue - red) / spread + 2
+        else:
+            hue = (red - green) / spread + 4
+
+        converted.append((hue / 6, spread / high, high / 255))
+
+    return converted
+
+
+def hsbk_to_rgb(colors):
+    """Convert Lifx HSBK colors to RGB, kelvin is ignored.
+
+    :param colors: ``[(Integer, Integer, Integer, Integer)]`` hue, saturation, brightness 0-65535 and kelvin
+    :returns: ``[[Integer, Integer, Integer]]`` red, green and blue, 0-255
+    """
+    return hsv_to_rgb([(hue / _MAX_16, saturation / _MAX_16, brightness / _MAX_16)
+                       for hue, saturation, brightness, _ in colors])
+
+
+def rgb_to_hsbk(colors, kelvins, brightnesses):
+    """Convert RGB colors to Lifx HSBK.
+
+    :param colors: ``[[Integer, Integer, Integer]]`` red, green and blue, 0-255
+    :param kelvins: ``[Integer]`` kelvin per color, ``None`` is 0
+    :param brightnesses: ``[Integer]`` brightness 0-100 per color, ``None`` is color brightness
+    :returns: ``[(Integer, Integer, Integer, Integer)]`` hue, saturation, brightness 0-65535 and kelvin
+    """
+    return [(
+        int(hue * _MAX_16 + 0.5),
+        int(saturation * _MAX_16 + 0.5),
+        int((value if brightness is None else brightness / 100) * _MAX_16 + 0.5),
+        kelvin if kelvin is not None else 0
+    ) for (hue, saturation, value), kelvin, brightness in zip(rgb_to_hsv(colors), kelvins, brightnesses)]
+
+
+def to_percent(values):
+    """Convert 0-65535 values, e.g. Lifx brightness, to percent.
+
+    :param values: ``[Integer]`` 0-65535
+    :returns: ``[Integer]`` 0-100
+    """
+    return [int(value * 100 / _MAX_16 + 0.5) for value in values]
+
+
+def rgb_to_int(colors):
+    """Pack RGB colors into integers, i.e. YeeLight ``rgb``.
+
+    :param colors: ``[[Integer, Integer, Integer]]`` red, green and blue, 0-255
+    :returns: ``[Integer]`` 0xRRGGBB
+    """
+    return [(red << 16) | (green << 8) | blue for red, green, blue in colors]
+
+
+def int_to_rgb(values):
+    """Unpack RGB colors from integers, i.e. YeeLight ``rgb``.
+
+    :param values: ``[Integer]`` 0xRRGGBB
+    :returns: ``[[Integer, Integer, Integer]]`` red, green and blue, 0-255
+    """
+    return [[(value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF] for value in values]
+
+
+def clamp_kelvin(kelvins):
+    """Clamp vendor kelvin to ``LightState`` kelvin range, ``None`` is kept.
+
+    :param kelvins: ``[Integer]`` kelvin
+    :returns: ``[Integer]`` kelvin 2500-9000
+    """
+    return [min(max(kelvin, KELVIN_MIN), KELVIN_MAX) if kelvin is not None else None for kelvin in kelvins]
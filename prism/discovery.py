@@ -0,0 +1,173 @@
+"""Discovery module keeps the light caches warm in the background.
+
+Discovery on Local Area Network relies on broadcasts and timeouts, and is
+therefore slow. Instead of discovering on every request, ``DiscoveryScheduler``
+refreshes the protocol client caches periodically, so requests can be served
+straight from cache.
+
+Protocol clients are discovered concurrently with ``discover``, so discovery
+takes as long as the slowest protocol rather than the sum of all protocols.
+Between discoveries, known lights are polled directly with ``poll``, which is
+much cheaper than a broadcast followed by waiting for responses.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging as loggr
+import threading
+
+from . import metrics
+
+log = loggr.getLogger('smrt')
+
+DEFAULT_INTERVAL = 60  # seconds between background discoveries
+DEFAULT_TIMEOUT = 10  # seconds before discovery gives up on a protocol
+DEFAULT_BROADCAST_EVERY = 10  # every n:th background refresh is a discovery
+
+_running = {}  # client name to future of discovery, or poll, still running
+_running_lock = threading.Lock()
+
+
+def discover(clients, timeout=DEFAULT_TIMEOUT):
+    """Discover lights for all protocol clients concurrently.
+
+    A protocol client is a module implementing ``get_lights``,
+    ``refresh_lights`` and ``get_cached_lights``. If a client does not complete
+    discovery within ``timeout``, or fails, its cached lights are returned
+    instead.
+
+    :param clients: ``[Module]`` protocol clients
+    :param timeout: ``Integer`` seconds overall deadline
+    :returns: ``[LightProtocol]``
+    """
+    return _fan_out(clients, 'get_lights', timeout)
+
+
+def poll(clients, timeout=DEFAULT_TIMEOUT):
+    """Poll known lights for all protocol clients concurrently, without discovery.
+
+    See ``discover`` documentation.
+
+    :param clients: ``[Module]`` protocol clients
+    :param timeout: ``Integer`` seconds overall deadline
+    :returns: ``[LightProtocol]``
+    """
+    return _fan_out(clients, 'refresh_lights', timeout)
+
+
+def _fan_out(clients, function_name, timeout):
+    """Call function for all clients concurrently, see ``discover``.
+
+    Clients that timed out keep running in the background, and their caches are
+    not thread safe. A client still running since an earlier call is therefore
+    not called again until it has completed, its cached lights are used instead.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(clients), thread_name_prefix='prism-discover')
+    futures = {}
+    with _running_lock:
+        for client in clients:
+            running = _running.get(client.__name__)
+            if running is None or running.done():
+                futures[client] = _running[client.__name__] = executor.submit(_timed, client, function_name)
+            else:
+                log.warning('%s discovery still running, using cache', client.__name__)
+    done, _ = wait(futures.values(), timeout=timeout)
+    executor.shutdown(wait=False)  # do not wait for clients that timed out
+
+    lights = []
+    for client in clients:
+        future = futures.get(client)
+        if future is None:
+            lights += client.get_cached_lights()
+        elif future in done and future.exception() is None:
+            lights += future.result()
+        elif future in done:
+            log.warning('%s discovery failed, using cache: %s', client.__name__, future.exception())
+            lights += client.get_cached_lights()
+        else:
+            log.warning('%s discovery timed out after %is, using cache', client.__name__, timeout)
+            lights += client.get_cached_lights()
+
+    return lights
+
+
+def _timed(client, function_name):
+    with metrics.discovery_duration.time(client.__name__, function_name):
+        return getattr(client, function_name)()
+
+
+class DiscoveryScheduler:
+    """Run discovery periodically in a background thread.
+
+    Every ``broadcast_every`` refresh is a discovery, other refreshes only poll
+    known lights.
+    """
+
+    def __init__(self, discovery, interval=DEFAULT_INTERVAL, polling=None, broadcast_every=DEFAULT_BROADCAST_EVERY):
+        """Create and initialize ``DiscoveryScheduler``.
+
+        :param discovery: ``Function`` without arguments that performs discovery
+        :param interval: ``Integer`` seconds between refreshes
+        :param polling: ``Function`` without arguments that polls known lights,
+                        returns ``[LightProtocol]``, or ``None`` to always discover
+        :param broadcast_every: ``Integer`` refreshes per discovery
+        """
+        self._discovery = discovery
+        self._polling = polling
+        self._broadcast_every = broadcast_every
+        self._interval = interval
+        self._lock = threading.Lock()  # only one discovery, or poll, at a time
+        self._discoveries = 0  # completed discoveries
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start background discovery, first discovery is done immediately."""
+        if self._thread is not None:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='prism-discovery', daemon=True)
+        self._thread.start()
+        log.debug('discovery scheduler started, interval=%is', self._interval)
+
+    def stop(self):
+        """Stop background discovery, an ongoing discovery will be completed."""
+        self._stopped.set()
+        self._thread = None
+
+    def refresh(self):
+        """Perform a synchronous discovery.
+
+        If a discovery is ongoing, wait for it to complete instead of starting
+        another one, i.e. concurrent callers share one discovery.
+        """
+        wanted = self._discoveries + 1
+
+        with self._lock:
+            if self._discoveries >= wanted:
+                return  # discovery completed while waiting, share it
+
+            try:
+                self._discovery()
+            finally:
+                self._discoveries += 1
+
+    def poll(self):
+        """Perform a synchronous poll of known lights, see ``refresh``.
+
+        :returns: ``Boolean`` if any light was known, i.e. polled
+        """
+        with self._lock:
+            return len(self._polling()) > 0
+
+    def _run(self):
+        cycle = 0
+        while not self._stopped.is_set():
+            try:
+                if self._polling is None or cycle % self._broadcast_every == 0 or not self.poll():
+                    self.refresh()  # discovery needed, or no lights known to poll
+            except Exception as err:  # pylint: disable=broad-except
+                log.warning('background discovery failed: %s', err)
+
+            cycle += 1
+            self._stopped.wait(self._interval)
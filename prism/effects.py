@@ -0,0 +1,362 @@
+"""Effects module, multi-step transitions run locally, across vendors.
+
+An effect is a sequence of keyframes, the state lights reach at an offset from
+the start of the effect, e.g. a sunrise ramp or breathing. Lights fade natively
+between keyframes: each keyframe is sent once, when the previous keyframe is
+reached, with the time until its offset as transition duration. Lights are only
+sent a state per keyframe, however smooth the effect looks. Keyframes further
+apart than the longest transition lights accept are reached in steps, through
+states part way between the keyframes.
+
+All running effects are driven by one timer thread. Lights due for the same
+keyframe are submitted in one call, but each light is set on its own rather
+than batched per protocol, so each light is acknowledged, rate limited and
+circuit broken on its own, see ``Prism.submit_state``. Device i/o runs on the
+executor, the timer thread never waits for lights.
+"""
+
+import logging as loggr
+import threading
+import time
+
+from .light import LightState
+
+log = loggr.getLogger('smrt')
+
+MAX_TRANSITION = 3600  # seconds, longest transition duration, see ``LightState``
+
+
+class Keyframe:
+    """State lights reach at offset from start of effect."""
+
+    __slots__ = ('offset', 'state')
+
+    def __init__(self, offset, state):
+        """Create and initialize ``Keyframe``.
+
+        :param offset: ``Integer`` seconds from start of effect
+        :param state: ``LightState`` state reached at offset
+        """
+        self.offset = offset
+        self.state = state
+
+    def json(self):
+        """Return json representation of keyframe, i.e. ``Dict``.
+
+        :returns: ``Dict`` json representation.
+        """
+        return {
+            'offset': self.offset,
+            'state': self.state.json()
+        }
+
+
+class Effect:
+    """Effect, keyframes ordered by offset, optionally repeated.
+
+    A repeated effect starts over at the offset of its last keyframe, i.e.
+    the last keyframe should be the state the first keyframe starts from.
+    """
+
+    def __init__(self, name, keyframes, repeat=False):
+        """Create and initialize ``Effect``, keyframes are compiled once into frames.
+
+        :param name: ``String`` unique effect name
+        :param keyframes: ``[Keyframe]`` ordered by offset
+        :param repeat: ``Boolean`` repeat until stopped
+        :raises ValueError: if there are no keyframes, or offsets are not ordered
+        """
+        offsets = [keyframe.offset for keyframe in keyframes]
+
+        if not offsets:
+            raise ValueError('effect "{}" has no keyframes'.format(name))
+        if offsets != sorted(offsets):
+            raise ValueError('effect "{}" keyframes must be ordered by offset'.format(name))
+        if repeat and offsets[-1] == 0:
+            raise ValueError('repeated effect "{}" must last longer than 0 seconds'.format(name))
+
+        self.name = name
+        self.keyframes = keyframes
+        self.repeat = repeat
+        self.period = offsets[-1]  # seconds, one run through all keyframes
+
+        # (seconds from start, state with transition), sent when previous frame is reached
+        self.frames = []
+        previous, previous_state = 0, None
+        for keyframe in keyframes:
+            gap = keyframe.offset - previous
+            steps = max(-(-gap // MAX_TRANSITION), 1)
+            sent = previous
+
+            for step in range(1, steps + 1):
+                if step == steps:
+                    state = LightState()
+                    state.update(keyframe.state)
+                else:
+                    state = _between(previous_state, keyframe.state, step / steps)
+
+                duration = gap * step // steps - gap * (step - 1) // steps
+                state.set(duration=duration)
+                self.frames.append((sent, state))
+                sent += duration
+
+            previous, previous_state = keyframe.offset, keyframe.state
+
+    def json(self):
+        """Return json representation of effect, i.e. ``Dict``.
+
+        :returns: ``Dict`` json representation.
+        """
+        return {
+            'name': self.name,
+            'repeat': self.repeat,
+            'keyframes': [keyframe.json() for keyframe in self.keyframes]
+        }
+
+    def __repr__(self):
+        """Return string representation.
+
+        :returns: ``String``
+        """
+        return '<Effect name="{}" keyframes={} repeat={}>'.format(self.name, len(self.keyframes), self.repeat)
+
+
+def _between(start, end, fraction):
+    """Create state part way from start to end, a step towards a keyframe.
+
+    Fields not in start are set to end at once, lights are only turned off when
+    end is reached.
+
+    :param start: ``LightState`` or ``None`` state of previous keyframe
+    :param end: ``LightState`` state of keyframe
+    :param fraction: ``Float`` 0-1 part of way to end
+    :returns: ``LightState``
+    """
+    def value(field):
+        target = getattr(end, field)()
+        origin = getattr(start, field)() if start is not None else None
+        if target is None or origin is None:
+            return target
+        if isinstance(target, list):
+            return [round(low + (high - low) * fraction) for low, high in zip(origin, target)]
+        return round(origin + (target - origin) * fraction)
+
+    return LightState(power=True if end.power() else None, brightness=value('brightness'),
+                      color=value('color'), kelvin=value('kelvin'))
+
+
+class Run:
+    """Effect running on lights."""
+
+    def __init__(self, effect, lights, started):
+        """Create and initialize ``Run``.
+
+        :param effect: ``Effect`` running effect
+        :param lights: ``[LightProtocol]`` lights effect runs on
+        :param started: ``Float`` monotonic time effect started
+        """
+        self.effect = effect
+        self.lights = lights
+        self._started = started
+        self._cycle = 0
+        self._frame = 0
+        self._sending = []  # futures of last frame sent, next frame waits for them
+
+    def due(self):
+        """Get when next frame is due.
+
+        :returns: ``Float`` monotonic time
+        """
+        return self._started + self._cycle * self.effect.period + self.effect.frames[self._frame][0]
+
+    def is_sending(self):
+        """Get if last frame is still being sent, frames are not queued behind slow lights.
+
+        :returns: ``Boolean`` sending
+        """
+        return any(not future.done() for future in self._sending)
+
+    def next_frame(self):
+        """Get state of next frame, and advance to the frame after.
+
+        :returns: (``LightState``, ``Boolean``) state, and if effect continues after frame
+        """
+        state = self.effect.frames[self._frame][1]
+
+        self._frame += 1
+        if self._frame == len(self.effect.frames):
+            self._frame = 0
+            self._cycle += 1
+
+        return state, self.effect.repeat or self._cycle == 0
+
+    def sent(self, futures):
+        """Record futures of frame being sent, see ``is_sending``.
+
+        :param futures: ``[Future]`` one per batch of lights
+        """
+        self._sending = futures
+
+    def json(self):
+        """Return json representation of run, i.e. ``Dict``.
+
+        :returns: ``Dict`` json representation.
+        """
+        return {
+            'name': self.effect.name,
+            'cycle': self._cycle,
+            'lights': [light.get_name() for light in self.lights]
+        }
+
+
+class EffectEngine:
+    """Run effects on lights, all effects from one timer thread.
+
+    A light runs one effect at a time, starting an effect on a light stops any
+    other effect on it.
+    """
+
+    def __init__(self, effects, get_light, submit_state):
+        """Create and initialize ``EffectEngine``.
+
+        :param effects: ``[Effect]`` all effects
+        :param get_light: ``Function`` light name to ``LightProtocol`` or ``None``
+        :param submit_state: ``Function`` lights and ``LightState`` to ``[([LightProtocol], Future)]``,
+                             sets state in background, see ``Prism.submit_state``
+        """
+        self._effects = {effect.name: effect for effect in effects}
+        self._get_light = get_light
+        self._submit_state = submit_state
+        self._condition = threading.Condition()
+        self._runs = {}  # effect name to ``Run``
+        self._thread = None  # timer thread, only while effects run
+
+    @classmethod
+    def from_configuration(cls, configuration, get_light, submit_state):
+        """Create ``EffectEngine`` from configured effects, states are validated once.
+
+        Effects that are not valid are left out, and logged.
+
+        :param configuration: ``[Dict]`` configured effects, see configuration schema
+        :param get_light: ``Function`` light name to ``LightProtocol`` or ``None``
+        :param submit_state: ``Function`` see ``EffectEngine``
+        :returns: ``EffectEngine``
+        """
+        effects = []
+        for effect in configuration:
+            try:
+                effects.append(Effect(effect['name'],
+                                      [Keyframe(keyframe['offset'], LightState(**keyframe['state']))
+                                       for keyframe in effect['keyframes']],
+                                      repeat=effect.get('repeat', False)))
+            except (TypeError, ValueError) as err:
+                log.warning('effect "%s" is not valid, ignored: %s', effect['name'], err)
+
+        return cls(effects, get_light, submit_state)
+
+    def get_effects(self):
+        """Get all effects.
+
+        :returns: ``[Effect]``
+        """
+        return list(self._effects.values())
+
+    def get_runs(self):
+        """Get running effects.
+
+        :returns: ``[Run]``
+        """
+        with self._condition:
+            return list(self._runs.values())
+
+    def start(self, name, light_names):
+        """Start effect on lights, restarts effect if it is already running.
+
+        :param name: ``String`` effect name
+        :param light_names: ``[String]`` lights to run effect on, lights not found are omitted
+        :returns: ``Run`` or ``None`` if there is no such effect
+        """
+        effect = self._effects.get(name)
+
+        if effect is None:
+            return None
+
+        lights = [light for light in (self._get_light(light_name) for light_name in light_names) if light is not None]
+        run = Run(effect, lights, time.monotonic())
+
+        with self._condition:
+            self._runs.pop(name, None)
+            for other in list(self._runs.values()):
+                other.lights = [light for light in other.lights if light not in lights]
+                if not other.lights:
+                    del self._runs[other.effect.name]
+
+            if lights:
+                self._runs[name] = run
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name='prism-effects', daemon=True)
+                    self._thread.start()
+
+            self._condition.notify()
+
+        log.debug('started effect "%s" on %i lights', name, len(lights))
+        return run
+
+    def stop(self, name):
+        """Stop running effect, lights keep their current state.
+
+        :param name: ``String`` effect name
+        :returns: ``Run`` or ``None`` if effect is not running
+        """
+        with self._condition:
+            run = self._runs.pop(name, None)
+            self._condition.notify()
+
+        return run
+
+    def _loop(self):
+        """Timer loop, sends due frames until no effects are running."""
+        with self._condition:
+            while self._runs:
+                waiting = [run.due() for run in self._runs.values() if not run.is_sending()]
+
+                if not waiting:
+                    self._condition.wait()  # woken when a frame has been sent
+                    continue
+
+                delay = min(waiting) - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                self._tick(time.monotonic())
+
+            self._thread = None
+
+    def _tick(self, now):
+        """Send due frames, lights due for the same frame are submitted in one call, ``_condition`` must be held."""
+        frames = {}  # id of frame state to (state, lights, runs)
+
+        for run in list(self._runs.values()):
+            if run.is_sending() or run.due() > now:
+                continue
+
+            state, continues = run.next_frame()
+            _, lights, runs = frames.setdefault(id(state), (state, [], []))
+            lights.extend(run.lights)
+            runs.append(run)
+
+            if not continues:
+                del self._runs[run.effect.name]
+
+        for state, lights, runs in frames.values():
+            futures = [future for _, future in self._submit_state(lights, state)]
+            for future in futures:
+                future.add_done_callback(self._sent)
+            for run in runs:
+                run.sent(futures)
+
+    def _sent(self, _):
+        """Wake timer loop, a run may be waiting for its frame to be sent."""
+        with self._condition:
+            self._condition.notify()
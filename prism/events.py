@@ -0,0 +1,117 @@
+"""Events module, in-process publish/subscribe of light changes.
+
+Light changes are published once on ``bus`` and fanned out to every
+subscriber, e.g. server-sent event streams. Events are serialized once when
+published, regardless of number of subscribers.
+"""
+
+import logging as loggr
+import queue
+import threading
+
+log = loggr.getLogger('smrt')
+
+DEFAULT_MAX_QUEUED = 1000  # events queued per subscriber before it is dropped
+
+LIGHT_APPEARED = 'light.appeared'
+LIGHT_CHANGED = 'light.changed'
+LIGHT_STALE = 'light.stale'
+LIGHT_REMOVED = 'light.removed'
+
+
+class Subscription:
+    """Subscription to ``EventBus``, events are read with ``get``."""
+
+    def __init__(self, max_queued=DEFAULT_MAX_QUEUED):
+        """Create and initialize ``Subscription``.
+
+        :param max_queued: ``Integer`` maximum number of unread events
+        """
+        self._queue = queue.Queue(maxsize=max_queued)
+        self.closed = False
+
+    def put(self, event):
+        """Queue event, subscription is closed if subscriber can not keep up.
+
+        :param event: ``Bytes`` serialized event
+        """
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.close()
+
+    def get(self, timeout=None):
+        """Get next event.
+
+        :param timeout: ``Integer`` seconds to wait for event
+        :returns: ``Bytes`` serialized event, or ``None`` if no event or subscription closed
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Close subscription, subscriber will be woken up."""
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass  # subscriber will find closed when queue is read
+
+
+class EventBus:
+    """Publish events to all subscribers."""
+
+    def __init__(self):
+        """Create and initialize ``EventBus``."""
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def has_subscribers(self):
+        """Get if there are any subscribers, publishing can be skipped if not.
+
+        :returns: ``Boolean``
+        """
+        return len(self._subscriptions) > 0
+
+    def subscribe(self, max_queued=DEFAULT_MAX_QUEUED):
+        """Subscribe to all events.
+
+        :param max_queued: ``Integer`` maximum number of unread events
+        :returns: ``Subscription``
+        """
+        subscription = Subscription(max_queued=max_queued)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Unsubscribe, and close, subscription.
+
+        :param subscription: ``Subscription``
+        """
+        with self._lock:
+            self._subscriptions.discard(subscription)
+        subscription.close()
+
+    def publish(self, event, version, data):
+        """Publish event as server-sent event to all subscribers.
+
+        :param event: ``String`` event type, e.g. ``LIGHT_CHANGED``
+        :param version: ``Integer`` state version, see ``state_version``
+        :param data: ``Bytes`` serialized json event data
+        """
+        serialized = b'id: %d\nevent: %s\ndata: %s\n\n' % (version, event.encode(), data)
+
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+
+        for subscription in subscriptions:
+            subscription.put(serialized)
+            if subscription.closed:
+                log.debug('dropping event subscriber, too many unread events')
+                self.unsubscribe(subscription)
+
+
+bus = EventBus()
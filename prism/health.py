@@ -0,0 +1,189 @@
+"""Health module, protects prism from unhealthy and rate limited devices.
+
+A device that is offline, or flaky, blocks every state change until protocol
+timeouts expire. ``CircuitBreaker`` tracks consecutive failures per device,
+after too many failures state changes fail fast for a cooldown period, while
+the device is probed in the background.
+
+Vendors limit how many commands a device accepts, ``TokenBucket`` keeps
+commands sent to each device within the vendor limit.
+"""
+
+import logging as loggr
+import threading
+import time
+
+from . import metrics
+
+log = loggr.getLogger('smrt')
+
+DEFAULT_FAILURE_THRESHOLD = 3  # consecutive failures before circuit opens
+DEFAULT_COOLDOWN = 30  # seconds circuit stays open before device is probed
+MAX_COOLDOWN = 300  # seconds, cooldown doubles every failed probe
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class DeviceUnavailableError(Exception):
+    """Device was not attempted, its circuit is open."""
+
+    def __init__(self, device, retry_after):
+        """Create and initialize ``DeviceUnavailableError``.
+
+        :param device: device that is unavailable
+        :param retry_after: ``Integer`` seconds until device is attempted again
+        """
+        Exception.__init__(self, '{} is unavailable, retry after {}s'.format(device, retry_after))
+        self.device = device
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker for one device.
+
+    Circuit is closed while device is healthy. After ``threshold`` consecutive
+    failures the circuit opens and ``check`` fails fast. When the cooldown has
+    passed, the circuit is half-open, and the next attempt, or a successful
+    background probe, decides if it closes or opens again.
+    """
+
+    def __init__(self, device, probe, threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        """Create and initialize ``CircuitBreaker``.
+
+        :param device: device protected by circuit, used in errors and logs
+        :param probe: ``Function`` without arguments, raises, or returns ``False``, if device is unreachable
+        :param threshold: ``Integer`` consecutive failures before circuit opens
+        :param cooldown: ``Integer`` seconds circuit stays open before device is probed
+        """
+        self._device = device
+        self._probe = probe
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_cooldown = cooldown  # current cooldown, grows while device stays unreachable
+        self._open_until = None  # monotonic time, ``None`` while closed
+        self._probing = False
+
+    def state(self):
+        """Get circuit state.
+
+        :returns: ``String`` ``CLOSED``, ``OPEN`` or ``HALF_OPEN``
+        """
+        open_until = self._open_until
+
+        if open_until is None:
+            return CLOSED
+        return OPEN if open_until > time.monotonic() else HALF_OPEN
+
+    def check(self):
+        """Fail fast if circuit is open.
+
+        :raises DeviceUnavailableError: if circuit is open
+        """
+        open_until = self._open_until
+
+        if open_until is not None and open_until > time.monotonic():
+            raise DeviceUnavailableError(self._device, int(open_until - time.monotonic()) + 1)
+
+    def record(self, successful):
+        """Record result of an attempt.
+
+        :param successful: ``Boolean`` attempt successful
+        """
+        with self._lock:
+            self._record(successful)
+
+    def _record(self, successful):
+        """Record result of an attempt, or probe, ``_lock`` must be held."""
+        if successful:
+            self._close()
+        else:
+            self._failures += 1
+            if self._open_until is not None or self._failures >= self._threshold:
+                self._open()
+
+    def _close(self):
+        """Close circuit, ``_lock`` must be held."""
+        if self._open_until is not None:
+            log.info('%s is reachable, circuit closed', self._device)
+            metrics.circuit_total.inc(CLOSED)
+
+        self._failures = 0
+        self._open_cooldown = self._cooldown
+        self._open_until = None
+
+    def _open(self):
+        """Open circuit, or keep it open with longer cooldown, ``_lock`` must be held."""
+        if self._open_until is None:
+            log.warning('%s failed %i times, circuit open for %is', self._device, self._failures, self._cooldown)
+            metrics.circuit_total.inc(OPEN)
+        else:
+            self._open_cooldown = min(self._open_cooldown * 2, MAX_COOLDOWN)
+
+        self._open_until = time.monotonic() + self._open_cooldown
+
+        if not self._probing:
+            self._probing = True
+            timer = threading.Timer(self._open_cooldown, self._run_probe)
+            timer.daemon = True
+            timer.start()
+
+    def _run_probe(self):
+        """Probe device in background, probing continues until circuit is closed."""
+        try:
+            successful = self._probe() is not False
+        except Exception as err:  # pylint: disable=broad-except
+            log.debug('probe for %s failed: %s', self._device, err)
+            successful = False
+
+        with self._lock:
+            self._probing = False
+
+            if self._open_until is None:
+                return  # closed by a successful attempt while probing
+
+            self._record(successful)
+
+
+class TokenBucket:
+    """Token bucket, limits rate while allowing bursts.
+
+    Not thread safe, callers synchronize.
+    """
+
+    def __init__(self, rate, capacity):
+        """Create and initialize ``TokenBucket``, bucket starts full.
+
+        :param rate: ``Float`` tokens added per second
+        :param capacity: ``Integer`` maximum tokens, i.e. burst size
+        """
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def delay(self, tokens):
+        """Get seconds until tokens are available.
+
+        :param tokens: ``Integer`` tokens needed, more than capacity waits for a full bucket
+        :returns: ``Float`` seconds, 0 if available now
+        """
+        self._refill()
+        missing = min(tokens, self._capacity) - self._tokens
+        return missing / self._rate if missing > 0 else 0
+
+    def consume(self, tokens):
+        """Take tokens, see ``delay`` for when tokens are available.
+
+        :param tokens: ``Integer`` tokens to take
+        """
+        self._refill()
+        self._tokens = max(self._tokens - tokens, 0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated) * self._rate, self._capacity)
+        self._updated = now
@@ -3,6 +3,7 @@
 Implements Lifx protocol for prism.
 """
 
-from .lifx import get_lights, get_light
+from .lifx import evict_lights, get_lights, get_light, get_cached_lights, refresh_lights, restore_lights, LifxLight
 
-__all__ = ['get_light', 'get_lights']
+__all__ = ['LifxLight', 'evict_lights', 'get_cached_lights', 'get_light', 'get_lights', 'refresh_lights',
+           'restore_lights']
@@ -0,0 +1,388 @@
+"""Asyncio Lifx vendor/protocol implementation.
+
+Talks Lifx LAN protocol directly over one shared UDP endpoint, see ``packets``,
+so any number of concurrent device requests are handled on one event loop.
+Implements the same protocol client functions as ``lifx``, blocking functions
+run on the event loop, see ``prism.aio.run``.
+"""
+
+import asyncio
+import logging
+import random
+
+from prism import aio
+from prism.light import LightState
+from prism.registry import LightIndex
+from . import packets
+from .lifx import _command_count, _depends_on_state, _to_light_states, _to_lifx_duration, _to_lifx_hsbk
+
+_cache = LightIndex()  # keyed by mac address
+
+DISCOVERY_TIMEOUT = 2  # seconds to wait for devices to respond to discovery
+REQUEST_TIMEOUT = 0.5  # seconds to wait for device response, per attempt
+REQUEST_ATTEMPTS = 3
+
+_broadcast_address = ('255.255.255.255', packets.PORT)
+_endpoint = None  # task creating ``_LifxEndpoint``, see ``_get_endpoint``
+
+log = logging.getLogger('smrt')
+
+
+def configure(broadcast_address='255.255.255.255', port=packets.PORT):
+    """Configure where discovery is broadcast.
+
+    :param broadcast_address: ``String`` broadcast address
+    :param port: ``Integer`` port devices listen to
+    """
+    global _broadcast_address  # pylint: disable=global-statement
+    _broadcast_address = (broadcast_address, port)
+
+
+def get_lights():
+    """Discover lights on Local Area Network.
+
+    :returns: ``[LightProtocol]``
+    """
+    return aio.run(discover(), timeout=DISCOVERY_TIMEOUT + aio.DEFAULT_TIMEOUT)
+
+
+def refresh_lights():
+    """Refresh known lights with direct requests to each light, without discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    return aio.run(refresh())
+
+
+def get_cached_lights():
+    """Get lights from cache, without doing discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    return _cache.values()
+
+
+def evict_lights(ids):
+    """Remove lights from cache, e.g. lights not seen for a long time.
+
+    :param ids: ``[String]`` hardware ids of lights to remove
+    """
+    for light_id in ids:
+        _cache.pop(light_id)
+
+
+def get_light(name):
+    """Discover single light identified by name.
+
+    :returns: ``LightProtocol`` or ``None``
+    """
+    if _cache.find(name) is None:
+        get_lights()  # do nothing with response
+
+    return _cache.find(name)
+
+
+def restore_lights(snapshots):
+    """Restore lights from snapshots, restored lights are stale until discovered.
+
+    Snapshots for other protocols are ignored, already known lights are renamed if renamed in snapshot.
+
+    :param snapshots: ``[Dict]`` see ``LightProtocol.snapshot``
+    :returns: ``[LightProtocol]`` restored lights
+    """
+    restored = []
+
+    for snapshot in snapshots:
+        if snapshot['protocol'] != AsyncLifxLight.protocol():
+            continue
+
+        if snapshot['id'] in _cache:
+            _cache.rename(_cache.get(snapshot['id']), snapshot['name'])
+            continue
+
+        try:
+            address = snapshot['address']
+            light = AsyncLifxLight(
+                snapshot['name'],
+                address['mac'],
+                (address['ip'], address.get('port', packets.PORT)),
+                state=LightState(**snapshot['state']))
+        except (KeyError, TypeError) as err:
+            log.warning('could not restore lifx light "%s": %s', snapshot['name'], err)
+            continue
+
+        light.mark_restored(snapshot['last_seen'])
+        _cache.add(light)
+        restored.append(light)
+
+    return restored
+
+
+async def discover(timeout=DISCOVERY_TIMEOUT):
+    """Discover lights on Local Area Network, and read their state.
+
+    :param timeout: ``Integer`` seconds to wait for devices to respond
+    :returns: ``[LightProtocol]``
+    """
+    endpoint = await _get_endpoint()
+    devices = await endpoint.discover(_broadcast_address, timeout)
+
+    names = await _refresh(devices)
+    log.debug('discovered %i lifx lights: %s', len(devices), ','.join(names))
+
+    return _cache.values()
+
+
+async def refresh():
+    """Read state of known lights concurrently, without discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    devices = {light.get_mac(): light.get_device_address() for light in _cache.values()}
+
+    names = await _refresh(devices)
+    log.debug('refreshed %i of %i known lifx lights', len(names), len(devices))
+
+    return _cache.values()
+
+
+async def _refresh(devices):
+    """Read state from devices concurrently and update cache.
+
+    :param devices: ``{String: (String, Integer)}`` mac address to device address
+    :returns: ``[String]`` names of lights that responded
+    """
+    endpoint = await _get_endpoint()
+    macs = list(devices.keys())
+    responses = await asyncio.gather(
+        *[endpoint.request(devices[mac], mac, packets.LIGHT_GET, response_type=packets.LIGHT_STATE) for mac in macs],
+        return_exceptions=True)
+
+    polled = []
+    for mac, response in zip(macs, responses):
+        if isinstance(response, Exception):
+            log.warning('could not get state for lifx light %s', mac)
+            continue
+
+        polled.append((mac, packets.parse_light_state(response.payload)))
+
+    # colors for all lights converted at once
+    states = _to_light_states([light_state.color for _, light_state in polled],
+                              [light_state.power for _, light_state in polled])
+
+    names = []
+    for (mac, light_state), state in zip(polled, states):
+        name = light_state.label or mac  # unnamed lights by mac
+        names.append(name)
+        light = _cache.get(mac)
+
+        if light is None:
+            _cache.add(AsyncLifxLight(name, mac, devices[mac], state=state))
+        else:
+            _cache.rename(light, name)
+            light.update_state(state)
+
+    return names
+
+
+async def _get_endpoint():
+    global _endpoint  # pylint: disable=global-statement
+
+    if _endpoint is None:  # created once, concurrent callers await same task
+        _endpoint = asyncio.ensure_future(_create_endpoint())
+
+    return await _endpoint
+
+
+async def _create_endpoint():
+    _, endpoint = await asyncio.get_running_loop().create_datagram_endpoint(
+        _LifxEndpoint, local_addr=('0.0.0.0', 0), allow_broadcast=True)
+    return endpoint
+
+
+class _LifxEndpoint(asyncio.DatagramProtocol):
+    """UDP endpoint shared by all devices, responses are matched by device and sequence."""
+
+    def __init__(self):
+        self._transport = None
+        self._source = random.randint(2, 0xFFFFFFFF)  # identifies responses meant for us
+        self._sequence = 0
+        self._pending = {}
+        self._discovered = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data, addr):
+        packet = packets.unpack(data)
+
+        if packet is None or packet.source != self._source:
+            return
+
+        if packet.type == packets.STATE_SERVICE:
+            if self._discovered is not None:
+                _, port = packets.parse_state_service(packet.payload)
+                self._discovered[packet.target] = (addr[0], port)
+            return
+
+        pending = self._pending.get((packet.target, packet.sequence))
+        if pending is not None:
+            future, response_type = pending
+            if packet.type == response_type and not future.done():
+                future.set_result(packet)
+
+    async def discover(self, broadcast_address, timeout):
+        """Broadcast discovery, and collect responding devices.
+
+        :returns: ``{String: (String, Integer)}`` mac address to device address
+        """
+        self._discovered = {}
+        self._transport.sendto(packets.pack(packets.GET_SERVICE, source=self._source), broadcast_address)
+        await asyncio.sleep(timeout)
+
+        discovered, self._discovered = self._discovered, None
+        return discovered
+
+    async def request(self, address, mac, message_type, payload=b'', response_type=packets.ACKNOWLEDGEMENT):
+        """Send request to device and wait for response, request is retried if no response.
+
+        :param address: (``String``, ``Integer``) device address
+        :param mac: ``String`` device mac address
+        :param message_type: ``Integer`` message type
+        :param payload: ``Bytes`` encoded payload
+        :param response_type: ``Integer`` expected response, ``ACKNOWLEDGEMENT`` for ack
+        :returns: ``Packet`` response
+        :raises asyncio.TimeoutError: if device did not respond
+        """
+        acknowledge = response_type == packets.ACKNOWLEDGEMENT
+        packet = packets.pack(message_type, payload, target=mac, ack_required=acknowledge, res_required=not acknowledge)
+        return await self.send(address, mac, packet, response_type)
+
+    async def send(self, address, mac, packet, response_type=packets.ACKNOWLEDGEMENT):
+        """Send encoded packet to device and wait for response, see ``request``.
+
+        :param packet: ``Bytes`` packet, source and sequence are set when sent, see ``packets.stamp``
+        """
+        for _ in range(REQUEST_ATTEMPTS):
+            self._sequence = (self._sequence + 1) % 256
+            key = (mac, self._sequence)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = (future, response_type)
+
+            self._transport.sendto(packets.stamp(packet, self._source, self._sequence), address)
+
+            try:
+                return await asyncio.wait_for(future, REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self._pending.pop(key, None)
+
+        raise asyncio.TimeoutError('lifx light {} did not respond'.format(mac))
+
+
+class AsyncLifxLight(aio.AsyncLightProtocol):
+    """Asyncio Lifx implementation for LightProtocol."""
+
+    # see ``LifxLight``
+    _command_rate = 20
+    _command_burst = 20
+
+    def __init__(self, name, mac, address, state=None):
+        """Create and inialize AsyncLifxLight.
+
+        :param name: name of light, should be unique
+        :param mac: ``String`` mac address
+        :param address: (``String``, ``Integer``) ip address and port
+        """
+        aio.AsyncLightProtocol.__init__(self, state=state)
+        self._name = name
+        self._mac = mac
+        self._device_address = address
+
+    @staticmethod
+    def protocol():
+        """See ``LightProtocol.protocol`` documentation."""
+        return 'Lifx.v1'
+
+    def get_name(self):
+        """See ``LightProtocol.get_name`` documentation."""
+        return self._name
+
+    def get_id(self):
+        """See ``LightProtocol.get_id`` documentation, mac address."""
+        return self._mac
+
+    def get_mac(self):
+        """Get mac address.
+
+        :returns: ``String`` mac address
+        """
+        return self._mac
+
+    def get_device_address(self):
+        """Get device address.
+
+        :returns: (``String``, ``Integer``) ip address and port
+        """
+        return self._device_address
+
+    def _address(self):
+        """See ``LightProtocol._address`` documentation."""
+        return {
+            'mac': self._mac,
+            'ip': self._device_address[0],
+            'port': self._device_address[1]
+        }
+
+    def _command_count(self, state):
+        """See ``LightProtocol._command_count`` documentation."""
+        return _command_count(state)
+
+    def _depends_on_state(self, state):
+        """See ``LightProtocol._depends_on_state`` documentation."""
+        return _depends_on_state(state)
+
+    async def _get_state_async(self):
+        """See ``AsyncLightProtocol.get_state_async`` documentation."""
+        endpoint = await _get_endpoint()
+        response = await endpoint.request(
+            self._device_address, self._mac, packets.LIGHT_GET, response_type=packets.LIGHT_STATE)
+
+        light_state = packets.parse_light_state(response.payload)
+        return _to_light_states([light_state.color], [light_state.power])[0]
+
+    def _compile(self, state):
+        """See ``LightProtocol.compile_state`` documentation."""
+        compiled = []
+        duration = _to_lifx_duration(state.duration())
+
+        color = _to_lifx_hsbk(state, self.get_state())
+        if color is not None:
+            compiled.append(packets.pack(
+                packets.LIGHT_SET_COLOR, packets.set_color(color, duration), target=self._mac, ack_required=True))
+
+        # power should always be last, to avoid flicker/transient effects
+        if state.power() is not None:
+            compiled.append(packets.pack(
+                packets.LIGHT_SET_POWER, packets.set_power(state.power(), 0), target=self._mac, ack_required=True))
+
+        return compiled
+
+    async def _apply_async(self, commands):
+        """See ``AsyncLightProtocol.apply_plan`` documentation."""
+        endpoint = await _get_endpoint()
+
+        try:
+            for packet in commands:
+                await endpoint.send(self._device_address, self._mac, packet)
+        except asyncio.TimeoutError as err:
+            log.warning('could not set state for lifx light %s: %s', self._name, err)
+            return False
+
+        return True
+
+    async def _set_state_async(self, state):
+        """See ``AsyncLightProtocol.set_state_async`` documentation."""
+        return await self._apply_async(self._compile(state))
+
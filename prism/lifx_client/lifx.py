@@ -3,16 +3,27 @@
 Uses third party library LifxLAN, see https://github.com/mclarkk/lifxlan
 """
 
-import colorsys
+from concurrent.futures import ThreadPoolExecutor, wait
 import logging
-from threading import Timer
+import threading
 
-from lifxlan import LifxLAN
+from lifxlan import LifxLAN, Light, LightGet
+from lifxlan import LightState as LightStateMessage
 
+from prism.color import clamp_kelvin, hsbk_to_rgb, rgb_to_hsbk, to_percent
 from prism.light import LightProtocol, LightState
+from prism.registry import LightIndex
 
 _lifxlan = LifxLAN()
-_cache = {}
+_cache = LightIndex()  # keyed by mac address
+
+# bounded pool used to poll device state, one device per worker
+_MAX_WORKERS = 16
+_POLL_TIMEOUT = 1  # seconds, per attempt
+_POLL_ATTEMPTS = 3  # a device is given up after _POLL_TIMEOUT * _POLL_ATTEMPTS
+_executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix='prism-lifx')
+_polling = {}  # mac address to future of poll in progress, a device is polled once at a time
+_polling_lock = threading.Lock()
 
 log = logging.getLogger('smrt')
 
@@ -28,37 +39,140 @@ def get_lights():
         raw_lights = _lifxlan.get_devices()  # get devices
     except OSError as err:
         log.warning('could not get lifx lights: %s', err)
-        return []
-
-    log.debug('discovered %i lifx lights: %s', len(raw_lights), ','.join([l.get_label() for l in raw_lights]))
-
-    for raw_light in raw_lights:
-        name = raw_light.get_label()
-
-        # create state
-        hue, saturation, brightness, kelvin = raw_light.get_color()
-        rgb_color = colorsys.hsv_to_rgb(
-            hue / 65535,
-            saturation / 65535,
-            brightness / 65535)
-
-        state = LightState(
-            power=raw_light.get_power() != 0,
-            color=[
-                int(rgb_color[0] * 255),
-                int(rgb_color[1] * 255),
-                int(rgb_color[2] * 255)
-            ],
-            kelvin=kelvin,
-            brightness=int(brightness * 100 / 65523)
-        )
-
-        if name not in _cache:
-            _cache[name] = LifxLight(name, raw_light, state=state)
+        return _cache.values()
+
+    names = _refresh(raw_lights)
+    log.debug('discovered %i lifx lights: %s', len(raw_lights), ','.join(names))
+
+    return _cache.values()
+
+
+def refresh_lights():
+    """Refresh known lights with direct requests to each light, without discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    raw_lights = [light._client for light in _cache.values()]  # pylint: disable=protected-access
+
+    names = _refresh(raw_lights)
+    log.debug('refreshed %i of %i known lifx lights', len(names), len(raw_lights))
+
+    return _cache.values()
+
+
+def _refresh(raw_lights):
+    """Poll state from devices and update cache.
+
+    :param raw_lights: ``[Light]`` lifxlan lights to poll
+    :returns: ``[String]`` names of lights that responded
+    """
+    # poll all devices concurrently, a full refresh takes as long as the slowest device
+    futures = {}
+    with _polling_lock:
+        for raw_light in raw_lights:
+            mac = raw_light.get_mac_addr()
+            if mac in _polling and not _polling[mac].done():
+                log.debug('lifx light %s is still being polled, skipped', mac)
+                continue
+
+            _polling[mac] = future = _executor.submit(_poll, raw_light)
+            futures[future] = raw_light
+
+        for mac in [mac for mac, future in _polling.items() if future.done()]:
+            del _polling[mac]
+
+    # every poll is bounded by itself, waiting is a safeguard should lifxlan overrun its timeout
+    done, _ = wait(futures, timeout=_POLL_TIMEOUT * _POLL_ATTEMPTS * (2 + len(futures) // _MAX_WORKERS))
+
+    polled = []
+    for future, raw_light in futures.items():
+        if future not in done or future.exception() is not None:
+            log.warning('could not get state for lifx light %s', raw_light.get_mac_addr())
+            continue
+
+        polled.append((raw_light,) + future.result())
+
+    # colors for all lights converted at once
+    states = _to_light_states([color for _, _, color, _ in polled], [power for _, _, _, power in polled])
+
+    names = []
+    for (raw_light, name, _, _), state in zip(polled, states):
+        names.append(name)
+        light = _cache.get(raw_light.get_mac_addr())
+
+        if light is None:
+            _cache.add(LifxLight(name, raw_light, state=state))
         else:
-            _cache[name].update_state(state)
+            _cache.rename(light, name)
+            light.update_state(state)
+
+    return names
+
+
+def _poll(raw_light):
+    """Get label, color and power from device, in one request.
+
+    :param raw_light: lifxlan ``Light``
+    :returns: (``String``, ``[Integer]``, ``Boolean``) name, hsbk color and power
+    """
+    # light state response carries label and power too, same request as ``get_color`` with bounded retries
+    response = raw_light.req_with_resp(LightGet, LightStateMessage,
+                                       timeout_secs=_POLL_TIMEOUT, max_attempts=_POLL_ATTEMPTS)
+    raw_light.color, raw_light.power_level, raw_light.label = response.color, response.power_level, response.label
+
+    return raw_light.label or raw_light.get_mac_addr(), raw_light.color, raw_light.power_level != 0  # by mac if unnamed
 
-    return list(_cache.values())
+
+def get_cached_lights():
+    """Get lights from cache, without doing discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    return _cache.values()
+
+
+def evict_lights(ids):
+    """Remove lights from cache, e.g. lights not seen for a long time.
+
+    :param ids: ``[String]`` hardware ids of lights to remove
+    """
+    for light_id in ids:
+        _cache.pop(light_id)
+
+
+def restore_lights(snapshots):
+    """Restore lights from snapshots, restored lights are stale until discovered.
+
+    Snapshots for other protocols are ignored, already known lights are renamed if renamed in snapshot.
+
+    :param snapshots: ``[Dict]`` see ``LightProtocol.snapshot``
+    :returns: ``[LightProtocol]`` restored lights
+    """
+    restored = []
+
+    for snapshot in snapshots:
+        if snapshot['protocol'] != LifxLight.protocol():
+            continue
+
+        if snapshot['id'] in _cache:
+            _cache.rename(_cache.get(snapshot['id']), snapshot['name'])
+            continue
+
+        try:
+            address = snapshot['address']
+            light = LifxLight(
+                snapshot['name'],
+                Light(address['mac'], address['ip']),
+                state=LightState(**snapshot['state']))
+        except (KeyError, TypeError) as err:
+            log.warning('could not restore lifx light "%s": %s', snapshot['name'], err)
+            continue
+
+        light.mark_restored(snapshot['last_seen'])
+        _cache.add(light)
+        restored.append(light)
+
+    return restored
 
 
 def get_light(name):
@@ -66,13 +180,10 @@ def get_light(name):
 
     :returns: ``LightProtocol`` or ``None``
     """
-    if name not in _cache:
+    if _cache.find(name) is None:
         get_lights()  # do nothing with response
 
-    if name in _cache:
-        return _cache[name]
-    else:
-        return None
+    return _cache.find(name)
 
 
 class LifxLight(LightProtocol):
@@ -80,6 +191,10 @@ class LifxLight(LightProtocol):
 
     _client = None
 
+    # lifx recommends at most 20 messages per second to a device
+    _command_rate = 20
+    _command_burst = 20
+
     def __init__(self, name, client, state=None):
         """Create and inialize LiftLight.
 
@@ -99,6 +214,17 @@ class LifxLight(LightProtocol):
         """See ``LightProtocol.get_name`` documentation."""
         return self._name
 
+    def get_id(self):
+        """See ``LightProtocol.get_id`` documentation, mac address."""
+        return self._client.get_mac_addr()
+
+    def _address(self):
+        """See ``LightProtocol._address`` documentation."""
+        return {
+            'mac': self._client.get_mac_addr(),
+            'ip': self._client.get_ip_addr()
+        }
+
     def is_on(self):
         """Get if light in on or off.
 
@@ -106,26 +232,130 @@ class LifxLight(LightProtocol):
         """
         return self._client.get_power()
 
+    def _read_state(self):
+        """See ``LightProtocol.get_state`` documentation."""
+        _, color, power = _poll(self._client)
+        return _to_light_states([color], [power])[0]
+
     def _set_state(self, state):
         """See ``LightProtocol.set_state`` documentation."""
-        duration = _to_lifx_duration(state.duration())
+        return _apply_state(self._client, state, self.get_state())
+
+    def _compile(self, state):
+        """See ``LightProtocol.compile_state`` documentation."""
+        return _to_calls(state, self.get_state())
+
+    def _apply(self, commands):
+        """See ``LightProtocol.apply_plan`` documentation."""
+        return _call(self._client, commands)
+
+    def _probe(self):
+        """See ``LightProtocol._probe`` documentation."""
+        self._client.get_power()  # raises if light does not respond
+        return True
+
+    def _command_count(self, state):
+        """See ``LightProtocol._command_count`` documentation."""
+        return _command_count(state)
+
+    def _depends_on_state(self, state):
+        """See ``LightProtocol._depends_on_state`` documentation."""
+        return _depends_on_state(state)
+
+
+def _apply_state(target, state, last_state):
+    """Apply state to lifxlan ``Light``.
+
+    :returns: ``Boolean`` successful
+    """
+    return _call(target, _to_calls(state, last_state))
+
+
+def _to_calls(state, last_state):
+    """Create lifxlan calls for state, in the order they should be made, see ``_to_lifx_hsbk``.
+
+    :returns: ``[(String, Tuple)]`` function name and arguments
+    """
+    calls = []
 
-        color = state.color()
-        kelvin = state.kelvin()
-        brightness = state.brightness()  # can be None
+    color = _to_lifx_hsbk(state, last_state)
+    if color is not None:
+        calls.append(('set_color', (color, _to_lifx_duration(state.duration()), False)))
 
-        if color is not None:
-            self._client.set_color(_to_lifx_color(color, kelvin, color_brightness=brightness), duration, False)
-        elif kelvin is not None:  # only set kelvin if no color is to be set
-            self._client.set_colortemp(kelvin, duration, False)
+    power = state.power()
 
-        power = state.power()
+    # power should always be last, to avoid flicker/transient effects
+    if power is not None:
+        calls.append(('set_power', (power, 0, False)))  # acknowledged, like color
 
-        # power should always be last, to avoid flicker/transient effects
-        if power is not None:
-            self._client.set_power(power, 0, True)
+    return calls
+
+
+def _to_lifx_hsbk(state, last_state):
+    """Get lifx hsbk color to set for state, ``None`` if color should not change.
+
+    Kelvin without color is white at kelvin. Brightness without color, or
+    kelvin, changes brightness of last known color. Both depend on last known
+    state, see ``_depends_on_state``.
+
+    :param state: ``LightState`` state to set
+    :param last_state: ``LightState`` last known state of light
+    :returns: ``[Integer, Integer, Integer, Integer]`` hue, saturation, brightness and kelvin, or ``None``
+    """
+    color, kelvin, brightness = state.color(), state.kelvin(), state.brightness()
 
-        return True  # assume action was successful, lifxlan does not say yay or nay
+    if color is not None:
+        return _to_lifx_color(color, kelvin, color_brightness=brightness)
+
+    if kelvin is not None:
+        brightness = brightness if brightness is not None else last_state.brightness()
+        return [0, 0, _to_lifx_brightness(brightness if brightness is not None else 100), kelvin]
+
+    if brightness is not None and last_state.color() is not None:
+        return _to_lifx_color(last_state.color(), last_state.kelvin(), color_brightness=brightness)
+
+    if brightness is not None:
+        log.debug('brightness not set, color of light is not known')
+
+    return None
+
+
+def _call(target, calls):
+    """Make lifxlan calls on ``Light``, see ``_to_calls``.
+
+    :returns: ``Boolean`` successful
+    :raises WorkflowException: if light did not acknowledge a call
+    """
+    for function_name, arguments in calls:
+        getattr(target, function_name)(*arguments)
+
+    return True  # every call was acknowledged, lifxlan raises otherwise
+
+
+def _command_count(state):
+    """Get number of messages sent to set state, color or kelvin, and power."""
+    color = state.color() is not None or state.kelvin() is not None or state.brightness() is not None
+    return max(int(color) + int(state.power() is not None), 1)
+
+
+def _depends_on_state(state):
+    """Get if color for state is built from last known state, see ``_to_lifx_hsbk``."""
+    return state.color() is None and (state.brightness() is None) != (state.kelvin() is None)
+
+
+def _to_light_states(colors, powers):
+    """Create ``LightState`` for many lights from lifx colors, see ``prism.color``.
+
+    :param colors: ``[(Integer, Integer, Integer, Integer)]`` hue, saturation, brightness 0-65535 and kelvin
+    :param powers: ``[Boolean]`` power
+    :returns: ``[LightState]``
+    """
+    rgb_colors = hsbk_to_rgb(colors)
+    brightnesses = to_percent([brightness for _, _, brightness, _ in colors])
+    kelvins = clamp_kelvin([kelvin for _, _, _, kelvin in colors])
+
+    return [LightState(power=power, color=rgb_color, kelvin=kelvin, brightness=brightness)
+            for rgb_color, brightness, kelvin, power in zip(rgb_colors, brightnesses, kelvins, powers)]
 
 
 def _to_lifx_duration(duration):
@@ -137,9 +367,5 @@ def _to_lifx_brightness(brightness):
 
 
 def _to_lifx_color(color, kelvin, color_brightness=None):
-    red, green, blue = int(color[0] / 255), int(color[1] / 255), int(color[2] / 255)
-    (hue, saturation, brightness) = colorsys.rgb_to_hsv(red, green, blue)
-    kelvin = kelvin if kelvin is not None else 0
-    brightness = color_brightness / 100 if color_brightness is not None else brightness
-
-    return [hue * 65535, saturation * 65535, brightness * 65535, kelvin]
+    """Get lifx hsbk color for rgb color, ``color_brightness`` 0-100 replaces color brightness."""
+    return list(rgb_to_hsbk([color], [kelvin], [color_brightness])[0])
@@ -0,0 +1,193 @@
+"""Lifx LAN protocol packets.
+
+Encodes and decodes the subset of Lifx LAN protocol messages used by prism,
+see https://lan.developer.lifx.com/docs for protocol details. All values are
+little endian.
+"""
+
+from collections import namedtuple
+import struct
+
+PORT = 56700
+PROTOCOL = 1024
+
+GET_SERVICE = 2
+STATE_SERVICE = 3
+ACKNOWLEDGEMENT = 45
+LIGHT_GET = 101
+LIGHT_SET_COLOR = 102
+LIGHT_STATE = 107
+LIGHT_SET_POWER = 117
+
+_HEADER = struct.Struct('<HHI8s6sBBQHH')
+_HEADER_SOURCE = struct.Struct('<I')  # at offset 4
+_HEADER_SEQUENCE = 23
+_STATE_SERVICE = struct.Struct('<BI')
+_SET_COLOR = struct.Struct('<BHHHHI')
+_SET_POWER = struct.Struct('<HI')
+_LIGHT_STATE = struct.Struct('<HHHHhH32sQ')
+
+_ADDRESSABLE = 1 << 12
+_TAGGED = 1 << 13
+_RES_REQUIRED = 1 << 0
+_ACK_REQUIRED = 1 << 1
+
+Packet = namedtuple('Packet', ['type', 'source', 'target', 'sequence', 'payload'])
+Color = namedtuple('Color', ['hue', 'saturation', 'brightness', 'kelvin'])
+LightStatePayload = namedtuple('LightStatePayload', ['color', 'power', 'label'])
+
+
+def pack(message_type, payload=b'', target=None, source=0, sequence=0, ack_required=False, res_required=False):
+    """Encode packet.
+
+    :param message_type: ``Integer`` message type, e.g. ``LIGHT_GET``
+    :param payload: ``Bytes`` encoded payload
+    :param target: ``String`` mac address, ``None`` for all devices
+    :param source: ``Integer`` client identifier, echoed in responses
+    :param sequence: ``Integer`` 0-255, echoed in responses
+    :param ack_required: ``Boolean`` device should acknowledge
+    :param res_required: ``Boolean`` device should respond with state
+    :returns: ``Bytes`` packet
+    """
+    flags = (_ACK_REQUIRED if ack_required else 0) | (_RES_REQUIRED if res_required else 0)
+    protocol = PROTOCOL | _ADDRESSABLE | (_TAGGED if target is None else 0)
+
+    header = _HEADER.pack(
+        _HEADER.size + len(payload), protocol, source,
+        mac_to_bytes(target), b'\x00' * 6, flags, sequence & 0xFF,
+        0, message_type, 0)
+
+    return header + payload
+
+
+def stamp(packet, source, sequence):
+    """Set source and sequence of encoded packet, so packet can be encoded once and sent many times.
+
+    :param packet: ``Bytes`` packet, see ``pack``
+    :param source: ``Integer`` client identifier, echoed in responses
+    :param sequence: ``Integer`` 0-255, echoed in responses
+    :returns: ``Bytes`` packet
+    """
+    stamped = bytearray(packet)
+    _HEADER_SOURCE.pack_into(stamped, 4, source)
+    stamped[_HEADER_SEQUENCE] = sequence & 0xFF
+    return bytes(stamped)
+
+
+def unpack(data):
+    """Decode packet.
+
+    :param data: ``Bytes`` packet
+    :returns: ``Packet`` or ``None`` if data is not a valid packet
+    """
+    if len(data) < _HEADER.size:
+        return None
+
+    size, protocol, source, target, _, _, sequence, _, message_type, _ = _HEADER.unpack_from(data)
+
+    if size != len(data) or protocol & 0x0FFF != PROTOCOL:
+        return None
+
+    return Packet(message_type, source, bytes_to_mac(target), sequence, data[_HEADER.size:])
+
+
+def set_color(color, duration):
+    """Encode ``LIGHT_SET_COLOR`` payload.
+
+    :param color: ``Color`` hue, saturation, brightness 0-65535 and kelvin
+    :param duration: ``Integer`` milliseconds
+    :returns: ``Bytes`` payload
+    """
+    return _SET_COLOR.pack(0, *[int(value) for value in color], int(duration))
+
+
+def set_power(power, duration):
+    """Encode ``LIGHT_SET_POWER`` payload.
+
+    :param power: ``Boolean`` on or off
+    :param duration: ``Integer`` milliseconds
+    :returns: ``Bytes`` payload
+    """
+    return _SET_POWER.pack(65535 if power else 0, int(duration))
+
+
+def light_state(color, power, label):
+    """Encode ``LIGHT_STATE`` payload.
+
+    :param color: ``Color`` current color
+    :param power: ``Boolean`` on or off
+    :param label: ``String`` light label
+    :returns: ``Bytes`` payload
+    """
+    return _LIGHT_STATE.pack(*color, 0, 65535 if power else 0, label.encode()[:32], 0)
+
+
+def state_service(port=PORT):
+    """Encode ``STATE_SERVICE`` payload, for udp service.
+
+    :param port: ``Integer`` port device listens to
+    :returns: ``Bytes`` payload
+    """
+    return _STATE_SERVICE.pack(1, port)
+
+
+def parse_light_state(payload):
+    """Decode ``LIGHT_STATE`` payload.
+
+    :param payload: ``Bytes`` payload
+    :returns: ``LightStatePayload``
+    """
+    hue, saturation, brightness, kelvin, _, power, label, _ = _LIGHT_STATE.unpack_from(payload)
+    return LightStatePayload(
+        Color(hue, saturation, brightness, kelvin),
+        power != 0,
+        label.rstrip(b'\x00').decode(errors='replace'))
+
+
+def parse_state_service(payload):
+    """Decode ``STATE_SERVICE`` payload.
+
+    :param payload: ``Bytes`` payload
+    :returns: (``Integer``, ``Integer``) service and port
+    """
+    return _STATE_SERVICE.unpack_from(payload)
+
+
+def parse_set_color(payload):
+    """Decode ``LIGHT_SET_COLOR`` payload.
+
+    :param payload: ``Bytes`` payload
+    :returns: (``Color``, ``Integer``) color and duration in milliseconds
+    """
+    _, hue, saturation, brightness, kelvin, duration = _SET_COLOR.unpack_from(payload)
+    return Color(hue, saturation, brightness, kelvin), duration
+
+
+def parse_set_power(payload):
+    """Decode ``LIGHT_SET_POWER`` payload.
+
+    :param payload: ``Bytes`` payload
+    :returns: (``Boolean``, ``Integer``) power and duration in milliseconds
+    """
+    level, duration = _SET_POWER.unpack_from(payload)
+    return level != 0, duration
+
+
+def mac_to_bytes(mac):
+    """Encode mac address as target, ``None`` is all devices.
+
+    :param mac: ``String`` mac address, e.g. ``d0:73:d5:01:02:03``
+    :returns: ``Bytes`` 8 byte target
+    """
+    if mac is None:
+        return b'\x00' * 8
+    return bytes.fromhex(mac.replace(':', '')).ljust(8, b'\x00')
+
+
+def bytes_to_mac(target):
+    """Decode target as mac address.
+
+    :param target: ``Bytes`` 8 byte target
+    :returns: ``String`` mac address
+    """
+    return ':'.join('{:02x}'.format(byte) for byte in target[:6])
@@ -3,26 +3,63 @@
 When adding support for a new protocol or vendor, this impl
 """
 
+import json
 import logging as loggr
+import threading
 import time
 
+from . import events, metrics
+from .health import CircuitBreaker, DEFAULT_COOLDOWN, DEFAULT_FAILURE_THRESHOLD, DeviceUnavailableError, TokenBucket
+
 log = loggr.getLogger('smrt')
 
+DEFAULT_MAX_WRITE_RATE = 10  # state changes per second, per light
+DEFAULT_MAX_STATE_AGE = 2  # seconds last known state is trusted by operations that depend on it, e.g. toggle
+
+_version = 0  # increased whenever any light changes
+_version_lock = threading.Lock()
+
+
+def state_version():
+    """Get global state version, increases whenever any light changes.
+
+    :returns: ``Integer`` version
+    """
+    return _version
+
+
+def next_state_version():
+    """Increase global state version, see ``state_version``.
+
+    :returns: ``Integer`` new version
+    """
+    global _version  # pylint: disable=global-statement
+    with _version_lock:
+        _version += 1
+        return _version
+
 
 class LightState:
-    """Light state, make sure values are ok before sending them to the client."""
+    """Light state, make sure values are ok before sending them to the client.
+
+    State is marked dirty when any value changes, see ``is_dirty``.
+    """
 
-    _power = None
-    _duration = None
-    _brightness = None
-    _color = None
-    _kelvin = None
+    __slots__ = ('_power', '_duration', '_brightness', '_color', '_kelvin', '_dirty')
+
+    _FIELDS = ('_power', '_duration', '_brightness', '_color', '_kelvin')
 
     def __init__(self, power=None, duration=None, brightness=None, color=None, kelvin=None):
         """Initialize ``Lightstate``.
 
         See ``Lightstate.set`` implementation.
         """
+        self._power = None
+        self._duration = None
+        self._brightness = None
+        self._color = None
+        self._kelvin = None
+        self._dirty = True
         self.set(power=power, duration=duration, brightness=brightness, color=color, kelvin=kelvin)
 
     def set(self, power=None, duration=None, brightness=None, color=None, kelvin=None):
@@ -44,21 +81,21 @@ class LightState:
     def _set_power(self, power):
         if power is not None:
             if isinstance(power, bool):
-                self._power = power
+                self._assign('_power', power)
             else:
                 raise TypeError('Light power must be either True or False, got="%s"' % power)
 
     def _set_duration(self, duration):
         if duration is not None:
             if isinstance(duration, int) and 0 <= duration <= 3600:
-                self._duration = duration
+                self._assign('_duration', duration)
             else:
                 raise TypeError('Light duration must be between 0-3600, got="%s"' % duration)
 
     def _set_brightness(self, brightness):
         if brightness is not None:
             if isinstance(brightness, int) and 0 <= brightness <= 100:
-                self._brightness = brightness
+                self._assign('_brightness', brightness)
             else:
                 raise TypeError('Light brightness must be between 0-100, got="%s"' % brightness)
 
@@ -66,27 +103,50 @@ class LightState:
         if color is not None:
             if isinstance(color, list) and len(color) == 3 and \
                     0 <= color[0] <= 255 and 0 <= color[1] <= 255 and 0 <= color[2] <= 255:
-                self._color = color
+                self._assign('_color', color)
             else:
                 raise TypeError('Light color must be array of length 3, with values 0-255, got="%s"' % color)
 
     def _set_kelvin(self, kelvin):
         if kelvin is not None:
             if isinstance(kelvin, int) and 2500 <= kelvin <= 9000:
-                self._kelvin = kelvin
+                self._assign('_kelvin', kelvin)
             else:
                 raise TypeError('Light kelvin must be between 2500-9000, got="%s"' % kelvin)
 
+    def _assign(self, field, value):
+        if getattr(self, field) == value:
+            return False
+
+        setattr(self, field, value)
+        self._dirty = True
+        return True
+
     def update(self, state):
-        """Update state from another ``LightState``.
+        """Update state from another ``LightState``, values that are set are copied.
+
+        Values are not checked again, they were checked when set on ``state``.
 
         :param state: ``LightState`` to update with.
+        :returns: ``Boolean`` if any value changed
         """
-        self._set_power(state.power())
-        self._set_duration(state.duration())
-        self._set_brightness(state.brightness())
-        self._set_color(state.color())
-        self._set_kelvin(state.kelvin())
+        changed = False
+        for field in self._FIELDS:
+            value = getattr(state, field)
+            if value is not None:
+                changed |= self._assign(field, value)
+        return changed
+
+    def is_dirty(self):
+        """Get if state has changed since last marked clean.
+
+        :returns: ``Boolean`` dirty
+        """
+        return self._dirty
+
+    def mark_clean(self):
+        """Mark state as clean, see ``is_dirty``."""
+        self._dirty = False
 
     def power(self):
         """Get power.
@@ -147,6 +207,34 @@ class LightState:
                     self._color, self._kelvin)
 
 
+class _Write:
+    """State change waiting to be written, see ``LightProtocol.set_state``."""
+
+    def __init__(self):
+        self.done = False
+        self.successful = False
+        self.error = None
+
+
+class Plan:
+    """State compiled for one light, see ``LightProtocol.compile_state``."""
+
+    __slots__ = ('state', 'commands', 'count', 'reusable')
+
+    def __init__(self, state, commands, count, reusable=True):
+        """Create and initialize ``Plan``.
+
+        :param state: ``LightState`` compiled state
+        :param commands: protocol specific, ready to send, commands
+        :param count: ``Integer`` number of commands, see ``LightProtocol._command_count``
+        :param reusable: ``Boolean`` if plan can be applied again, see ``LightProtocol._depends_on_state``
+        """
+        self.state = state
+        self.commands = commands
+        self.count = count
+        self.reusable = reusable
+
+
 class LightProtocol:
     """Interface for light clients, i.e. vendors or protocols."""
 
@@ -154,11 +242,54 @@ class LightProtocol:
     _client = None
     _last_seen = None
     _last_state = None
+    _stale = False
+    _restored = None  # timestamp light was restored, until confirmed by discovery
+
+    _write_interval = 1 / DEFAULT_MAX_WRITE_RATE
+    _failure_threshold = DEFAULT_FAILURE_THRESHOLD
+    _failure_cooldown = DEFAULT_COOLDOWN
+
+    # vendor limit for commands sent to one light, ``None`` is unlimited, see ``_command_count``
+    _command_rate = None  # commands per second
+    _command_burst = None  # commands sent at once
 
     def __init__(self, state=None):
         """Create and initialize ``LightProtocol``."""
         self._last_seen = int(time.time())  # seen when created
         self._last_state = state if state is not None else LightState()
+        self._state_time = time.monotonic() if state is not None else 0  # when state was last confirmed by light
+        self._serialized = None  # cached json, see ``json_bytes``
+        self._version = next_state_version()
+
+        self._read_lock = threading.Lock()
+        self._reads = 0  # completed reads, see ``get_state``
+
+        self._write_condition = threading.Condition()
+        self._pending_state = None
+        self._pending_writes = []
+        self._writing = False
+        self._last_write = 0
+
+        self._breaker = CircuitBreaker(self, self._probe, self._failure_threshold, self._failure_cooldown)
+        self._commands = TokenBucket(self._command_rate, self._command_burst) if self._command_rate else None
+
+    @classmethod
+    def set_max_write_rate(cls, rate):
+        """Set maximum number of state changes per second written to each light.
+
+        :param rate: ``Integer`` state changes per second
+        """
+        cls._write_interval = 1 / rate
+
+    @classmethod
+    def set_circuit_breaker(cls, threshold, cooldown):
+        """Set when lights are considered unavailable, applies to lights created after call.
+
+        :param threshold: ``Integer`` consecutive failures before state changes fail fast
+        :param cooldown: ``Integer`` seconds state changes fail fast before light is probed
+        """
+        cls._failure_threshold = threshold
+        cls._failure_cooldown = cooldown
 
     @staticmethod
     def protocol():
@@ -175,41 +306,350 @@ class LightProtocol:
         """
         raise NotImplementedError('Client is missing "get_name" function implementation')
 
+    def get_id(self):
+        """Return hardware id of light source, unlike name it does not change.
+
+        :returns: id as ``String``
+        """
+        raise NotImplementedError('Client is missing "get_id" function implementation')
+
+    def rename(self, name):
+        """Set name, e.g. when label changed on device, see ``registry.LightIndex.rename``.
+
+        :param name: ``String`` new name
+        """
+        if self._name != name:
+            self._name = name
+            self._changed()
+
     def set_state(self, state):
         """Set state for light source.
 
+        State changes are coalesced, while a change is written to the light, or
+        the maximum write rate is reached, new states are merged into one
+        pending state. Only the merged state is written, and every caller gets
+        the result of the write that included its state.
+
+        Writes are limited to the vendor command rate of the light. After
+        repeated failures the light is considered unavailable, and state
+        changes fail fast until it is reachable again, see ``CircuitBreaker``.
+
         :param state: ``LightState`` new state for light
         :returns: new state
+        :raises DeviceUnavailableError: if light is unavailable
         """
         if not isinstance(state, LightState):
             return RuntimeError('Invalid state, must implement LightState class')
 
-        successful = self._set_state(state)
-        log.debug('change state successful=%s', successful)
+        self._breaker.check()  # before waiting for other writes
+
+        write = _Write()
+
+        with self._write_condition:
+            if self._pending_state is None:
+                self._pending_state = LightState()
+            self._pending_state.update(state)  # latest values win
+            self._pending_writes.append(write)
+
+            while not write.done:
+                if self._writing:
+                    self._write_condition.wait()  # another caller is writing
+                else:
+                    self._write_pending()
+
+        if write.error is not None:
+            raise write.error
+
+        return write.successful
+
+    def _write_pending(self):
+        """Write pending state to light, ``_write_condition`` must be held."""
+        self._writing = True
+
+        # wait for rate limits, pending state can still be merged while waiting
+        delay = self._write_delay()
+        while delay > 0:
+            self._write_condition.wait(delay)
+            delay = self._write_delay()
+
+        state, writes = self._pending_state, self._pending_writes
+        self._pending_state, self._pending_writes = None, []
+
+        if self._commands is not None:
+            self._commands.consume(self._command_count(state))
+
+        successful, error = False, None
+        self._write_condition.release()
+        try:
+            self._breaker.check()  # may have opened while waiting
+
+            with metrics.device_rtt.time(self.protocol()):
+                successful = self._set_state(state)
+            log.debug('change state successful=%s, coalesced %i changes', successful, len(writes))
+            self._written(state, successful)
+        except DeviceUnavailableError as err:
+            error = err
+        except Exception as err:  # pylint: disable=broad-except
+            metrics.set_state_total.inc(self.protocol(), 'error')
+            self._breaker.record(False)
+            error = err  # raised in every caller
+        finally:
+            self._write_condition.acquire()
 
+        self._last_write = time.monotonic()
+        self._writing = False
+
+        for write in writes:
+            write.done, write.successful, write.error = True, successful, error
+
+        self._write_condition.notify_all()
+
+    def _written(self, state, successful):
+        """Record result of state written to light."""
+        metrics.set_state_total.inc(self.protocol(), 'success' if successful else 'failure')
+        self._breaker.record(successful)
+
+        seen = self._seen(int(time.time())) if successful else False
         if successful:
-            self._last_seen = int(time.time())
+            self._state_time = time.monotonic()
+
+        if self._last_state.update(state) or seen:
+            self._changed()
 
-        self._last_state.update(state)
+    def compile_state(self, state):
+        """Compile state into ready to send commands, to apply many times with ``apply_plan``.
 
+        :param state: ``LightState`` state to compile
+        :returns: ``Plan``
+        """
+        return Plan(state, self._compile(state), self._command_count(state), not self._depends_on_state(state))
+
+    def apply_plan(self, plan):
+        """Apply compiled state, see ``compile_state``.
+
+        Commands are sent as they are, without coalescing, other than that
+        plans are limited like ``set_state``.
+
+        :param plan: ``Plan`` compiled by this light
+        :returns: ``Boolean`` successful
+        :raises DeviceUnavailableError: if light is unavailable
+        """
+        self._breaker.check()
+
+        if self._commands is not None:
+            with self._write_condition:
+                delay = self._commands.delay(plan.count)
+                while delay > 0:
+                    self._write_condition.wait(delay)
+                    delay = self._commands.delay(plan.count)
+                self._commands.consume(plan.count)
+
+        try:
+            with metrics.device_rtt.time(self.protocol()):
+                successful = self._apply(plan.commands)
+        except Exception:
+            metrics.set_state_total.inc(self.protocol(), 'error')
+            self._breaker.record(False)
+            raise
+
+        self._written(plan.state, successful)
         return successful
 
+    def _write_delay(self):
+        """Get seconds until pending state can be written, ``_write_condition`` must be held."""
+        delay = self._last_write + self._write_interval - time.monotonic()
+
+        if self._commands is not None:
+            delay = max(delay, self._commands.delay(self._command_count(self._pending_state)))
+
+        return delay
+
+    def _command_count(self, state):  # pylint: disable=unused-argument,no-self-use
+        """Get number of commands sent to light to set state, see ``_command_rate``.
+
+        :param state: ``LightState`` state to set
+        :returns: ``Integer`` commands
+        """
+        return 1
+
+    def _depends_on_state(self, state):  # pylint: disable=unused-argument,no-self-use
+        """Get if commands to set state are built from last known state, compiled commands are then not reusable.
+
+        :param state: ``LightState`` state to set
+        :returns: ``Boolean`` depends on last known state
+        """
+        return False
+
     def update_state(self, state):
-        """Update state and last seen attributes."""
-        self._last_seen = int(time.time())
-        self._last_state.update(state)
+        """Update state and last seen attributes, state was read from light."""
+        seen = self._seen(int(time.time()))
+        self._state_time = time.monotonic()
 
-    def get_state(self):
-        """Get last known state.
+        if self._last_state.update(state) or seen:
+            self._changed()
 
+    def mark_stale(self, last_seen):
+        """Mark light as stale, i.e. not seen recently, until seen again.
+
+        :param last_seen: ``Integer`` timestamp light was last seen
+        """
+        self._state_time = 0  # state is read from light before it is trusted again, see ``get_state``
+
+        if self._seen(last_seen, stale=True, restored=self._restored):
+            self._changed()
+
+    def mark_restored(self, last_seen):
+        """Mark light as restored from snapshot, known but not yet confirmed by discovery.
+
+        :param last_seen: ``Integer`` timestamp light was last seen, before snapshot was taken
+        """
+        self._state_time = 0  # state is read from light before it is trusted, see ``get_state``
+
+        if self._seen(last_seen, restored=int(time.time())):
+            self._changed()
+
+    def _seen(self, last_seen, stale=False, restored=None):
+        """Set last seen, stale and restored attributes.
+
+        :returns: ``Boolean`` if any attribute changed
+        """
+        changed = self._last_seen != last_seen or self._stale != stale or self._restored != restored
+        self._last_seen, self._stale, self._restored = last_seen, stale, restored
+        return changed
+
+    def _changed(self):
+        """Record that light changed, invalidates serialized json, assigns new version and publishes event."""
+        self._serialized = None
+        self._version = next_state_version()
+
+        if events.bus.has_subscribers():
+            event = events.LIGHT_STALE if self._stale else events.LIGHT_CHANGED
+            events.bus.publish(event, self._version, self.json_bytes())
+
+    def renew_version(self):
+        """Assign new version without a change, e.g. when light is added to registry.
+
+        Version is assigned when light is created, during discovery, possibly
+        before clients last got lights, see ``since``.
+        """
+        self._version = next_state_version()
+
+    def get_version(self):
+        """Get version of last change to light, see ``state_version``.
+
+        :returns: ``Integer`` version
+        """
+        return self._version
+
+    def is_stale(self):
+        """Get if light is stale, see ``mark_stale``.
+
+        :returns: ``Boolean`` stale
+        """
+        return self._stale
+
+    def get_restored(self):
+        """Get when light was restored, see ``mark_restored``.
+
+        :returns: ``Integer`` timestamp, or ``None`` if light has been confirmed
+        """
+        return self._restored
+
+    def get_last_seen(self):
+        """Get when light was last seen by discovery, or polling.
+
+        :returns: ``Integer`` timestamp
+        """
+        return self._last_seen
+
+    def get_state(self, max_age=None):
+        """Get last known state, read from light if it is older than ``max_age``.
+
+        State is known from discovery, polling, reads and successful state
+        changes. Concurrent reads share one read from light. If light could not
+        be read, or is unavailable, last known state is returned.
+
+        :param max_age: ``Float`` seconds since state was known, ``None`` is any age
         :returns: ``LightState`` object.
         """
+        if max_age is None or time.monotonic() - self._state_time <= max_age:
+            return self._last_state
+
+        wanted = self._reads + 1
+
+        with self._read_lock:
+            if self._reads >= wanted:
+                return self._last_state  # read completed while waiting, share it
+
+            try:
+                self._read()
+            finally:
+                self._reads += 1
+
         return self._last_state
 
+    def _read(self):
+        """Read state from light, and update last known state, see ``get_state``."""
+        try:
+            self._breaker.check()
+
+            if self._commands is not None:
+                with self._write_condition:
+                    self._commands.consume(1)  # reads count towards vendor limit, but are not delayed
+
+            with metrics.device_rtt.time(self.protocol()):
+                state = self._read_state()
+        except DeviceUnavailableError as err:
+            log.debug('not reading state, %s', err)
+            return
+        except Exception as err:  # pylint: disable=broad-except
+            log.warning('could not read state for light "%s", using last known state: %s', self.get_name(), err)
+            self._breaker.record(False)
+            return
+
+        self._breaker.record(True)
+        self.update_state(state)
+
+    def _read_state(self):
+        """Read state from light, see ``get_state``.
+
+        :returns: ``LightState`` object.
+        """
+        raise NotImplementedError('Client is missing "_read_state" function implementation')
+
     def _set_state(self, state):
         """See ``LightProtocol.set_state`` documentation."""
         raise NotImplementedError('Client is missing "_set_state" function implementation')
 
+    def _compile(self, state):
+        """See ``LightProtocol.compile_state`` documentation, default is to send state as is.
+
+        :returns: commands for ``_apply``
+        """
+        return state
+
+    def _apply(self, commands):
+        """See ``LightProtocol.apply_plan`` documentation.
+
+        :param commands: commands from ``_compile``
+        :returns: ``Boolean`` successful
+        """
+        return self._set_state(commands)
+
+    def _probe(self):
+        """Check that light is reachable, used while light is unavailable, see ``set_state``.
+
+        :returns: ``Boolean`` reachable, or raises if light could not be reached
+        """
+        raise NotImplementedError('Client is missing "_probe" function implementation')
+
+    def get_availability(self):
+        """Get availability of light, see ``set_state``.
+
+        :returns: ``String`` ``closed`` if available, ``open`` if unavailable, or ``half-open`` if being tried
+        """
+        return self._breaker.state()
+
     def set_power(self, on_off):
         """Set power state for light source.
 
@@ -221,22 +661,74 @@ class LightProtocol:
         }
         return self.set_state(state)
 
+    def _address(self):
+        """Return address of light source, enough to reach it without discovery.
+
+        :returns: ``Dict`` address
+        """
+        raise NotImplementedError('Client is missing "_address" function implementation')
+
     def json(self):
         """Return json representation of light, i.e. ``Dict``.
 
         :returns: ``Dict`` json representation.
         """
         return {
+            'id': self.get_id(),
             'name': self._name,
             'protocol': self.protocol(),
             'last_seen': self._last_seen,
+            'stale': self._stale,
+            'restored': self._restored is not None,
             'state': self._last_state.json()
         }
 
+    def json_bytes(self):
+        """Return serialized json representation of light, see ``json``.
+
+        Serialized json is cached until state, or last seen, changes.
+
+        :returns: ``Bytes`` serialized json representation.
+        """
+        serialized = self._serialized
+        if serialized is None or self._last_state.is_dirty():
+            self._last_state.mark_clean()  # before serializing, changes during serialization are not lost
+            serialized = json.dumps(self.json(), separators=(',', ':')).encode()
+            self._serialized = serialized
+
+        return serialized
+
+    def snapshot(self):
+        """Return snapshot of light, to restore light with from protocol client.
+
+        :returns: ``Dict`` snapshot
+        """
+        return {
+            'id': self.get_id(),
+            'name': self._name,
+            'protocol': self.protocol(),
+            'address': self._address(),
+            'last_seen': self._last_seen,
+            'stale': self._stale,
+            'restored': self._restored,
+            'state': self._last_state.json()
+        }
+
+    def sync(self, snapshot):
+        """Update light from snapshot taken by another process, see ``snapshot``.
+
+        :param snapshot: ``Dict`` snapshot of this light
+        """
+        changed = self._last_state.update(LightState(**snapshot['state']))
+
+        if self._seen(snapshot['last_seen'], stale=snapshot.get('stale', False),
+                      restored=snapshot.get('restored')) or changed:
+            self._changed()
+
     def __repr__(self):
         """Return string representation.
 
         :returns: ``String``
         """
-        return '<Light name="{._name}" protocol="{.protocol()}" ' \
-               'last_seen={._last_seen}>'.format(self)
+        return '<Light name="{}" protocol="{}" ' \
+               'last_seen={}>'.format(self._name, self.protocol(), self._last_seen)
@@ -0,0 +1,198 @@
+"""Metrics module, latency histograms and counters.
+
+Metrics are kept in process and exposed in Prometheus text exposition format,
+see ``Registry.exposition``. Instruments are cheap enough for hot paths, an
+observation is a lock and a few additions.
+"""
+
+import threading
+import time
+
+# seconds, suitable for both device round trips and discoveries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    """Counter, values only increase, one value per label combination."""
+
+    def __init__(self, name, description, labels=()):
+        """Create and initialize ``Counter``.
+
+        :param name: ``String`` metric name
+        :param description: ``String`` metric description
+        :param labels: ``(String)`` label names
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """Increase counter.
+
+        :param label_values: ``String`` values, one per label
+        :param amount: ``Integer`` to increase with
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def values(self):
+        """Get current values.
+
+        :returns: ``{(String): Integer}`` label values to value
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def exposition(self):
+        """Return counter in Prometheus text format.
+
+        :returns: ``[String]`` lines
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} counter'.format(self.name)]
+        for label_values, value in sorted(self.values().items()):
+            lines.append('{}{} {}'.format(self.name, _labels(self.labels, label_values), value))
+        return lines
+
+
+class Histogram:
+    """Histogram, distribution of observed values, one distribution per label combination."""
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and initialize ``Histogram``.
+
+        :param name: ``String`` metric name
+        :param description: ``String`` metric description
+        :param labels: ``(String)`` label names
+        :param buckets: ``(Float)`` bucket upper bounds, increasing
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label values to [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Observe value.
+
+        :param value: ``Float`` observed value
+        :param label_values: ``String`` values, one per label
+        """
+        with self._lock:
+            values = self._values.get(label_values)
+            if values is None:
+                values = self._values[label_values] = [0] * (len(self.buckets) + 2)
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+                    break
+            values[-2] += 1
+            values[-1] += value
+
+    def time(self, *label_values):
+        """Observe duration of ``with`` block, in seconds.
+
+        :param label_values: ``String`` values, one per label
+        :returns: context manager
+        """
+        return _Timer(self, label_values)
+
+    def summary(self):
+        """Get count, sum and mean per label combination.
+
+        :returns: ``{(String): Dict}`` label values to summary
+        """
+        with self._lock:
+            return {label_values: {
+                'count': values[-2],
+                'sum': round(values[-1], 6),
+                'mean': round(values[-1] / values[-2], 6) if values[-2] else None
+            } for label_values, values in self._values.items()}
+
+    def exposition(self):
+        """Return histogram in Prometheus text format, buckets are cumulative.
+
+        :returns: ``[String]`` lines
+        """
+        with self._lock:
+            values = {label_values: list(counts) for label_values, counts in self._values.items()}
+
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} histogram'.format(self.name)]
+        for label_values, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _labels(self.labels + ('le',), label_values + (str(bound),)), cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                self.name, _labels(self.labels + ('le',), label_values + ('+Inf',)), counts[-2]))
+            lines.append('{}_count{} {}'.format(self.name, _labels(self.labels, label_values), counts[-2]))
+            lines.append('{}_sum{} {}'.format(self.name, _labels(self.labels, label_values), counts[-1]))
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self._histogram = histogram
+        self._label_values = label_values
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self._histogram.observe(time.perf_counter() - self._start, *self._label_values)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('"', '\\"'))
+                          for name, value in zip(names, values)) + '}'
+
+
+class Registry:
+    """Collection of metrics, exposed together."""
+
+    def __init__(self):
+        """Create and initialize ``Registry``."""
+        self._metrics = []
+
+    def counter(self, name, description, labels=()):
+        """Create and register ``Counter``, see ``Counter`` documentation."""
+        metric = Counter(name, description, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and register ``Histogram``, see ``Histogram`` documentation."""
+        metric = Histogram(name, description, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        """Return all metrics in Prometheus text format.
+
+        :returns: ``String``
+        """
+        return '\n'.join(line for metric in self._metrics for line in metric.exposition()) + '\n'
+
+
+registry = Registry()
+
+discovery_duration = registry.histogram(
+    'prism_discovery_duration_seconds', 'Discovery, or poll, duration per protocol client.', ('client', 'operation'))
+device_rtt = registry.histogram(
+    'prism_device_command_seconds', 'Device state change round trip per protocol.', ('protocol',))
+set_state_total = registry.counter(
+    'prism_set_state_total', 'State changes per protocol and result.', ('protocol', 'result'))
+lookup_total = registry.counter(
+    'prism_light_lookup_total', 'Light lookups by name, hit or miss in registry.', ('result',))
+circuit_total = registry.counter(
+    'prism_circuit_transitions_total', 'Light circuit breakers opened or closed.', ('state',))
+request_duration = registry.histogram(
+    'prism_request_duration_seconds', 'Request latency per endpoint.', ('endpoint',))
@@ -0,0 +1,161 @@
+"""Operations module, state changes performed in the background.
+
+Clients that do not need to wait for a light to acknowledge a state change can
+queue it as an ``Operation``. Background workers perform queued operations and
+retry failed ones after a delay, progress can be followed by operation id.
+"""
+
+from collections import OrderedDict
+import logging as loggr
+import os
+import queue
+import threading
+import time
+import uuid
+
+from .health import DeviceUnavailableError
+
+log = loggr.getLogger('smrt')
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 1  # seconds before first retry, doubled for every retry
+DEFAULT_HISTORY = 1000  # finished operations kept for lookup
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class Operation:
+    """Operation, a queued state change for a light."""
+
+    def __init__(self, name, function):
+        """Create and initialize ``Operation``.
+
+        :param name: ``String`` name of light
+        :param function: ``Function`` without arguments, returns ``Boolean`` successful
+        """
+        self.id = uuid.uuid4().hex  # pylint: disable=invalid-name
+        self.name = name
+        self.function = function
+        self.status = PENDING
+        self.attempts = 0
+        self.created = int(time.time())
+        self.finished = None
+
+    def json(self):
+        """Return json representation of operation, i.e. ``Dict``.
+
+        :returns: ``Dict`` json representation.
+        """
+        return {
+            'id': self.id,
+            'light': self.name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'created': self.created,
+            'finished': self.finished
+        }
+
+    def __repr__(self):
+        """Return string representation.
+
+        :returns: ``String``
+        """
+        return '<Operation id="{0.id}" light="{0.name}" status={0.status}>'.format(self)
+
+
+class OperationTracker:
+    """Queue operations, perform them in background workers and track their status."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES, history=DEFAULT_HISTORY,
+                 retry_delay=DEFAULT_RETRY_DELAY):
+        """Create and initialize ``OperationTracker``, workers are started on first operation.
+
+        :param workers: ``Integer`` number of background workers
+        :param retries: ``Integer`` retries before operation is failed
+        :param history: ``Integer`` finished operations kept, queued and running operations are always kept
+        :param retry_delay: ``Float`` seconds before first retry, doubled for every retry
+        """
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._history = history
+        self._queue = queue.Queue()
+        self._operations = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._started = None  # process workers run in, a forked process starts its own
+
+    def submit(self, name, function):
+        """Queue operation.
+
+        :param name: ``String`` name of light
+        :param function: ``Function`` without arguments, returns ``Boolean`` successful
+        :returns: ``Operation``
+        """
+        operation = Operation(name, function)
+
+        with self._lock:
+            self._operations[operation.id] = operation
+            self._forget()
+
+            if self._started != os.getpid():
+                self._started = os.getpid()
+                for index in range(self._workers):
+                    threading.Thread(target=self._work, name='prism-operation-%i' % index, daemon=True).start()
+
+        self._queue.put(operation)
+        return operation
+
+    def get(self, operation_id):
+        """Get operation by id.
+
+        :param operation_id: ``String`` operation id
+        :returns: ``Operation`` or ``None``
+        """
+        return self._operations.get(operation_id)
+
+    def _forget(self):
+        """Forget oldest finished operations beyond history, ``_lock`` must be held."""
+        excess = len(self._operations) - self._history
+        if excess <= 0:
+            return
+
+        finished = [operation.id for operation in self._operations.values() if operation.finished is not None]
+        for operation_id in finished[:excess]:
+            del self._operations[operation_id]
+
+    def _work(self):
+        while True:
+            operation = self._queue.get()
+            operation.status = RUNNING
+            operation.attempts += 1
+
+            successful, retry = False, True
+            try:
+                successful = operation.function()
+            except DeviceUnavailableError as err:
+                log.warning('operation %s for light "%s" failed, light is unavailable: %s',
+                            operation.id, operation.name, err)
+                retry = False  # circuit is open, light is not tried again until it recovers
+            except Exception as err:  # pylint: disable=broad-except
+                log.warning('operation %s for light "%s" failed: %s', operation.id, operation.name, err)
+
+            if not successful and retry and operation.attempts <= self._retries:
+                operation.status = PENDING
+                delay = self._retry_delay * 2 ** (operation.attempts - 1)  # backoff
+                timer = threading.Timer(delay, self._queue.put, (operation,))
+                timer.daemon = True  # worker is free for other operations while waiting
+                timer.start()
+                continue
+
+            operation.status = COMPLETED if successful else FAILED
+            operation.finished = int(time.time())
+            operation.function = None  # release state, operation is kept for lookup
+            log.debug('operation %s for light "%s" %s after %i attempts',
+                      operation.id, operation.name, operation.status, operation.attempts)
+
+            with self._lock:
+                self._forget()
@@ -0,0 +1,58 @@
+"""Persistence module, snapshots of known lights on disk.
+
+Lights are snapshotted after discovery, and restored when Prism starts, so
+requests can be served before the first discovery has completed.
+"""
+
+import json
+import logging as loggr
+import os
+
+log = loggr.getLogger('smrt')
+
+VERSION = 2  # snapshot file format, 2 added light id
+
+
+def save(path, lights):
+    """Save snapshot of lights, file is replaced atomically.
+
+    :param path: ``String`` snapshot file path
+    :param lights: ``[LightProtocol]`` lights to save
+    """
+    snapshot = {
+        'version': VERSION,
+        'lights': [light.snapshot() for light in lights]
+    }
+
+    temporary_path = '{}.tmp'.format(path)
+    try:
+        with open(temporary_path, 'w', encoding='utf-8') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(temporary_path, path)
+    except OSError as err:
+        log.warning('could not save light snapshot to %s: %s', path, err)
+
+
+def load(path):
+    """Load snapshot of lights.
+
+    A missing, unreadable or unsupported snapshot is not an empty snapshot,
+    callers keep the lights they know.
+
+    :param path: ``String`` snapshot file path
+    :returns: ``[Dict]`` light snapshots, see ``LightProtocol.snapshot``, or ``None`` if there is no valid snapshot
+    """
+    try:
+        with open(path, encoding='utf-8') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as err:
+        log.warning('could not load light snapshot from %s: %s', path, err)
+        return None
+
+    if snapshot.get('version') != VERSION:
+        log.warning('ignoring light snapshot %s, unsupported version %s', path, snapshot.get('version'))
+        return None
+
+    return snapshot['lights']
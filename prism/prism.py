@@ -6,18 +6,37 @@ Current supported lights:
 - Lifx LAN.
 - Yeelight LAN.
 """
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
 import logging as loggr
 import json
 import os
+import threading
 
 from smrt import SMRTApp, app, make_response, request, jsonify, smrt
 from smrt import ResouceNotFound
 
-from prism import lifx_client, yeelight_client
-from .light import LightState
+from prism import backends, events, lifx_client, metrics, yeelight_client, persistence
+from .lifx_client import aio as lifx_aio
+from .yeelight_client import aio as yeelight_aio
+from .health import DeviceUnavailableError, DEFAULT_COOLDOWN, DEFAULT_FAILURE_THRESHOLD, OPEN
+from .effects import EffectEngine
+from .discovery import DiscoveryScheduler, discover, poll, DEFAULT_BROADCAST_EVERY, DEFAULT_INTERVAL, DEFAULT_TIMEOUT
+from .light import LightProtocol, LightState, state_version, DEFAULT_MAX_STATE_AGE, DEFAULT_MAX_WRITE_RATE
+from .operations import OperationTracker
+from .registry import Registry, expire, DEFAULT_GONE_AFTER, DEFAULT_MISS_TTL, DEFAULT_STALE_AFTER
+from .scenes import SceneEngine
 
 log = loggr.getLogger('smrt')
 
+# protocol clients, must implement ``get_lights``, ``refresh_lights``, ``get_cached_lights``, ``restore_lights``
+# and ``evict_lights``
+_clients = [lifx_client, yeelight_client]
+_asyncio_clients = [lifx_aio, yeelight_aio]  # same interface, device i/o on one event loop
+
+_MAX_WORKERS = 32  # concurrent state changes
+_KEEPALIVE = 15  # seconds between event stream keep-alive comments
+
 
 class Prism(SMRTApp):
     """Prism is a ``SMRTApp`` that is to be registered with SMRT."""
@@ -30,14 +49,98 @@ class Prism(SMRTApp):
 
         SMRTApp.__init__(self, self._schemas_path, 'configuration.schema.prism.json')
 
+        # before lights are created, lights keep circuit breaker settings
+        LightProtocol.set_circuit_breaker(
+            self._configuration('failure_threshold', DEFAULT_FAILURE_THRESHOLD),
+            self._configuration('failure_cooldown', DEFAULT_COOLDOWN))
+
+        self._clients = _asyncio_clients if self._configuration('asyncio', False) else _clients
+        self._backend = backends.create(
+            self._configuration('registry_backend', backends.LOCAL), self._configuration('registry_path'))
+        self._follow_lock = threading.Lock()
+        self._discovery_timeout = self._configuration('discovery_timeout', DEFAULT_TIMEOUT)
+        self._discovery = DiscoveryScheduler(
+            self._discover,
+            interval=self._configuration('discovery_interval', DEFAULT_INTERVAL),
+            polling=self._poll,
+            broadcast_every=self._configuration('broadcast_every', DEFAULT_BROADCAST_EVERY))
+        self._registry = Registry(
+            self._discovery.refresh,
+            miss_ttl=self._configuration('negative_cache_ttl', DEFAULT_MISS_TTL))
+        self._stale_after = self._configuration('stale_after', DEFAULT_STALE_AFTER)
+        self._gone_after = self._configuration('gone_after', DEFAULT_GONE_AFTER)
+        self._max_lights = self._configuration('max_lights')
+        self._max_state_age = self._configuration('max_state_age', DEFAULT_MAX_STATE_AGE)
+
+        self._snapshot_path = self._configuration('snapshot_file')
+        if self._snapshot_path is not None:
+            self._restore()
+
+        self._started = None  # process background discovery runs in, see ``start``
+        self._start_lock = threading.Lock()
+
+        self._executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix='prism-state')
+
+        self._operations = OperationTracker()
+
+        LightProtocol.set_max_write_rate(self._configuration('max_write_rate', DEFAULT_MAX_WRITE_RATE))
+
+        self._groups = {group['name']: group['lights'] for group in self._configuration('groups', [])}
+
+        self._scenes = SceneEngine.from_configuration(self._configuration('scenes', []), self.get_light, self._executor)
+        self._effects = EffectEngine.from_configuration(
+            self._configuration('effects', []), self.get_light, self.submit_state)
+
         log.debug('%s initiated!', self.application_name())
 
+    def start(self):
+        """Start background discovery in this process, unless already started.
+
+        Called on first request, not when created: pre-fork servers create the
+        application before forking workers, and discovery threads and leader
+        election must belong to each worker.
+        """
+        if self._started == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._started == os.getpid():
+                return
+
+            if self._started is not None:
+                self._discovery.stop()  # started before fork, thread was not forked
+            self._discovery.start()
+            self._started = os.getpid()
+
+    def _configuration(self, key, default=None):
+        """Get configuration value, or default if value is not configured.
+
+        :param key: ``String`` configuration key
+        :param default: value to return if not configured
+        :returns: configured value or default
+        """
+        configuration = getattr(self, 'config', None) or {}
+        return configuration.get(key, default)
+
     def status(self):
-        """Use ``SMRTApp`` documentation for ``status`` implementation."""
+        """Use ``SMRTApp`` documentation for ``status`` implementation.
+
+        Includes a summary of metrics, see ``/metrics`` for details.
+        """
         return {
             'name': self.application_name(),
             'status': 'OK',  # hard coded for now
-            'version': '0.0.1'
+            'version': '0.0.1',
+            'lights': len(self._registry.get_lights()),
+            'stale': len([light for light in self._registry.get_lights() if light.is_stale()]),
+            'unavailable': [light.get_name() for light in self._registry.get_lights()
+                            if light.get_availability() == OPEN],
+            'discovery': {'{}.{}'.format(*labels): summary
+                          for labels, summary in metrics.discovery_duration.summary().items()},
+            'set_state': {'{}.{}'.format(*labels): count
+                          for labels, count in metrics.set_state_total.values().items()},
+            'lookups': {labels[0]: count for labels, count in metrics.lookup_total.values().items()},
+            'requests': {labels[0]: summary for labels, summary in metrics.request_duration.summary().items()}
         }
 
     @staticmethod
@@ -45,41 +148,309 @@ class Prism(SMRTApp):
         """Use ``SMRTApp`` documentation for ``application_name`` implementation."""
         return 'Prism'
 
-    @staticmethod
-    def get_lights():
-        """Get all ligthts that can be discovered.
+    def _discover(self):
+        """Discover lights for all protocols concurrently, refreshes protocol caches and registry.
 
-        Function will perform a discovery for light sources, and return the
-        light in an array. Lights are cached, so if a light "dissapears", it
-        will still be returned once discovered.
+        Only the leader discovers, other workers follow the leader, see ``backends``.
 
         :returns: [``LightProtocol``].
         """
-        lifx_lights = lifx_client.get_lights()
-        yeelight_lights = yeelight_client.get_lights()
+        if not self._backend.elect():
+            return self._follow()
 
-        return lifx_lights + yeelight_lights
+        lights = discover(self._clients, timeout=self._discovery_timeout)
+        self._update(lights)
+        return lights
 
-    @staticmethod
-    def get_light(name):
-        """Get a light identified by name.
+    def _poll(self):
+        """Poll known lights for all protocols concurrently, without discovery.
+
+        Only the leader polls, other workers follow the leader, see ``backends``.
+
+        :returns: [``LightProtocol``].
+        """
+        if not self._backend.elect():
+            return self._follow()
+
+        lights = poll(self._clients, timeout=self._discovery_timeout)
+        self._update(lights)
+        return lights
+
+    def _update(self, lights):
+        """Update registry, snapshot and followers, with refreshed lights, see ``_expire``."""
+        lights = self._expire(lights)
 
-        Function will do discovery, see ``get_lights`` documentation.
+        self._registry.update(lights)
+        self._backend.publish(lights)
+
+        if self._snapshot_path is not None:
+            persistence.save(self._snapshot_path, lights)
+
+    def _follow(self):
+        """Update registry with lights published by leader, if changed since last call.
+
+        :returns: [``LightProtocol``].
+        """
+        with self._follow_lock:
+            snapshots = self._backend.load()
+
+            if snapshots is None:  # unchanged, or not loaded, keep lights
+                return self._registry.get_lights()
+
+            for client in self._clients:
+                client.restore_lights(snapshots)
+
+            cached = {light.get_id(): light for client in self._clients for light in client.get_cached_lights()}
+
+            lights = []
+            for snapshot in snapshots:
+                light = cached.pop(snapshot['id'], None)
+                if light is not None:
+                    light.sync(snapshot)
+                    lights.append(light)
+
+            if cached:
+                self._evict(list(cached))  # evicted by leader
+
+            self._registry.update(lights)
+            return lights
+
+    def _expire(self, lights):
+        """Mark lights not seen recently stale, and evict lights that are gone, see ``registry.expire``.
+
+        :param lights: ``[LightProtocol]`` all known lights
+        :returns: ``[LightProtocol]`` lights kept
+        """
+        lights, evicted = expire(lights, self._stale_after, self._gone_after, self._max_lights)
+        if evicted:
+            self._evict([light.get_id() for light in evicted])
+        return lights
+
+    def _evict(self, ids):
+        """Remove lights from protocol client caches.
+
+        :param ids: ``[String]`` hardware ids of lights to remove
+        """
+        for client in self._clients:
+            client.evict_lights(ids)
+
+    def _restore(self):
+        """Restore lights from snapshot, lights are stale until confirmed by discovery."""
+        snapshots = persistence.load(self._snapshot_path)
+
+        if snapshots is None:
+            return  # no snapshot, lights are discovered
+
+        for client in self._clients:
+            client.restore_lights(snapshots)
+
+        lights = [light for client in self._clients for light in client.get_cached_lights()]
+        lights = self._expire(lights)
+
+        self._registry.update(lights)
+        log.debug('restored %i lights from %s', len(lights), self._snapshot_path)
+
+    def get_lights(self, refresh=False, include_stale=True):
+        """Get all ligthts that have been discovered.
+
+        Lights are discovered periodically in the background, function will
+        return cached lights unless ``refresh`` is requested. If a light
+        "dissapears", it is stale after ``stale_after`` seconds, and evicted
+        after ``gone_after`` seconds.
+
+        :param refresh: ``Boolean`` perform discovery before returning
+        :param include_stale: ``Boolean`` include stale lights
+        :returns: [``LightProtocol``].
+        """
+        if refresh:
+            self._discovery.refresh()
+        elif not self._backend.is_leader():
+            self._follow()
+
+        return self._registry.get_lights(include_stale=include_stale)
+
+    def get_removed(self, since):
+        """Get hardware ids of lights removed after version, see ``Registry.get_removed``.
+
+        :param since: ``Integer`` state version
+        :returns: ``[String]`` or ``None`` if removals after version are no longer known
+        """
+        return self._registry.get_removed(since)
+
+    def get_light(self, name):
+        """Get a light identified by name, or hardware id.
+
+        Unknown names trigger a discovery, concurrent lookups share the same
+        discovery. Names still not found are not looked for again until
+        ``negative_cache_ttl`` has passed.
 
         :param name: ``String`` unique identifier.
         :returns: ``LightProtocol`` or ``None``
         """
-        lifx_light = lifx_client.get_light(name)
+        if not self._backend.is_leader():
+            self._follow()
+
+        return self._registry.get_light(name)
+
+    def get_state(self, light, max_age=None):
+        """Get state of light, read from light if last known state is too old.
+
+        :param light: ``LightProtocol`` light
+        :param max_age: ``Float`` seconds since state was known, default ``max_state_age``
+        :returns: ``LightState``
+        """
+        return light.get_state(max_age=self._max_state_age if max_age is None else max_age)
+
+    def set_states(self, states):
+        """Set state for many lights concurrently.
+
+        Failing lights do not affect other lights, see result for each light.
+
+        :param states: ``[(String, LightState)]`` light name and new state
+        :returns: ``[(String, LightProtocol, Boolean)]`` name, light (``None`` if not found) and if successful
+        """
+        futures = [self._executor.submit(self._set_state, name, state) for name, state in states]
+        return [future.result() for future in futures]
 
-        if lifx_light is not None:
-            return lifx_light
+    def set_state_async(self, light, state):
+        """Queue state change for light, state is set by a background worker.
 
-        yeelight_light = yeelight_client.get_light(name)
+        :param light: ``LightProtocol`` light to change
+        :param state: ``LightState`` new state
+        :returns: ``Operation`` to follow progress with
+        """
+        return self._operations.submit(light.get_name(), lambda: light.set_state(state))
+
+    def get_operation(self, operation_id):
+        """Get queued state change, see ``set_state_async``.
+
+        :param operation_id: ``String`` operation id
+        :returns: ``Operation`` or ``None``
+        """
+        return self._operations.get(operation_id)
+
+    def get_group(self, name):
+        """Get lights in group identified by name, lights not found are omitted.
+
+        :param name: ``String`` unique group identifier
+        :returns: ``[LightProtocol]`` or ``None`` if there is no such group
+        """
+        if name not in self._groups:
+            return None
+
+        lights = [self.get_light(member) for member in self._groups[name]]
+        return [light for light in lights if light is not None]
+
+    def set_group_state(self, name, state):
+        """Set state for all lights in group concurrently, see ``submit_state``.
+
+        Groups are applied per light, not broadcast as a protocol group, so each
+        light is acknowledged, and rate limited and circuit broken, on its own.
+
+        :param name: ``String`` unique group identifier
+        :param state: ``LightState`` new state for all lights
+        :returns: ``[(String, LightProtocol, Boolean)]`` or ``None`` if there is no such group
+        """
+        lights = self.get_group(name)
 
-        if yeelight_light is not None:
-            return yeelight_light
+        if lights is None:
+            return None
 
-        return None  # no light found
+        results = []
+        for batch, future in self.submit_state(lights, state):
+            try:
+                successful = future.result()
+            except Exception as err:  # pylint: disable=broad-except
+                log.warning('could not set state for group "%s": %s', name, err)
+                successful = False
+            results.extend((light.get_name(), light, successful) for light in batch)
+
+        return results
+
+    def submit_state(self, lights, state):
+        """Set same state for many lights concurrently, without waiting for lights.
+
+        Every light is set with ``LightProtocol.set_state``, circuit breaker, rate
+        limit, write coalescing and metrics apply, and a light is only seen when
+        it acknowledged. Lights with an open circuit are not tried, their future
+        is already done and unsuccessful. Failing lights do not affect other lights.
+
+        :param lights: ``[LightProtocol]`` lights to change
+        :param state: ``LightState`` new state for all lights
+        :returns: ``[([LightProtocol], Future)]`` lights, and ``Future`` with if successful
+        """
+        submitted = []
+        for light in lights:
+            if light.get_availability() == OPEN:
+                future = Future()
+                future.set_result(False)
+            else:
+                future = self._executor.submit(self._set_light_state, light, state)
+            submitted.append(([light], future))
+
+        return submitted
+
+    def get_scenes(self):
+        """Get all configured scenes.
+
+        :returns: ``[Scene]``
+        """
+        return self._scenes.get_scenes()
+
+    def apply_scene(self, name):
+        """Apply scene to all lights in scene concurrently, see ``SceneEngine``.
+
+        :param name: ``String`` unique scene name
+        :returns: ``[(String, LightProtocol, Boolean)]`` or ``None`` if there is no such scene
+        """
+        return self._scenes.apply(name)
+
+    def get_effects(self):
+        """Get all configured effects.
+
+        :returns: ``[Effect]``
+        """
+        return self._effects.get_effects()
+
+    def get_running_effects(self):
+        """Get running effects.
+
+        :returns: ``[Run]``
+        """
+        return self._effects.get_runs()
+
+    def start_effect(self, name, lights):
+        """Start effect on lights, see ``EffectEngine``.
+
+        :param name: ``String`` unique effect name
+        :param lights: ``[String]`` names of lights to run effect on
+        :returns: ``Run`` or ``None`` if there is no such effect
+        """
+        return self._effects.start(name, lights)
+
+    def stop_effect(self, name):
+        """Stop running effect.
+
+        :param name: ``String`` unique effect name
+        :returns: ``Run`` or ``None`` if effect is not running
+        """
+        return self._effects.stop(name)
+
+    def _set_state(self, name, state):
+        light = self.get_light(name)
+
+        if light is None:
+            return name, None, False
+
+        return name, light, self._set_light_state(light, state)
+
+    @staticmethod
+    def _set_light_state(light, state):
+        try:
+            return light.set_state(state)
+        except Exception as err:  # pylint: disable=broad-except
+            log.warning('could not set state for light "%s": %s', light.get_name(), err)
+            return False
 
 
 # create prism and register it with smrt framework
@@ -87,28 +458,111 @@ prism = Prism()
 app.register_application(prism)
 
 
+def _instrumented(endpoint):
+    """Observe endpoint request latency, see ``metrics.request_duration``, discovery starts on first request."""
+    @functools.wraps(endpoint)
+    def instrumented(*args, **kwargs):
+        prism.start()
+        with metrics.request_duration.time(endpoint.__name__):
+            return endpoint(*args, **kwargs)
+    return instrumented
+
+
+@smrt('/metrics',
+      produces='text/plain')
+def get_metrics():
+    """Endpoint to get metrics in Prometheus text format.
+
+    :returns: ``text/plain``
+    """
+    response = make_response(metrics.registry.exposition(), 200)
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+    return response
+
+
 @smrt('/lights',
       produces='application/se.novafaen.prism.lights.v1+json')
+@_instrumented
 def get_lights():
     """Endpoint to get all discoverable, and cached, lights.
 
+    Query parameter ``refresh=true`` forces a discovery before responding.
+    Stale lights, not seen recently, are only returned with ``include=stale``.
+    Lights restored from snapshot are returned, as ``restored``, until confirmed
+    by discovery, or stale if discovery does not find them.
+    Query parameter ``since=<version>`` only returns lights changed after
+    version, and hardware ids of lights ``removed`` after version. If removals
+    are no longer known for version, all lights are returned without
+    ``removed``. Response ``version`` is the version to use in next request.
+
+    Responds ``304 Not Modified`` if ``If-None-Match`` matches current version,
+    entity tags differ between query parameters.
+
     :returns: ``se.novafaen.prism.lights.v1+json``
     """
-    lights = prism.get_lights()
-
-    response_body = {
-        'lights': [light.json() for light in lights]
-    }
-    response = make_response(jsonify(response_body), 200)
+    version = state_version()  # before lights are read, changes after are included in next request
+    include_stale = _query_includes('stale')
+    lights = prism.get_lights(refresh=_query_flag('refresh'), include_stale=include_stale)
+    since = _query_integer('since')
+
+    representation = ['stale'] if include_stale else []
+    if since is not None:
+        representation.append('since.{}'.format(since))
+    etag = _etag(version, ','.join(representation))
+    if request.headers.get('If-None-Match') == etag:
+        return _not_modified(etag)
+
+    removed = prism.get_removed(since) if since is not None else None
+    if removed is not None:
+        lights = [light for light in lights if light.get_version() > since]
+
+    # lights are cached serialized, response is a concatenation of lights
+    response_body = b'{"version":%d,"lights":[' % version + b','.join([light.json_bytes() for light in lights]) + \
+        (b'],"removed":' + json.dumps(removed).encode() + b'}' if removed is not None else b']}')
+    response = make_response(response_body, 200)
     response.headers['Content-Type'] = 'application/se.novafaen.prism.lights.v1+json'
+    response.headers['ETag'] = etag
+    return response
+
+
+@smrt('/lights/events',
+      produces='text/event-stream')
+@_instrumented
+def get_lights_events():
+    """Endpoint to stream light changes as server-sent events.
+
+    Events are ``light.appeared``, ``light.changed``, ``light.stale`` and
+    ``light.removed``, event id is the state version, see ``/lights?since=``.
+
+    :returns: ``text/event-stream``
+    """
+    def stream():
+        subscription = events.bus.subscribe()  # when streaming starts, not before
+        try:
+            yield b': connected\n\n'
+            while not subscription.closed:
+                event = subscription.get(timeout=_KEEPALIVE)
+                yield event if event is not None else b': keep-alive\n\n'
+        finally:
+            events.bus.unsubscribe(subscription)
+
+    response = make_response(stream(), 200)
+    response.headers['Content-Type'] = 'text/event-stream'
+    response.headers['Cache-Control'] = 'no-cache'
     return response
 
 
 @smrt('/light/<string:name>',
       produces='application/se.novafaen.prism.light.v1+json')
+@_instrumented
 def get_light(name):
     """Endpoint to get a single light by name.
 
+    Query parameter ``max_age=<seconds>`` reads state from light if last known
+    state is older.
+
+    Responds ``304 Not Modified`` if ``If-None-Match`` matches light version.
+
     :returns: ``se.novafaen.prism.light.v1+json``
     """
     light = prism.get_light(name)
@@ -116,9 +570,17 @@ def get_light(name):
     if light is None:
         raise ResouceNotFound('Could not find light \'{}\''.format(name))
 
-    response_body = light.json()
-    response = make_response(jsonify(response_body), 200)
+    max_age = _query_integer('max_age')
+    if max_age is not None:
+        prism.get_state(light, max_age=max_age)
+
+    etag = _etag(light.get_version())
+    if request.headers.get('If-None-Match') == etag:
+        return _not_modified(etag)
+
+    response = make_response(light.json_bytes(), 200)
     response.headers['Content-Type'] = 'application/se.novafaen.prism.light.v1+json'
+    response.headers['ETag'] = etag
     return response
 
 
@@ -126,27 +588,34 @@ def get_light(name):
       methods=['PUT'],
       consumes='application/se.novafaen.prism.lightstate.v1+json',
       produces='application/se.novafaen.prism.light.v1+json')
+@_instrumented
 def put_light_state(name):
     """Endpoint to update light state, identified by name.
 
+    Query parameter ``async=true`` queues the state change and responds with
+    ``202 Accepted`` immediately, see ``/operations/<id>`` for progress.
+
     :body: ``se.novafaen.prism.lightstate.v1+json``
-    :returns: ``se.novafaen.prism.light.v1+json``
+    :returns: ``se.novafaen.prism.light.v1+json`` or ``se.novafaen.prism.operation.v1+json``
     """
     light = prism.get_light(name)
 
     if light is None:
         raise ResouceNotFound('Could not find requested light \'{}\', it might be offline.'.format(name))
 
-    data = json.loads(request.data)
+    state = _to_light_state(json.loads(request.data))
 
-    state = LightState(
-        power=data.get('power', None),
-        duration=data.get('duration', None),
-        brightness=data.get('brightness', None),
-        color=data.get('color', None),
-        kelvin=data.get('kelvin', None))
+    if _query_flag('async'):
+        operation = prism.set_state_async(light, state)
+        response = make_response(jsonify(operation.json()), 202)
+        response.headers['Content-Type'] = 'application/se.novafaen.prism.operation.v1+json'
+        response.headers['Location'] = '/operations/{}'.format(operation.id)
+        return response
 
-    light.set_state(state)
+    try:
+        light.set_state(state)
+    except DeviceUnavailableError as err:
+        return _unavailable(name, err)
 
     response_body = light.json()
     response = make_response(jsonify(response_body), 200)
@@ -154,9 +623,218 @@ def put_light_state(name):
     return response
 
 
+@smrt('/lights/state',
+      methods=['PUT'],
+      consumes='application/se.novafaen.prism.lightstates.v1+json',
+      produces='application/se.novafaen.prism.lightstateresults.v1+json')
+@_instrumented
+def put_lights_state():
+    """Endpoint to update state for many lights in one request.
+
+    Lights are updated concurrently, result is reported per light. An invalid
+    state fails only its own light.
+
+    :body: ``se.novafaen.prism.lightstates.v1+json``
+    :returns: ``se.novafaen.prism.lightstateresults.v1+json``
+    """
+    data = json.loads(request.data)
+
+    states, invalid = [], {}
+    for index, entry in enumerate(data['lights']):
+        try:
+            states.append((entry['name'], _to_light_state(entry['state'])))
+        except TypeError as err:
+            log.debug('invalid state for light "%s": %s', entry['name'], err)
+            invalid[index] = (entry['name'], None, False)
+
+    results = iter(prism.set_states(states))
+    return _results_response([invalid[index] if index in invalid else next(results)
+                              for index in range(len(data['lights']))])
+
+
+def _results_response(results):
+    response_body = {
+        'lights': [{
+            'name': name,
+            'successful': successful,
+            'light': light.json() if light is not None else None
+        } for name, light, successful in results]
+    }
+    response = make_response(jsonify(response_body), 200)
+    response.headers['Content-Type'] = 'application/se.novafaen.prism.lightstateresults.v1+json'
+    return response
+
+
+@smrt('/operations/<string:operation_id>',
+      produces='application/se.novafaen.prism.operation.v1+json')
+@_instrumented
+def get_operation(operation_id):
+    """Endpoint to get status of a queued state change.
+
+    :returns: ``se.novafaen.prism.operation.v1+json``
+    """
+    operation = prism.get_operation(operation_id)
+
+    if operation is None:
+        raise ResouceNotFound('Could not find operation \'{}\''.format(operation_id))
+
+    response = make_response(jsonify(operation.json()), 200)
+    response.headers['Content-Type'] = 'application/se.novafaen.prism.operation.v1+json'
+    return response
+
+
+@smrt('/group/<string:name>',
+      produces='application/se.novafaen.prism.group.v1+json')
+@_instrumented
+def get_group(name):
+    """Endpoint to get a group of lights by name.
+
+    :returns: ``se.novafaen.prism.group.v1+json``
+    """
+    lights = prism.get_group(name)
+
+    if lights is None:
+        raise ResouceNotFound('Could not find group \'{}\''.format(name))
+
+    return _group_response(name, lights)
+
+
+@smrt('/group/<string:name>/state',
+      methods=['PUT'],
+      consumes='application/se.novafaen.prism.lightstate.v1+json',
+      produces='application/se.novafaen.prism.lightstateresults.v1+json')
+@_instrumented
+def put_group_state(name):
+    """Endpoint to update state for all lights in group, identified by name.
+
+    State is applied per light, concurrently, not as a protocol group
+    broadcast, result is reported per light.
+
+    :body: ``se.novafaen.prism.lightstate.v1+json``
+    :returns: ``se.novafaen.prism.lightstateresults.v1+json``
+    """
+    state = _to_light_state(json.loads(request.data))
+
+    results = prism.set_group_state(name, state)
+
+    if results is None:
+        raise ResouceNotFound('Could not find group \'{}\''.format(name))
+
+    return _results_response(results)
+
+
+@smrt('/scenes',
+      produces='application/se.novafaen.prism.scenes.v1+json')
+@_instrumented
+def get_scenes():
+    """Endpoint to get all configured scenes.
+
+    :returns: ``se.novafaen.prism.scenes.v1+json``
+    """
+    response_body = {
+        'scenes': [scene.json() for scene in prism.get_scenes()]
+    }
+    response = make_response(jsonify(response_body), 200)
+    response.headers['Content-Type'] = 'application/se.novafaen.prism.scenes.v1+json'
+    return response
+
+
+@smrt('/scene/<string:name>/apply',
+      methods=['PUT'],
+      produces='application/se.novafaen.prism.lightstateresults.v1+json')
+@_instrumented
+def put_scene_apply(name):
+    """Endpoint to apply scene, identified by name.
+
+    Lights are updated concurrently, result is reported per light.
+
+    :returns: ``se.novafaen.prism.lightstateresults.v1+json``
+    """
+    results = prism.apply_scene(name)
+
+    if results is None:
+        raise ResouceNotFound('Could not find scene \'{}\''.format(name))
+
+    return _results_response(results)
+
+
+@smrt('/effects',
+      produces='application/se.novafaen.prism.effects.v1+json')
+@_instrumented
+def get_effects():
+    """Endpoint to get all configured, and running, effects.
+
+    :returns: ``se.novafaen.prism.effects.v1+json``
+    """
+    response_body = {
+        'effects': [effect.json() for effect in prism.get_effects()],
+        'running': [run.json() for run in prism.get_running_effects()]
+    }
+    response = make_response(jsonify(response_body), 200)
+    response.headers['Content-Type'] = 'application/se.novafaen.prism.effects.v1+json'
+    return response
+
+
+@smrt('/effect/<string:name>/start',
+      methods=['PUT'],
+      consumes='application/se.novafaen.prism.effectlights.v1+json',
+      produces='application/se.novafaen.prism.effectrun.v1+json')
+@_instrumented
+def put_effect_start(name):
+    """Endpoint to start effect, identified by name, on lights.
+
+    Lights running another effect are taken over, lights not found are omitted.
+
+    :body: ``se.novafaen.prism.effectlights.v1+json``
+    :returns: ``se.novafaen.prism.effectrun.v1+json``
+    """
+    data = json.loads(request.data)
+
+    run = prism.start_effect(name, data['lights'])
+
+    if run is None:
+        raise ResouceNotFound('Could not find effect \'{}\''.format(name))
+
+    return _run_response(run)
+
+
+@smrt('/effect/<string:name>/stop',
+      methods=['PUT'],
+      produces='application/se.novafaen.prism.effectrun.v1+json')
+@_instrumented
+def put_effect_stop(name):
+    """Endpoint to stop running effect, identified by name, lights keep their current state.
+
+    :returns: ``se.novafaen.prism.effectrun.v1+json``
+    """
+    run = prism.stop_effect(name)
+
+    if run is None:
+        raise ResouceNotFound('Effect \'{}\' is not running'.format(name))
+
+    return _run_response(run)
+
+
+def _run_response(run):
+    response = make_response(jsonify(run.json()), 200)
+    response.headers['Content-Type'] = 'application/se.novafaen.prism.effectrun.v1+json'
+    return response
+
+
+def _group_response(name, lights):
+    response_body = {
+        'name': name,
+        'lights': [light.json() for light in lights]
+    }
+    response = make_response(jsonify(response_body), 200)
+    response.headers['Content-Type'] = 'application/se.novafaen.prism.group.v1+json'
+    return response
+
+
 @smrt('/light/<string:name>/state/power/on',
       methods=['PUT'],
       produces='application/se.novafaen.prism.light.v1+json')
+@_instrumented
 def put_power_on(name):
     """Endpoint to turn on light, identified by name.
 
@@ -168,6 +846,7 @@ def put_power_on(name):
 @smrt('/light/<string:name>/state/power/off',
       methods=['PUT'],
       produces='application/se.novafaen.prism.light.v1+json')
+@_instrumented
 def put_power_off(name):
     """Endpoint to turn off light, identified by name.
 
@@ -179,21 +858,77 @@ def put_power_off(name):
 @smrt('/light/<string:name>/state/power/toggle',
       methods=['PUT'],
       produces='application/se.novafaen.prism.light.v1+json')
+@_instrumented
 def put_power_toggle(name):
-    """Endpoint to turn off light, identified by name.
+    """Endpoint to toggle power of light, identified by name.
+
+    Power is toggled from state read from light, unless state is known within
+    ``max_state_age`` seconds.
 
     :returns: ``application/se.novafaen.prism.light.v1+json``
     """
     return _toggle(name)
 
 
+def _to_light_state(data):
+    """Create ``LightState`` from ``se.novafaen.prism.lightstate.v1+json`` body."""
+    return LightState(
+        power=data.get('power', None),
+        duration=data.get('duration', None),
+        brightness=data.get('brightness', None),
+        color=data.get('color', None),
+        kelvin=data.get('kelvin', None))
+
+
+def _unavailable(name, err):
+    """Respond ``503 Service Unavailable``, light failed repeatedly and is not tried until ``Retry-After``."""
+    response_body = {
+        'name': name,
+        'message': 'Light \'{}\' is unavailable, it might be offline.'.format(name)
+    }
+    response = make_response(jsonify(response_body), 503)
+    response.headers['Retry-After'] = str(err.retry_after)
+    return response
+
+
+def _etag(version, representation=''):
+    """Create strong entity tag from state version, and representation if selected by query parameters."""
+    if representation:
+        return '"{}-{}"'.format(version, representation)
+    return '"{}"'.format(version)
+
+
+def _not_modified(etag):
+    response = make_response(b'', 304)
+    response.headers['ETag'] = etag
+    return response
+
+
+def _query_integer(name):
+    """Get integer query parameter, ``None`` if missing or not an integer."""
+    try:
+        return int(request.args[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _query_flag(name):
+    """Get boolean query parameter, i.e. ``?name=true``."""
+    return request.args.get(name, 'false').lower() == 'true'
+
+
+def _query_includes(value):
+    """Get if ``include`` query parameter contains value, i.e. ``?include=a,b``."""
+    return value in request.args.get('include', '').split(',')
+
+
 def _toggle(name):
     light = prism.get_light(name)
 
     if light is None:
         raise ResouceNotFound('Could not find requested light \'{}\', it might be offline.'.format(name))
 
-    state = light.get_state()
+    state = prism.get_state(light)  # toggled from state read from light, unless recently known
 
     return _power(name, not state.power())
 
@@ -204,7 +939,10 @@ def _power(name, on_off):
     if light is None:
         raise ResouceNotFound('Could not find requested light \'{}\', it might be offline.'.format(name))
 
-    light.set_state(LightState(power=on_off))
+    try:
+        light.set_state(LightState(power=on_off))
+    except DeviceUnavailableError as err:
+        return _unavailable(name, err)
 
     response_body = light.json()
     response = make_response(jsonify(response_body), 200)
@@ -0,0 +1,344 @@
+"""Registry module, one index of all lights regardless of protocol.
+
+Lights are keyed by hardware id, e.g. Lifx mac address, and looked up by name
+through a secondary name index, see ``LightIndex``, both single dictionary
+lookups. Names that could not be found are remembered for a while, so a typo or
+an offline light does not trigger a discovery on every request.
+
+Lights are fresh while seen by discovery, or polling. Lights not seen for a
+while are stale, and after a longer while they are gone and evicted, see
+``expire``, so the index is bounded by the lights that are actually around.
+"""
+
+import json
+import logging as loggr
+import threading
+import time
+
+from . import events, metrics
+from .light import next_state_version
+
+log = loggr.getLogger('smrt')
+
+DEFAULT_MISS_TTL = 30  # seconds an unknown name is remembered
+DEFAULT_STALE_AFTER = 300  # seconds since last seen before a light is stale
+DEFAULT_GONE_AFTER = 86400  # seconds since last seen before a light is evicted
+DEFAULT_MAX_REMOVED = 1000  # removed lights remembered for clients following ``since``
+
+FRESH = 'fresh'
+STALE = 'stale'
+GONE = 'gone'
+
+
+def freshness(light, now, stale_after=DEFAULT_STALE_AFTER, gone_after=DEFAULT_GONE_AFTER):
+    """Get freshness of light, from when it was last seen.
+
+    Lights marked stale are stale until seen again. Lights restored from
+    snapshot are given ``stale_after`` from when they were restored to be
+    confirmed, however long ago they were last seen.
+
+    :param light: ``LightProtocol`` light
+    :param now: ``Integer`` current timestamp
+    :param stale_after: ``Integer`` seconds since last seen before light is stale
+    :param gone_after: ``Integer`` seconds since last seen before light is gone
+    :returns: ``String`` ``FRESH``, ``STALE`` or ``GONE``
+    """
+    age = now - light.get_last_seen()
+
+    if age >= gone_after:
+        return GONE
+
+    restored = light.get_restored()
+    if restored is not None:
+        age = now - restored  # not yet confirmed by discovery
+    if age >= stale_after or light.is_stale():
+        return STALE
+    return FRESH
+
+
+def expire(lights, stale_after=DEFAULT_STALE_AFTER, gone_after=DEFAULT_GONE_AFTER, max_lights=None):
+    """Mark lights not seen recently as stale, and select lights to evict.
+
+    Gone lights are evicted. If more than ``max_lights`` remain, the least
+    recently seen lights are evicted too.
+
+    :param lights: ``[LightProtocol]`` all known lights
+    :param stale_after: ``Integer`` seconds since last seen before light is stale
+    :param gone_after: ``Integer`` seconds since last seen before light is evicted
+    :param max_lights: ``Integer`` maximum lights kept, ``None`` is unlimited
+    :returns: (``[LightProtocol]``, ``[LightProtocol]``) kept and evicted lights
+    """
+    now = int(time.time())
+    kept = []
+    evicted = []
+
+    for light in lights:
+        fresh = freshness(light, now, stale_after, gone_after)
+
+        if fresh == GONE:
+            evicted.append(light)
+            continue
+
+        if fresh == STALE and not light.is_stale():
+            log.debug('light "%s" not seen for %is, marked stale', light.get_name(), now - light.get_last_seen())
+            light.mark_stale(light.get_last_seen())
+        kept.append(light)
+
+    if max_lights is not None and len(kept) > max_lights:
+        kept.sort(key=lambda light: light.get_last_seen(), reverse=True)
+        evicted.extend(kept[max_lights:])
+        kept = kept[:max_lights]
+
+    if evicted:
+        log.info('evicted %i lights: %s', len(evicted), ','.join(light.get_name() for light in evicted))
+
+    return kept, evicted
+
+
+class LightIndex:
+    """Lights keyed by hardware id, with a secondary name index.
+
+    Names are user editable, a renamed light keeps its entry. Lights with the
+    same name do not overwrite each other, the name is looked up to the most
+    recently indexed light, other lights are still found by id.
+
+    Not thread safe, callers synchronize, or replace the index instead.
+    """
+
+    def __init__(self, lights=()):
+        """Create and initialize ``LightIndex``.
+
+        :param lights: ``[LightProtocol]`` lights to index
+        """
+        self._lights = {}  # hardware id to light
+        self._names = {}  # name to hardware id
+
+        for light in lights:
+            self.add(light)
+
+    def __contains__(self, light_id):
+        """Get if light with hardware id is indexed."""
+        return light_id in self._lights
+
+    def __len__(self):
+        """Get number of indexed lights."""
+        return len(self._lights)
+
+    def ids(self):
+        """Get hardware ids of all indexed lights.
+
+        :returns: ``KeysView``
+        """
+        return self._lights.keys()
+
+    def values(self):
+        """Get all indexed lights.
+
+        :returns: ``[LightProtocol]``
+        """
+        return list(self._lights.values())
+
+    def get(self, light_id):
+        """Get light by hardware id.
+
+        :param light_id: ``String`` hardware id, see ``LightProtocol.get_id``
+        :returns: ``LightProtocol`` or ``None``
+        """
+        return self._lights.get(light_id)
+
+    def find(self, name):
+        """Get light by name.
+
+        :param name: ``String`` light name
+        :returns: ``LightProtocol`` or ``None``
+        """
+        light_id = self._names.get(name)
+        return self._lights.get(light_id) if light_id is not None else None
+
+    def add(self, light):
+        """Index light, replaces light with same hardware id.
+
+        :param light: ``LightProtocol`` light
+        """
+        previous = self._lights.get(light.get_id())
+        if previous is not None:
+            self._unindex_name(previous.get_name(), previous.get_id())
+
+        self._lights[light.get_id()] = light
+        self._index_name(light)
+
+    def rename(self, light, name):
+        """Rename indexed light, e.g. when its label changed on device.
+
+        :param light: ``LightProtocol`` indexed light
+        :param name: ``String`` new name
+        """
+        if light.get_name() == name:
+            return
+
+        log.info('light %s renamed from "%s" to "%s"', light.get_id(), light.get_name(), name)
+        self._unindex_name(light.get_name(), light.get_id())
+        light.rename(name)
+        self._index_name(light)
+
+    def pop(self, light_id):
+        """Remove light from index.
+
+        :param light_id: ``String`` hardware id
+        :returns: ``LightProtocol`` or ``None`` if not indexed
+        """
+        light = self._lights.pop(light_id, None)
+        if light is not None:
+            self._unindex_name(light.get_name(), light_id)
+        return light
+
+    def clear(self):
+        """Remove all lights from index."""
+        self._lights.clear()
+        self._names.clear()
+
+    def _index_name(self, light):
+        owner = self._names.get(light.get_name())
+        if owner is not None and owner != light.get_id():
+            log.warning('lights %s and %s are both named "%s", name refers to %s',
+                        owner, light.get_id(), light.get_name(), light.get_id())
+        self._names[light.get_name()] = light.get_id()
+
+    def _unindex_name(self, name, light_id):
+        """Remove name, if it refers to light, another light with same name takes it over."""
+        if self._names.get(name) != light_id:
+            return
+
+        del self._names[name]
+        for other in self._lights.values():  # only when lights share a name
+            if other.get_name() == name and other.get_id() != light_id:
+                self._names[name] = other.get_id()
+                break
+
+
+class Registry:
+    """Name to light index across all protocols."""
+
+    def __init__(self, refresh, miss_ttl=DEFAULT_MISS_TTL, max_removed=DEFAULT_MAX_REMOVED):
+        """Create and initialize ``Registry``.
+
+        :param refresh: ``Function`` without arguments that performs discovery,
+                        concurrent calls are expected to share one discovery
+        :param miss_ttl: ``Integer`` seconds to remember unknown names
+        :param max_removed: ``Integer`` removed lights to remember, see ``get_removed``
+        """
+        self._refresh = refresh
+        self._miss_ttl = miss_ttl
+        self._max_removed = max_removed
+        self._lights = LightIndex()
+        self._misses = {}  # name to monotonic time it may be looked for again
+        self._misses_lock = threading.Lock()  # written by lookups and discovery concurrently
+        self._removed = {}  # hardware id to version it was removed at, oldest first
+        self._removed_horizon = 0  # removals up to this version are forgotten
+        self._removed_lock = threading.Lock()
+
+    def update(self, lights):
+        """Replace index with discovered lights.
+
+        Lights added to index are given a new version, and removed lights are
+        remembered, so clients following ``since`` learn about both.
+
+        :param lights: ``[LightProtocol]`` all known lights
+        """
+        now = time.monotonic()
+        previous = self._lights
+
+        self._lights = LightIndex(lights)  # swapped, readers never see partial index
+        added = self._lights.ids() - previous.ids()
+        removed = previous.ids() - self._lights.ids()
+
+        # after index is swapped, clients that got lights before are told about changes in next request
+        for light_id in added:
+            self._lights.get(light_id).renew_version()
+
+        version = next_state_version() if removed else None  # lights removed at
+        with self._removed_lock:
+            self._removed.update((light_id, version) for light_id in removed)
+            for light_id in added:
+                self._removed.pop(light_id, None)
+            while len(self._removed) > self._max_removed:  # oldest removal first
+                self._removed_horizon = self._removed.pop(next(iter(self._removed)))
+
+        self._publish(previous, added, removed, version)
+
+        with self._misses_lock:
+            self._misses = {name: expires for name, expires in self._misses.items()
+                            if expires > now and self._lights.find(name) is None}
+
+    def _publish(self, previous, added, removed, version):
+        """Publish events for lights that appeared, or were removed, since previous index."""
+        if not events.bus.has_subscribers():
+            return
+
+        for light_id in added:
+            light = self._lights.get(light_id)
+            events.bus.publish(events.LIGHT_APPEARED, light.get_version(), light.json_bytes())
+
+        for light_id in removed:
+            data = {'id': light_id, 'name': previous.get(light_id).get_name()}
+            events.bus.publish(events.LIGHT_REMOVED, version, json.dumps(data).encode())
+
+    def get_removed(self, since):
+        """Get hardware ids of lights removed after version.
+
+        Only the ``max_removed`` most recent removals are remembered.
+
+        :param since: ``Integer`` state version, see ``state_version``
+        :returns: ``[String]`` hardware ids, or ``None`` if removals after version are no longer known
+        """
+        with self._removed_lock:
+            if since < self._removed_horizon:
+                return None
+            return [light_id for light_id, version in self._removed.items() if version > since]
+
+    def get_lights(self, include_stale=True):
+        """Get all indexed lights.
+
+        :param include_stale: ``Boolean`` include stale lights, see ``freshness``
+        :returns: ``[LightProtocol]``
+        """
+        if include_stale:
+            return self._lights.values()
+        return [light for light in self._lights.values() if not light.is_stale()]
+
+    def _find(self, name):
+        """Get light by name, or by hardware id."""
+        lights = self._lights
+        light = lights.find(name)
+        return light if light is not None else lights.get(name)
+
+    def get_light(self, name):
+        """Get light identified by name, or hardware id, discover if name is unknown.
+
+        :param name: ``String`` light name, or hardware id
+        :returns: ``LightProtocol`` or ``None``
+        """
+        light = self._find(name)
+
+        if light is not None:
+            metrics.lookup_total.inc('hit')
+            return light
+
+        with self._misses_lock:
+            missed = self._misses.get(name, 0) > time.monotonic()
+
+        if missed:
+            metrics.lookup_total.inc('negative')
+            return None  # recently looked for, and not found
+
+        metrics.lookup_total.inc('miss')
+        self._refresh()
+
+        light = self._find(name)
+
+        if light is None:
+            log.debug('light "%s" not found, will not look again for %is', name, self._miss_ttl)
+            with self._misses_lock:
+                self._misses[name] = time.monotonic() + self._miss_ttl
+
+        return light
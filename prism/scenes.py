@@ -0,0 +1,139 @@
+"""Scenes module, state for many lights applied together.
+
+Scenes are configured once and applied many times. Each light state in a scene
+is validated once, when the scene is created, and compiled once per light into
+ready to send commands, see ``LightProtocol.compile_state``, unless commands
+are built from last known state of light, e.g. Lifx brightness without color.
+Applying a scene only sends compiled commands, to all lights concurrently.
+"""
+
+import logging as loggr
+
+from .health import DeviceUnavailableError
+from .light import LightState
+
+log = loggr.getLogger('smrt')
+
+
+class Scene:
+    """Scene, a named state per light."""
+
+    def __init__(self, name, states):
+        """Create and initialize ``Scene``.
+
+        :param name: ``String`` unique scene name
+        :param states: ``[(String, LightState)]`` light name and state
+        """
+        self.name = name
+        self.states = states
+
+    def json(self):
+        """Return json representation of scene, i.e. ``Dict``.
+
+        :returns: ``Dict`` json representation.
+        """
+        return {
+            'name': self.name,
+            'lights': [{'name': name, 'state': state.json()} for name, state in self.states]
+        }
+
+    def __repr__(self):
+        """Return string representation.
+
+        :returns: ``String``
+        """
+        return '<Scene name="{}" lights={}>'.format(self.name, len(self.states))
+
+
+class SceneEngine:
+    """Apply scenes with compiled commands, compiled commands are cached per light."""
+
+    def __init__(self, scenes, get_light, executor):
+        """Create and initialize ``SceneEngine``.
+
+        :param scenes: ``[Scene]`` all scenes
+        :param get_light: ``Function`` light name to ``LightProtocol`` or ``None``
+        :param executor: ``Executor`` lights in a scene are applied on
+        """
+        self._scenes = {scene.name: scene for scene in scenes}
+        self._get_light = get_light
+        self._executor = executor
+        self._plans = {}  # (scene name, light name) to (light, plan)
+
+    @classmethod
+    def from_configuration(cls, configuration, get_light, executor):
+        """Create ``SceneEngine`` from configured scenes, states are validated once.
+
+        Scenes with an invalid state are left out, and logged.
+
+        :param configuration: ``[Dict]`` configured scenes, see configuration schema
+        :param get_light: ``Function`` light name to ``LightProtocol`` or ``None``
+        :param executor: ``Executor`` lights in a scene are applied on
+        :returns: ``SceneEngine``
+        """
+        scenes = []
+        for scene in configuration:
+            try:
+                states = [(light['name'], LightState(**light['state'])) for light in scene['lights']]
+            except TypeError as err:
+                log.warning('scene "%s" is not valid, ignored: %s', scene['name'], err)
+                continue
+            scenes.append(Scene(scene['name'], states))
+
+        return cls(scenes, get_light, executor)
+
+    def get_scenes(self):
+        """Get all scenes.
+
+        :returns: ``[Scene]``
+        """
+        return list(self._scenes.values())
+
+    def apply(self, name):
+        """Apply scene, all lights concurrently.
+
+        Lights not found, or unavailable, are reported as not successful.
+
+        :param name: ``String`` scene name
+        :returns: ``[(String, LightProtocol, Boolean)]`` or ``None`` if there is no such scene
+        """
+        scene = self._scenes.get(name)
+
+        if scene is None:
+            return None
+
+        futures = [self._executor.submit(self._apply, scene.name, light_name, state)
+                   for light_name, state in scene.states]
+        return [future.result() for future in futures]
+
+    def _apply(self, scene_name, light_name, state):
+        light = self._get_light(light_name)
+
+        if light is None:
+            return light_name, None, False
+
+        try:
+            return light_name, light, light.apply_plan(self._plan(scene_name, light, state))
+        except DeviceUnavailableError as err:
+            log.debug('scene "%s" skipped light "%s": %s', scene_name, light_name, err)
+            return light_name, light, False
+        except Exception as err:  # pylint: disable=broad-except
+            log.warning('scene "%s" could not set light "%s": %s', scene_name, light_name, err)
+            return light_name, light, False
+
+    def _plan(self, scene_name, light, state):
+        """Get compiled state for light, compiled on first use, and again if light is rediscovered.
+
+        Plans built from last known state of light are compiled every time, see ``Plan.reusable``.
+        """
+        key = (scene_name, light.get_name())
+
+        cached = self._plans.get(key)
+        if cached is not None and cached[0] is light:
+            return cached[1]
+
+        plan = light.compile_state(state)
+        if plan.reusable:
+            self._plans[key] = (light, plan)
+
+        return plan
@@ -3,6 +3,6 @@
 Implements YeeLight protocol for prism.
 """
 
-from .yeelight import get_lights, get_light
+from .yeelight import evict_lights, get_lights, get_light, get_cached_lights, refresh_lights, restore_lights
 
-__all__ = ['get_light', 'get_lights']
+__all__ = ['evict_lights', 'get_cached_lights', 'get_light', 'get_lights', 'refresh_lights', 'restore_lights']
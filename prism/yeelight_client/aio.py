@@ -0,0 +1,405 @@
+"""Asyncio YeeLight vendor/protocol implementation.
+
+Discovers bulbs with SSDP-like multicast search, and talks to bulbs over
+persistent, pipelined, TCP connections on one event loop. Implements the same
+protocol client functions as ``yeelight``, blocking functions run on the event
+loop, see ``prism.aio.run``.
+
+See YeeLight Inter-Operation Specification for protocol details.
+"""
+
+import asyncio
+import json
+import logging
+from urllib.parse import urlparse
+
+from prism import aio
+from prism.light import LightState
+from prism.registry import LightIndex
+from .connection import PORT, ConnectionLost, compile_commands
+from .yeelight import _PROPERTIES, _to_commands, _to_light_states
+
+_cache = LightIndex()  # keyed by yeelight id
+_connections = {}
+
+DISCOVERY_TIMEOUT = 2  # seconds to wait for bulbs to respond to discovery
+REQUEST_TIMEOUT = 5  # seconds to wait for bulb response
+
+_search_address = ('239.255.255.250', 1982)
+
+log = logging.getLogger('smrt')
+
+
+def configure(search_address='239.255.255.250', port=1982):
+    """Configure where discovery search is sent.
+
+    :param search_address: ``String`` multicast, or unicast, address
+    :param port: ``Integer`` port bulbs listen to for search
+    """
+    global _search_address  # pylint: disable=global-statement
+    _search_address = (search_address, port)
+
+
+def get_lights():
+    """Discover lights on Local Area Network.
+
+    :returns: ``[LightProtocol]``
+    """
+    return aio.run(discover(), timeout=DISCOVERY_TIMEOUT + aio.DEFAULT_TIMEOUT)
+
+
+def refresh_lights():
+    """Refresh known lights with direct requests to each light, without discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    return aio.run(refresh())
+
+
+def get_cached_lights():
+    """Get lights from cache, without doing discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    return _cache.values()
+
+
+def evict_lights(ids):
+    """Remove lights from cache, e.g. lights not seen for a long time.
+
+    Connections to bulbs no longer in cache are closed.
+
+    :param ids: ``[String]`` hardware ids of lights to remove
+    """
+    aio.run(_evict(ids))
+
+
+async def _evict(ids):
+    """Remove lights from cache on event loop, where connections are used."""
+    evicted = [_cache.pop(light_id) for light_id in ids if light_id in _cache]
+
+    in_use = {light._device_address for light in _cache.values()}  # pylint: disable=protected-access
+    for light in evicted:
+        address = light._device_address  # pylint: disable=protected-access
+        if address not in in_use and address in _connections:
+            _connections.pop(address).close()
+
+
+def get_light(name):
+    """Discover single light identified by name.
+
+    :returns: ``LightProtocol`` or ``None``
+    """
+    if _cache.find(name) is None:
+        get_lights()  # do nothing with response
+
+    return _cache.find(name)
+
+
+def restore_lights(snapshots):
+    """Restore lights from snapshots, restored lights are stale until discovered.
+
+    Snapshots for other protocols are ignored, already known lights are renamed if renamed in snapshot.
+
+    :param snapshots: ``[Dict]`` see ``LightProtocol.snapshot``
+    :returns: ``[LightProtocol]`` restored lights
+    """
+    restored = []
+
+    for snapshot in snapshots:
+        if snapshot['protocol'] != AsyncYeelightLight.protocol():
+            continue
+
+        if snapshot['id'] in _cache:
+            _cache.rename(_cache.get(snapshot['id']), snapshot['name'])
+            continue
+
+        try:
+            address = snapshot['address']
+            light = AsyncYeelightLight(
+                snapshot['name'],
+                snapshot['id'],
+                (address['ip'], address.get('port', PORT)),
+                state=LightState(**snapshot['state']))
+        except (KeyError, TypeError) as err:
+            log.warning('could not restore yeelight light "%s": %s', snapshot['name'], err)
+            continue
+
+        light.mark_restored(snapshot['last_seen'])
+        _cache.add(light)
+        restored.append(light)
+
+    return restored
+
+
+async def discover(timeout=DISCOVERY_TIMEOUT):
+    """Discover lights on Local Area Network, state is part of discovery response.
+
+    :param timeout: ``Integer`` seconds to wait for bulbs to respond
+    :returns: ``[LightProtocol]``
+    """
+    transport, search = await asyncio.get_running_loop().create_datagram_endpoint(
+        _Search, local_addr=('0.0.0.0', 0), allow_broadcast=True)
+    try:
+        transport.sendto(_search_message(), _search_address)
+        await asyncio.sleep(timeout)
+    finally:
+        transport.close()
+
+    responses = list(search.responses.values())
+
+    # state for all lights converted at once
+    states = _to_light_states([[headers.get(prop) for prop in _PROPERTIES] for headers in responses])
+
+    for headers, state in zip(responses, states):
+        location = urlparse(headers['location'])  # yeelight://ip:port
+        light_id = headers['id']
+        name = headers.get('name') or light_id  # unnamed bulbs by id
+        light = _cache.get(light_id)
+
+        if light is None:
+            _cache.add(AsyncYeelightLight(name, light_id, (location.hostname, location.port or PORT), state=state))
+        else:
+            _cache.rename(light, name)
+            light.update_state(state)
+
+    log.debug('yeelight discovered %i lights', len(search.responses))
+
+    return _cache.values()
+
+
+async def refresh():
+    """Read state of known lights concurrently, without discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    lights = _cache.values()
+    responses = await asyncio.gather(*[light.get_state_async() for light in lights], return_exceptions=True)
+
+    refreshed = 0
+    for light, response in zip(lights, responses):
+        if isinstance(response, Exception):
+            log.warning('could not get state for yeelight light %s', light.get_name())
+        else:
+            refreshed += 1
+
+    log.debug('refreshed %i of %i known yeelight lights', refreshed, len(lights))
+
+    return _cache.values()
+
+
+def _search_message():
+    return 'M-SEARCH * HTTP/1.1\r\n' \
+           'HOST: {}:{}\r\n' \
+           'MAN: "ssdp:discover"\r\n' \
+           'ST: wifi_bulb\r\n'.format(*_search_address).encode()
+
+
+class _Search(asyncio.DatagramProtocol):
+    """Collect search responses, keyed by bulb id."""
+
+    def __init__(self):
+        self.responses = {}
+
+    def datagram_received(self, data, addr):
+        headers = {}
+        for line in data.decode(errors='replace').split('\r\n')[1:]:
+            key, separator, value = line.partition(':')
+            if separator:
+                headers[key.strip().lower()] = value.strip()
+
+        if 'id' in headers and headers.get('location', '').startswith('yeelight://'):
+            self.responses[headers['id']] = headers
+
+
+def _get_connection(address):
+    if address not in _connections:
+        _connections[address] = AsyncConnection(address)
+    return _connections[address]
+
+
+class AsyncConnection:
+    """Persistent, pipelined, connection to a single bulb, see ``connection.Connection``."""
+
+    def __init__(self, address):
+        """Create and initialize ``AsyncConnection``, connection is opened on first use.
+
+        :param address: (``String``, ``Integer``) bulb ip address and port
+        """
+        self._address = address
+        self._reader = None
+        self._writer = None
+        self._connecting = None  # task opening connection, shared by concurrent callers
+        self._pending = {}
+        self._request_id = 0
+
+    def close(self):
+        """Close connection, pending requests fail, must be called on event loop."""
+        if self._writer is not None:
+            self._writer.close()  # reader sees end of stream, and fails pending requests
+
+    async def send_commands(self, commands):
+        """Send commands in one pipeline.
+
+        An idle connection may have been closed by the bulb, the pipeline is
+        then retried once on a new connection.
+
+        :param commands: ``[(String, List)]`` method and parameters
+        :returns: ``[Dict]`` responses, in same order as commands
+        :raises OSError: if bulb could not be reached
+        :raises asyncio.TimeoutError: if bulb did not respond
+        """
+        return await self.send_compiled(compile_commands(commands))
+
+    async def send_compiled(self, commands):
+        """Send compiled commands in one pipeline, see ``connection.compile_commands``.
+
+        :param commands: ``[Bytes]`` compiled commands
+        :returns: ``[Dict]`` responses, in same order as commands
+        """
+        if not commands:
+            return []
+
+        try:
+            return await self._pipeline(commands)
+        except ConnectionLost as err:  # never after a timeout, bulb may have run commands
+            log.debug('yeelight connection to %s lost, reconnecting: %s', self._address[0], err)
+            return await self._pipeline(commands)
+
+    async def _pipeline(self, commands):
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._connect())
+
+        try:
+            await self._connecting
+        except (OSError, asyncio.TimeoutError):
+            self._connecting = None
+            raise
+
+        futures = {}
+        payload = b''
+        for command in commands:
+            self._request_id += 1
+            future = asyncio.get_running_loop().create_future()
+            self._pending[self._request_id] = future
+            futures[self._request_id] = future
+            payload += command % self._request_id
+
+        try:
+            self._writer.write(payload)
+            await self._writer.drain()
+        except OSError as err:
+            for request_id in futures:
+                self._pending.pop(request_id, None)
+            raise ConnectionLost(str(err)) from err
+
+        try:
+            return await asyncio.wait_for(asyncio.gather(*futures.values()), REQUEST_TIMEOUT)
+        except ConnectionLost as err:
+            if any(future.done() and not future.cancelled() and future.exception() is None
+                   for future in futures.values()):  # bulb has run commands, sending them again is not safe
+                raise ConnectionResetError(str(err)) from err
+            raise
+        finally:
+            for request_id in futures:  # answered requests are already removed, timed out are not
+                self._pending.pop(request_id, None)
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(*self._address), REQUEST_TIMEOUT)
+        asyncio.ensure_future(self._read(self._reader))
+
+    async def _read(self, reader):
+        """Read responses, and resolve pending requests by id, until connection is closed."""
+        error = ConnectionLost('connection closed by bulb')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get('id'), None)  # notifications have no id
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (OSError, ValueError) as err:
+            error = ConnectionLost(str(err))
+
+        if self._reader is reader:
+            self._writer.close()
+            self._reader, self._writer, self._connecting = None, None, None
+
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+class AsyncYeelightLight(aio.AsyncLightProtocol):
+    """Asyncio YeeLight implementation for LightProtocol."""
+
+    # see ``YeelightLight``
+    _command_rate = 1
+    _command_burst = 60
+
+    def __init__(self, name, light_id, address, state=None):
+        """Create and inialize AsyncYeelightLight.
+
+        :param name: name of light, should be unique
+        :param light_id: ``String`` yeelight id
+        :param address: (``String``, ``Integer``) ip address and port
+        """
+        aio.AsyncLightProtocol.__init__(self, state=state)
+        self._name = name
+        self._id = light_id
+        self._device_address = address
+
+    @staticmethod
+    def protocol():
+        """See ``LightProtocol.protocol`` documentation."""
+        return 'Yeelight.v1'
+
+    def get_name(self):
+        """See ``LightProtocol.get_name`` documentation."""
+        return self._name
+
+    def get_id(self):
+        """See ``LightProtocol.get_id`` documentation, yeelight id."""
+        return self._id
+
+    def _address(self):
+        """See ``LightProtocol._address`` documentation."""
+        return {
+            'ip': self._device_address[0],
+            'port': self._device_address[1]
+        }
+
+    def _command_count(self, state):
+        """See ``LightProtocol._command_count`` documentation."""
+        return len(_to_commands(state))
+
+    async def _get_state_async(self):
+        """See ``AsyncLightProtocol.get_state_async`` documentation."""
+        responses = await _get_connection(self._device_address).send_commands([('get_prop', _PROPERTIES)])
+        return _to_light_states([responses[0]['result']])[0]
+
+    def _compile(self, state):
+        """See ``LightProtocol.compile_state`` documentation."""
+        return compile_commands(_to_commands(state))
+
+    async def _apply_async(self, commands):
+        """See ``AsyncLightProtocol.apply_plan`` documentation."""
+        return await self._send(commands)
+
+    async def _set_state_async(self, state):
+        """See ``AsyncLightProtocol.set_state_async`` documentation."""
+        return await self._send(compile_commands(_to_commands(state)))
+
+    async def _send(self, commands):
+        # all commands in one pipeline, bulb executes them in order
+        try:
+            responses = await _get_connection(self._device_address).send_compiled(commands)
+        except (OSError, asyncio.TimeoutError) as err:
+            log.warning('could not set state for yeelight light %s: %s', self._name, err)
+            return False
+
+        return all(response.get('result') == ['ok'] for response in responses)
@@ -0,0 +1,208 @@
+"""Persistent YeeLight connections.
+
+YeeLight bulbs limit how often new connections can be made, every command on a
+new connection quickly hits that limit. Connections are kept open per bulb, and
+commands are pipelined, i.e. all commands are written before responses are
+collected by request id.
+
+See YeeLight Inter-Operation Specification for protocol details.
+"""
+
+import json
+import logging
+import socket
+import threading
+
+log = logging.getLogger('smrt')
+
+PORT = 55443
+TIMEOUT = 5  # seconds
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(ip, port=PORT):
+    """Get persistent connection to bulb, connections are shared per bulb.
+
+    :param ip: ``String`` bulb ip address
+    :param port: ``Integer`` bulb port
+    :returns: ``Connection``
+    """
+    with _connections_lock:
+        if (ip, port) not in _connections:
+            _connections[(ip, port)] = Connection(ip, port)
+        return _connections[(ip, port)]
+
+
+def release_connection(connection):
+    """Close connection, and stop sharing it, e.g. when bulb is gone.
+
+    :param connection: ``Connection`` from ``get_connection``
+    """
+    with _connections_lock:
+        if _connections.get(connection.get_address()) is connection:
+            del _connections[connection.get_address()]
+
+    connection.close()
+
+
+def compile_commands(commands):
+    """Serialize commands once, request id is filled in when sent, see ``Connection.send_compiled``.
+
+    :param commands: ``[(String, List)]`` method and parameters
+    :returns: ``[Bytes]`` json lines, with ``%d`` for request id
+    """
+    return [b'{"id":%d,' + json.dumps({'method': method, 'params': params}).encode()[1:].replace(b'%', b'%%') + b'\r\n'
+            for method, params in commands]
+
+
+class ConnectionLost(ConnectionResetError):
+    """Connection was lost before bulb answered, e.g. idle connection closed by bulb.
+
+    Commands were not written, or bulb closed the connection without answering
+    any of them, they are safe to send again on a new connection.
+    """
+
+
+class Connection:
+    """Persistent, pipelined, connection to a single bulb."""
+
+    def __init__(self, ip, port=PORT, timeout=TIMEOUT):
+        """Create and initialize ``Connection``, socket is opened on first use.
+
+        :param ip: ``String`` bulb ip address
+        :param port: ``Integer`` bulb port
+        :param timeout: ``Integer`` seconds to wait for bulb
+        """
+        self._address = (ip, port)
+        self._timeout = timeout
+        self._lock = threading.Lock()  # one pipeline at a time per bulb
+        self._socket = None
+        self._buffer = b''
+        self._request_id = 0
+
+    def get_address(self):
+        """Get address of bulb.
+
+        :returns: (``String``, ``Integer``) ip address and port
+        """
+        return self._address
+
+    def close(self):
+        """Close socket, a new socket is opened if connection is used again."""
+        with self._lock:
+            self._close()
+
+    def get_ip(self):
+        """Get ip address of bulb.
+
+        :returns: ``String`` ip address
+        """
+        return self._address[0]
+
+    def send_commands(self, commands):
+        """Send commands in one pipeline.
+
+        An idle connection may have been closed by the bulb, the pipeline is
+        then retried once on a new connection. Pipelines the bulb may have run,
+        e.g. timed out waiting for responses, are never retried.
+
+        :param commands: ``[(String, List)]`` method and parameters
+        :returns: ``[Dict]`` responses, in same order as commands
+        :raises OSError: if bulb could not be reached
+        """
+        return self.send_compiled(compile_commands(commands))
+
+    def send_compiled(self, commands):
+        """Send compiled commands in one pipeline, see ``compile_commands`` and ``send_commands``.
+
+        :param commands: ``[Bytes]`` compiled commands
+        :returns: ``[Dict]`` responses, in same order as commands
+        :raises OSError: if bulb could not be reached
+        """
+        if not commands:
+            return []
+
+        with self._lock:
+            try:
+                return self._pipeline(commands)
+            except ConnectionLost as err:
+                log.debug('yeelight connection to %s lost, reconnecting: %s', self._address[0], err)
+                self._close()
+            except OSError:
+                self._close()
+                raise
+
+            try:
+                return self._pipeline(commands)
+            except OSError:
+                self._close()
+                raise
+
+    def send_command(self, method, params):
+        """Send single command, see ``Connection.send_commands``.
+
+        :param method: ``String`` method
+        :param params: ``List`` parameters
+        :returns: ``Dict`` response
+        """
+        return self.send_commands([(method, params)])[0]
+
+    def _pipeline(self, commands):
+        if self._socket is None:
+            self._socket = socket.create_connection(self._address, timeout=self._timeout)
+            self._buffer = b''
+
+        request_ids = []
+        payload = b''
+        for command in commands:
+            self._request_id += 1
+            request_ids.append(self._request_id)
+            payload += command % self._request_id
+
+        try:
+            self._socket.sendall(payload)
+        except (socket.timeout, TimeoutError):  # part of pipeline may have been written
+            raise
+        except OSError as err:
+            raise ConnectionLost(str(err)) from err
+
+        responses = {}
+        while len(responses) < len(request_ids):
+            try:
+                line = self._readline()
+            except ConnectionResetError as err:
+                if responses:  # bulb has run commands, sending them again is not safe
+                    raise ConnectionResetError(str(err)) from err
+                raise ConnectionLost(str(err)) from err
+
+            try:
+                response = json.loads(line)
+            except ValueError:
+                self._close()  # stream out of sync, responses can not be matched to requests
+                raise
+
+            if response.get('id') in request_ids:  # skip notifications, and late responses
+                responses[response['id']] = response
+
+        return [responses[request_id] for request_id in request_ids]
+
+    def _readline(self):
+        while b'\n' not in self._buffer:
+            data = self._socket.recv(4096)
+            if not data:
+                raise ConnectionResetError('connection closed by bulb')
+            self._buffer += data
+
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line.decode()
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._buffer = b''
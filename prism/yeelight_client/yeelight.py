@@ -3,14 +3,25 @@
 Uses third party library yeelight, see https://gitlab.com/stavros/python-yeelight
 """
 
+from concurrent.futures import ThreadPoolExecutor, wait
 import logging
 
 import yeelight
-from yeelight import Bulb
 
-from prism.light import LightProtocol
+from prism.color import clamp_kelvin, int_to_rgb, rgb_to_int
+from prism.light import LightProtocol, LightState
+from prism.registry import LightIndex
+from .connection import compile_commands, get_connection, release_connection
 
-_cache = {}
+_cache = LightIndex()  # keyed by yeelight id
+
+# bounded pool used to poll device state, one device per worker
+_MAX_WORKERS = 8
+_POLL_TIMEOUT = 5  # seconds, per device
+_executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix='prism-yeelight')
+
+_PROPERTIES = ['power', 'bright', 'ct', 'rgb']
+_MIN_DURATION = 30  # milliseconds, shortest smooth transition bulbs accept
 
 log = logging.getLogger('smrt')
 
@@ -23,12 +34,103 @@ def get_lights():
     raw_lights = yeelight.discover_bulbs()
     log.debug('yeelight discovered %i lights', len(raw_lights))
 
-    for raw_light in raw_lights:
-        name = raw_light['capabilities']['name']
-        if name not in _cache:
-            _cache[name] = YeelightLight(name, Bulb(raw_light['ip']))
+    # state for all lights converted at once
+    states = _to_light_states([[raw_light['capabilities'].get(prop) for prop in _PROPERTIES]
+                               for raw_light in raw_lights])
+
+    for raw_light, state in zip(raw_lights, states):
+        light_id = raw_light['capabilities']['id']
+        name = raw_light['capabilities'].get('name') or light_id  # unnamed bulbs by id
+        light = _cache.get(light_id)
+
+        if light is None:
+            _cache.add(YeelightLight(name, light_id, get_connection(raw_light['ip']), state=state))
+        else:
+            _cache.rename(light, name)
+            light.update_state(state)
+
+    return _cache.values()
+
+
+def refresh_lights():
+    """Refresh known lights with direct requests to each light, without discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    lights = _cache.values()
+
+    # poll all devices concurrently, a full refresh takes as long as the slowest device
+    futures = {_executor.submit(light.read_state): light for light in lights}
+    done, _ = wait(futures, timeout=_POLL_TIMEOUT * (1 + len(futures) // _MAX_WORKERS))
+
+    refreshed = 0
+    for future, light in futures.items():
+        if future not in done or future.exception() is not None:
+            log.warning('could not get state for yeelight light %s', light.get_name())
+            continue
+
+        light.update_state(future.result())
+        refreshed += 1
+
+    log.debug('refreshed %i of %i known yeelight lights', refreshed, len(lights))
 
-    return list(_cache.values())
+    return _cache.values()
+
+
+def get_cached_lights():
+    """Get lights from cache, without doing discovery.
+
+    :returns: ``[LightProtocol]``
+    """
+    return _cache.values()
+
+
+def evict_lights(ids):
+    """Remove lights from cache, e.g. lights not seen for a long time.
+
+    Connections to bulbs no longer in cache are closed.
+
+    :param ids: ``[String]`` hardware ids of lights to remove
+    """
+    evicted = [_cache.pop(light_id) for light_id in ids if light_id in _cache]
+
+    in_use = {light._connection for light in _cache.values()}  # pylint: disable=protected-access
+    for light in evicted:
+        if light._connection not in in_use:  # pylint: disable=protected-access
+            release_connection(light._connection)  # pylint: disable=protected-access
+
+
+def restore_lights(snapshots):
+    """Restore lights from snapshots, restored lights are stale until discovered.
+
+    Snapshots for other protocols are ignored, already known lights are renamed if renamed in snapshot.
+
+    :param snapshots: ``[Dict]`` see ``LightProtocol.snapshot``
+    :returns: ``[LightProtocol]`` restored lights
+    """
+    restored = []
+
+    for snapshot in snapshots:
+        if snapshot['protocol'] != YeelightLight.protocol():
+            continue
+
+        if snapshot['id'] in _cache:
+            _cache.rename(_cache.get(snapshot['id']), snapshot['name'])
+            continue
+
+        try:
+            ip = snapshot['address']['ip']
+            light = YeelightLight(snapshot['name'], snapshot['id'], get_connection(ip),
+                                  state=LightState(**snapshot['state']))
+        except (KeyError, TypeError) as err:
+            log.warning('could not restore yeelight light "%s": %s', snapshot['name'], err)
+            continue
+
+        light.mark_restored(snapshot['last_seen'])
+        _cache.add(light)
+        restored.append(light)
+
+    return restored
 
 
 def get_light(name):
@@ -36,29 +138,33 @@ def get_light(name):
 
     :returns: ``LightProtocol`` or ``None``
     """
-    if name not in _cache:
+    if _cache.find(name) is None:
         get_lights()  # do nothing with response
 
-    if name in _cache:
-        return _cache[name]
-    else:
-        return None
+    return _cache.find(name)
 
 
 class YeelightLight(LightProtocol):
     """YeeLight implementation for LightProtocol."""
 
-    _client = None
+    _id = None
+    _connection = None
+
+    # yeelight bulbs accept at most 60 commands per minute
+    _command_rate = 1
+    _command_burst = 60
 
-    def __init__(self, name, client):
+    def __init__(self, name, light_id, connection, state=None):
         """Create and inialize YeelightLight.
 
         :param name: name of light, should be unique
-        :param client: third party client
+        :param light_id: ``String`` yeelight id
+        :param connection: persistent ``Connection`` to light
         """
-        LightProtocol.__init__(self)
+        LightProtocol.__init__(self, state=state)
         self._name = name
-        self._client = client
+        self._id = light_id
+        self._connection = connection
 
     @staticmethod
     def protocol():
@@ -69,44 +175,110 @@ class YeelightLight(LightProtocol):
         """See ``LightProtocol.get_name`` documentation."""
         return self._name
 
+    def get_id(self):
+        """See ``LightProtocol.get_id`` documentation, yeelight id."""
+        return self._id
+
+    def _address(self):
+        """See ``LightProtocol._address`` documentation."""
+        return {
+            'ip': self._connection.get_ip()
+        }
+
+    def read_state(self):
+        """Read state directly from light.
+
+        :returns: ``LightState``
+        :raises OSError: if light could not be reached
+        """
+        response = self._connection.send_command('get_prop', _PROPERTIES)
+        return _to_light_states([response['result']])[0]
+
+    def _read_state(self):
+        """See ``LightProtocol.get_state`` documentation."""
+        return self.read_state()
+
+    def _probe(self):
+        """See ``LightProtocol._probe`` documentation."""
+        self.read_state()  # raises if light does not respond
+        return True
+
+    def _command_count(self, state):
+        """See ``LightProtocol._command_count`` documentation."""
+        return len(_to_commands(state))
+
+    def _compile(self, state):
+        """See ``LightProtocol.compile_state`` documentation."""
+        return compile_commands(_to_commands(state))
+
+    def _apply(self, commands):
+        """See ``LightProtocol.apply_plan`` documentation."""
+        # all commands in one pipeline, bulb executes them in order
+        try:
+            responses = self._connection.send_compiled(commands)
+        except (OSError, ValueError) as err:
+            log.warning('could not set state for yeelight light %s: %s', self._name, err)
+            return False
+
+        return all(response.get('result') == ['ok'] for response in responses)
+
     def _set_state(self, state):
         """See ``LightProtocol.set_state`` documentation."""
-        successful = True
+        return self._apply(self._compile(state))
 
-        # minimum 1 second transision, looks better that way!
-        duration = _to_yeelight_duration(state.duration())
 
-        color = 16777215  # TODO: always white, fix #state.color()
+def _to_commands(state):
+    """Create yeelight commands for state, in the order they should be sent.
 
-        if color is not None:
-            action_response = self._client.send_command('set_rgb', [color, 'smooth', duration])
-            successful &= action_response['result'] == ['ok']
+    :returns: ``[(String, List)]`` method and parameters
+    """
+    commands = []
 
-        kelvin = state.kelvin()
+    # minimum 1 second transision, looks better that way!
+    duration = _to_yeelight_duration(state.duration())
 
-        if kelvin is not None:
-            action_response = self._client.send_command('set_ct_abx', [kelvin, 'smooth', duration])
-            successful &= action_response['result'] == ['ok']
+    color = state.color()
+    kelvin = state.kelvin()
 
-        brightness = _to_yeelight_brightness(state.brightness())
+    if color is not None:
+        commands.append(('set_rgb', [rgb_to_int([color])[0], 'smooth', duration]))
+    elif kelvin is not None:  # only set kelvin if no color is to be set
+        commands.append(('set_ct_abx', [kelvin, 'smooth', duration]))
 
-        # brightness second to last to avoid flickering/transient effects
-        if brightness is not None:
-            action_response = self._client.send_command('set_bright', [brightness, 'smooth', duration])
-            successful &= action_response['result'] == ['ok']
+    brightness = _to_yeelight_brightness(state.brightness())
 
-        power = _to_yeelight_power(state.power())
+    # brightness second to last to avoid flickering/transient effects
+    if brightness is not None:
+        commands.append(('set_bright', [brightness, 'smooth', duration]))
 
-        # power should always be last, to avoid flicker/transient effects
-        if power is not None:
-            action_response = self._client.send_command('set_power', [power, 'smooth', duration])
-            successful &= action_response['result'] == ['ok']
+    power = _to_yeelight_power(state.power())
+
+    # power should always be last, to avoid flicker/transient effects
+    if power is not None:
+        commands.append(('set_power', [power, 'smooth', duration]))
+
+    return commands
+
+
+def _to_light_states(properties):
+    """Create ``LightState`` for many lights from yeelight properties, see ``prism.color``.
+
+    :param properties: ``[[String]]`` per light, ``_PROPERTIES`` values as strings
+    :returns: ``[LightState]``
+    """
+    rgb_colors = int_to_rgb([int(rgb) if rgb else 0 for _, _, _, rgb in properties])
+    kelvins = clamp_kelvin([int(ct) if ct else None for _, _, ct, _ in properties])
 
-        return successful
+    return [LightState(
+        power=power == 'on' if power else None,
+        brightness=int(bright) if bright else None,
+        kelvin=kelvin,
+        color=rgb_color if rgb else None
+    ) for (power, bright, _, rgb), rgb_color, kelvin in zip(properties, rgb_colors, kelvins)]
 
 
 def _to_yeelight_duration(duration):
-    return duration * 1000 if duration is not None else 60
+    return max(duration * 1000, _MIN_DURATION) if duration is not None else 60
 
 
 def _to_yeelight_brightness(brightness):
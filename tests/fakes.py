@@ -0,0 +1,51 @@
+import threading
+
+from prism.light import LightProtocol, LightState
+
+
+class FakeLight(LightProtocol):
+    """Light that records writes and reads, and blocks them until released."""
+
+    _write_interval = 0  # not rate limited
+
+    def __init__(self, light_id, name=None, state=None):
+        LightProtocol.__init__(self, state=state)
+        self._id = light_id
+        self._name = name if name is not None else light_id
+        self.written = []
+        self.reads = 0
+        self.busy = threading.Event()  # set when a write, or read, has started
+        self.release = threading.Event()  # writes, and reads, wait for it
+        self.release.set()
+        self.results = []  # outcome of each write, ``True`` once used up
+
+    @staticmethod
+    def protocol():
+        return 'Fake.v1'
+
+    def get_name(self):
+        return self._name
+
+    def get_id(self):
+        return self._id
+
+    def _address(self):
+        return {}
+
+    def _probe(self):
+        return True
+
+    def _set_state(self, state):
+        self.written.append(state.json())
+        self.busy.set()
+        self.release.wait(5)
+        result = self.results.pop(0) if self.results else True
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _read_state(self):
+        self.reads += 1
+        self.busy.set()
+        self.release.wait(5)
+        return LightState(power=True, brightness=self.reads)
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from prism.light import LightState
+from prism.lifx_client import packets
+from prism.lifx_client.aio import AsyncLifxLight
+from prism.lifx_client.lifx import _to_calls
+from prism.yeelight_client import aio as yeelight_aio
+
+LAST_STATE = LightState(power=True, color=[255, 0, 0], brightness=100, kelvin=3500)
+
+
+@pytest.mark.parametrize('state', [
+    LightState(brightness=50),
+    LightState(brightness=50, kelvin=4000),
+    LightState(kelvin=4000),
+    LightState(color=[0, 0, 255], brightness=20, duration=2),
+])
+def test_blocking_and_asyncio_lifx_set_same_color(state):
+    light = AsyncLifxLight('lamp', 'd0:73:d5:01:02:03', ('127.0.0.1', packets.PORT), state=LAST_STATE)
+
+    (packet,) = light.compile_state(state).commands
+    asyncio_color, asyncio_duration = packets.parse_set_color(packets.unpack(packet).payload)
+    ((function_name, (blocking_color, blocking_duration, _)),) = _to_calls(state, LAST_STATE)
+
+    assert function_name == 'set_color'
+    assert list(asyncio_color) == blocking_color
+    assert asyncio_duration == blocking_duration
+
+
+def test_brightness_keeps_last_known_color():
+    ((_, (color, _, _)),) = _to_calls(LightState(brightness=50), LAST_STATE)
+
+    assert color == [0, 65535, 32768, 3500]  # red, at half brightness
+
+
+def test_timed_out_requests_are_not_kept_pending(monkeypatch):
+    monkeypatch.setattr(yeelight_aio, 'REQUEST_TIMEOUT', 0.05)
+
+    async def unanswered(reader, writer):
+        await reader.read()  # until client closes connection
+        writer.close()
+
+    async def send():
+        server = await asyncio.start_server(unanswered, '127.0.0.1', 0)
+        connection = yeelight_aio.AsyncConnection(server.sockets[0].getsockname()[:2])
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await connection.send_commands([('set_power', ['on', 'smooth', 500])])
+            return connection._pending  # pylint: disable=protected-access
+        finally:
+            connection.close()
+            server.close()
+            await server.wait_closed()
+
+    assert asyncio.run(send()) == {}
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import prism.prism as service
+from prism import backends
+from prism.backends import LocalBackend, SharedBackend
+from prism.light import LightState
+from prism.registry import Registry
+
+from .fakes import FakeLight
+
+
+def test_local_backend_is_always_leader():
+    backend = backends.create(backends.LOCAL)
+
+    assert isinstance(backend, LocalBackend)
+    assert backend.elect()
+    assert backend.is_leader()
+    assert backend.load() is None
+
+
+def test_one_shared_backend_is_elected(tmp_path):
+    path = str(tmp_path / 'registry.json')
+    leader = SharedBackend(path)
+    follower = SharedBackend(path)
+
+    assert leader.elect()
+    assert not follower.elect()
+    assert leader.is_leader()
+    assert not follower.is_leader()
+
+
+def test_follower_loads_published_lights_once(tmp_path):
+    path = str(tmp_path / 'registry.json')
+    leader = SharedBackend(path)
+    follower = SharedBackend(path)
+    assert follower.load() is None  # nothing published
+
+    leader.publish([FakeLight('id-1', 'lamp', state=LightState(power=True))])
+
+    snapshots = follower.load()
+    assert [(snapshot['id'], snapshot['name'], snapshot['state']['power']) for snapshot in snapshots] == \
+        [('id-1', 'lamp', True)]
+    assert follower.load() is None  # unchanged
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires fork')
+def test_forked_process_is_not_leader(tmp_path):
+    backend = SharedBackend(str(tmp_path / 'registry.json'))
+    assert backend.elect()
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child, inherited the lock file of its parent
+        os.write(write_end, b'%d%d' % (backend.is_leader(), backend.elect()))
+        os._exit(0)  # pylint: disable=protected-access
+
+    os.waitpid(pid, 0)
+    assert os.read(read_end, 2) == b'00'
+    assert backend.is_leader()  # closing inherited file does not release parent's lock
+    os.close(read_end)
+    os.close(write_end)
+
+
+def test_follower_keeps_lights_when_snapshot_can_not_be_loaded(tmp_path, monkeypatch):
+    path = tmp_path / 'registry.json'
+    registry = Registry(lambda: None)
+    registry.update([FakeLight('id-1', 'lamp')])
+    monkeypatch.setattr(service.prism, '_registry', registry)
+    monkeypatch.setattr(service.prism, '_backend', SharedBackend(str(path)))
+    monkeypatch.setattr(service.prism, '_clients', [])
+
+    path.write_text('{"version": ')  # unreadable
+    assert [light.get_id() for light in service.prism._follow()] == ['id-1']  # pylint: disable=protected-access
+
+    SharedBackend(str(path)).publish([])  # leader published no lights
+    assert service.prism._follow() == []  # pylint: disable=protected-access
+    assert registry.get_lights() == []
@@ -0,0 +1,36 @@
+from prism.color import clamp_kelvin, hsbk_to_rgb, int_to_rgb, rgb_to_hsbk, rgb_to_int, to_percent
+
+COLORS = [[0, 0, 0], [255, 255, 255], [255, 0, 0], [0, 255, 0], [0, 0, 255], [255, 100, 0], [12, 34, 56],
+          [1, 2, 3], [254, 253, 252], [128, 128, 128]]
+
+
+def test_rgb_hsbk_round_trip():
+    hsbk = rgb_to_hsbk(COLORS, [3500] * len(COLORS), [None] * len(COLORS))
+
+    assert hsbk_to_rgb(hsbk) == COLORS
+
+
+def test_rgb_to_hsbk_does_not_truncate_channels():
+    # regression, channels were truncated with int(c / 255), i.e. to 0 or 1
+    hue, saturation, brightness, kelvin = rgb_to_hsbk([[255, 100, 0]], [3500], [None])[0]
+
+    assert 0 < hue < 65535 // 6
+    assert saturation == 65535
+    assert brightness == 65535
+    assert kelvin == 3500
+
+
+def test_rgb_to_hsbk_brightness_replaces_color_brightness():
+    assert rgb_to_hsbk([[255, 0, 0]], [None], [50])[0] == (0, 65535, 32768, 0)
+
+
+def test_to_percent_full_scale():
+    assert to_percent([0, 32768, 65535]) == [0, 50, 100]
+
+
+def test_rgb_int_round_trip():
+    assert int_to_rgb(rgb_to_int(COLORS)) == COLORS
+
+
+def test_clamp_kelvin():
+    assert clamp_kelvin([1500, 4000, 9500, None]) == [2500, 4000, 9000, None]
@@ -0,0 +1,139 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from prism.yeelight_client import connection as yeelight_connection
+from prism.yeelight_client.connection import Connection, compile_commands
+
+
+class FakeBulb:
+    """Bulb listening on localhost, ``answer`` is called with requests read on each connection."""
+
+    def __init__(self, *answers):
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.port = self._server.getsockname()[1]
+        self.requests = []  # requests read, per connection
+        self._answers = list(answers)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        for answer in self._answers:
+            client, _ = self._server.accept()
+            requests = []
+            self.requests.append(requests)
+            with client, client.makefile('rb') as reader:
+                answer(client, reader, requests)
+        self._server.close()
+
+
+def answer_all(client, reader, requests, count=2):
+    for _ in range(count):
+        requests.append(json.loads(reader.readline()))
+    client.sendall(b'{"method":"props","params":{"power":"on"}}\r\n')  # notification
+    for request in reversed(requests):
+        client.sendall(json.dumps({'id': request['id'], 'result': ['ok']}).encode() + b'\r\n')
+
+
+def answer_first(client, reader, requests):
+    requests.append(json.loads(reader.readline()))
+    requests.append(json.loads(reader.readline()))
+    client.sendall(json.dumps({'id': requests[0]['id'], 'result': ['ok']}).encode() + b'\r\n')
+
+
+def answer_none(client, reader, requests):
+    requests.append(json.loads(reader.readline()))
+    reader.readline()  # connection closed by client
+
+
+def close_idle(client, reader, requests):
+    pass  # bulb closed idle connection
+
+
+def answer_garbage(client, reader, requests):
+    requests.append(json.loads(reader.readline()))
+    client.sendall(b'{not json\r\n')
+    reader.readline()  # connection closed by client
+
+
+COMMANDS = [('set_power', ['on', 'smooth', 500]), ('set_bright', [50, 'smooth', 500])]
+
+
+def test_pipeline_matches_responses_by_id():
+    bulb = FakeBulb(answer_all)
+    connection = Connection('127.0.0.1', bulb.port)
+
+    responses = connection.send_commands(COMMANDS)
+
+    assert [request['method'] for request in bulb.requests[0]] == ['set_power', 'set_bright']
+    assert [response['id'] for response in responses] == [request['id'] for request in bulb.requests[0]]
+    connection.close()
+
+
+def test_lost_idle_connection_is_retried_once():
+    bulb = FakeBulb(close_idle, answer_all)
+    connection = Connection('127.0.0.1', bulb.port)
+
+    assert len(connection.send_commands(COMMANDS)) == 2
+    assert len(bulb.requests) == 2
+    connection.close()
+
+
+def test_partly_answered_pipeline_is_not_retried():
+    bulb = FakeBulb(answer_first, answer_all)
+    connection = Connection('127.0.0.1', bulb.port)
+
+    with pytest.raises(ConnectionResetError) as err:
+        connection.send_commands(COMMANDS)
+
+    assert not isinstance(err.value, yeelight_connection.ConnectionLost)
+    assert len(bulb.requests) == 1
+
+
+def test_unanswered_pipeline_is_not_retried_on_timeout():
+    bulb = FakeBulb(answer_none, answer_all)
+    connection = Connection('127.0.0.1', bulb.port, timeout=0.1)
+
+    with pytest.raises(socket.timeout):
+        connection.send_commands(COMMANDS[:1])
+
+    assert len(bulb.requests) == 1
+
+
+def test_write_timeout_is_not_retried(monkeypatch):
+    class TimingOutSocket:
+        def sendall(self, payload):
+            raise socket.timeout('timed out')
+
+        def close(self):
+            pass
+
+    connects = []
+    monkeypatch.setattr(yeelight_connection.socket, 'create_connection',
+                        lambda *args, **kwargs: connects.append(1) or TimingOutSocket())
+    connection = Connection('127.0.0.1')
+
+    with pytest.raises(socket.timeout):
+        connection.send_commands(COMMANDS)
+
+    assert len(connects) == 1
+
+
+def test_invalid_response_closes_connection():
+    bulb = FakeBulb(answer_garbage, answer_all)
+    connection = Connection('127.0.0.1', bulb.port)
+
+    with pytest.raises(ValueError):
+        connection.send_commands(COMMANDS[:1])
+
+    assert len(connection.send_commands(COMMANDS)) == 2  # on a new connection
+    assert len(bulb.requests) == 2
+    connection.close()
+
+
+def test_compiled_commands_escape_percent():
+    command = compile_commands([('set_name', ['100%'])])[0] % 7
+
+    assert json.loads(command) == {'id': 7, 'method': 'set_name', 'params': ['100%']}
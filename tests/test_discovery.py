@@ -0,0 +1,130 @@
+import threading
+import time
+
+from prism.discovery import DiscoveryScheduler, discover, poll
+
+
+def test_concurrent_refreshes_share_discovery():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def discovery():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+
+    scheduler = DiscoveryScheduler(discovery)
+    first = threading.Thread(target=scheduler.refresh)
+    first.start()
+    started.wait(5)
+    waiting = [threading.Thread(target=scheduler.refresh) for _ in range(3)]
+    for thread in waiting:
+        thread.start()
+    release.set()
+    for thread in [first] + waiting:
+        thread.join(5)
+
+    assert len(calls) == 1  # callers arriving during discovery share it
+
+
+def test_background_discovery_runs_until_stopped():
+    discovered = threading.Event()
+    scheduler = DiscoveryScheduler(discovered.set, interval=60)
+
+    scheduler.start()
+    try:
+        assert discovered.wait(5)
+    finally:
+        scheduler.stop()
+
+
+class FakeClient:
+    """Protocol client with lights, discovery waits for ``release``."""
+
+    def __init__(self, name, lights, cached=None, error=None):
+        self.__name__ = name
+        self.lights = lights
+        self.cached = cached if cached is not None else []
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_lights(self):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.lights
+
+    refresh_lights = get_lights
+
+    def get_cached_lights(self):
+        return self.cached
+
+
+def test_discover_clients_concurrently():
+    first, second = FakeClient('concurrent.first', ['a']), FakeClient('concurrent.second', ['b'])
+    first.release.clear()
+    second.release.clear()
+    threading.Timer(0.1, first.release.set).start()
+    threading.Timer(0.1, second.release.set).start()
+
+    assert discover([first, second], timeout=0.18) == ['a', 'b']
+
+
+def test_discover_uses_cache_on_failure_and_timeout():
+    failing = FakeClient('fallback.failing', ['a'], cached=['cached a'], error=RuntimeError('failed'))
+    slow = FakeClient('fallback.slow', ['b'], cached=['cached b'])
+    slow.release.clear()
+
+    try:
+        assert discover([failing, slow], timeout=0.1) == ['cached a', 'cached b']
+    finally:
+        slow.release.set()
+
+
+def test_discover_skips_client_still_running():
+    slow = FakeClient('running.slow', ['a'], cached=['cached a'])
+    slow.release.clear()
+
+    try:
+        discover([slow], timeout=0.05)
+        assert poll([slow], timeout=0.05) == ['cached a']
+        assert slow.calls == 1
+    finally:
+        slow.release.set()
+
+    time.sleep(0.2)  # let timed out discovery complete
+    assert poll([slow], timeout=1) == ['a']
+    assert slow.calls == 2
+
+
+def _run_cycles(scheduler, cycles, calls):
+    scheduler.start()
+    deadline = time.monotonic() + 5
+    while len(calls) < cycles and time.monotonic() < deadline:
+        time.sleep(0.005)
+    scheduler.stop()
+    time.sleep(0.05)  # ongoing cycle completes
+
+
+def test_known_lights_are_polled_between_discoveries():
+    calls = []
+    scheduler = DiscoveryScheduler(lambda: calls.append('discover'), interval=0.01,
+                                   polling=lambda: calls.append('poll') or ['light'], broadcast_every=3)
+
+    _run_cycles(scheduler, 6, calls)
+
+    assert calls[:6] == ['discover', 'poll', 'poll', 'discover', 'poll', 'poll']
+
+
+def test_discovers_when_no_lights_are_known_to_poll():
+    calls = []
+    scheduler = DiscoveryScheduler(lambda: calls.append('discover'), interval=0.01,
+                                   polling=lambda: calls.append('poll') or [], broadcast_every=3)
+
+    _run_cycles(scheduler, 3, calls)
+
+    assert calls[:3] == ['discover', 'poll', 'discover']
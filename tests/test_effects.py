@@ -0,0 +1,79 @@
+from concurrent.futures import Future
+import threading
+
+import pytest
+
+from prism.effects import MAX_TRANSITION, Effect, EffectEngine, Keyframe, _between
+from prism.light import LightState
+
+from .fakes import FakeLight
+
+
+def test_keyframes_are_sent_when_previous_keyframe_is_reached():
+    effect = Effect('breathe', [Keyframe(0, LightState(brightness=10)), Keyframe(4, LightState(brightness=90)),
+                                Keyframe(10, LightState(brightness=10))], repeat=True)
+
+    assert [(sent, state.duration(), state.brightness()) for sent, state in effect.frames] == \
+        [(0, 0, 10), (0, 4, 90), (4, 6, 10)]
+    assert effect.period == 10
+
+
+def test_far_apart_keyframes_are_reached_in_steps():
+    gap = 2 * MAX_TRANSITION + 1
+    effect = Effect('sunrise', [Keyframe(0, LightState(brightness=0)), Keyframe(gap, LightState(brightness=99))])
+
+    steps = effect.frames[1:]
+    assert len(steps) == 3
+    assert all(state.duration() <= MAX_TRANSITION for _, state in steps)
+    assert sum(state.duration() for _, state in steps) == gap
+    assert [sent for sent, _ in steps] == [0, steps[0][1].duration(), steps[0][1].duration() + steps[1][1].duration()]
+    assert [state.brightness() for _, state in steps] == [33, 66, 99]
+
+
+def test_between_interpolates_fields_in_both_states():
+    start = LightState(power=True, brightness=0, color=[0, 0, 0])
+    end = LightState(power=False, brightness=100, color=[255, 100, 0], kelvin=4000)
+
+    state = _between(start, end, 0.5)
+
+    assert state.brightness() == 50
+    assert state.color() == [128, 50, 0]
+    assert state.kelvin() == 4000  # not in start, set at once
+    assert state.power() is None  # only turned off when end is reached
+    assert _between(None, end, 0.5).brightness() == 100
+
+
+@pytest.mark.parametrize('keyframes, repeat', [
+    ([], False),
+    ([Keyframe(5, LightState()), Keyframe(0, LightState())], False),
+    ([Keyframe(0, LightState())], True),
+])
+def test_invalid_effects_are_rejected(keyframes, repeat):
+    with pytest.raises(ValueError):
+        Effect('invalid', keyframes, repeat=repeat)
+
+
+def test_effect_runs_until_last_frame_is_sent():
+    lights = {'lamp': FakeLight('lamp'), 'desk': FakeLight('desk')}
+    submitted = []
+    done = threading.Event()
+
+    def submit_state(batch, state):
+        submitted.append(([light.get_name() for light in batch], state.brightness()))
+        if len(submitted) == 2:
+            done.set()
+        future = Future()
+        future.set_result(True)
+        return [([light], future) for light in batch]
+
+    engine = EffectEngine.from_configuration([
+        {'name': 'flash', 'keyframes': [{'offset': 0, 'state': {'brightness': 100}},
+                                        {'offset': 0, 'state': {'brightness': 10}}]},
+        {'name': 'invalid', 'keyframes': [{'offset': 0, 'state': {'brightness': 500}}]},
+    ], lights.get, submit_state)
+
+    assert [effect.name for effect in engine.get_effects()] == ['flash']
+    assert engine.start('flash', ['lamp', 'desk', 'unknown']).lights == list(lights.values())
+
+    assert done.wait(5)
+    assert submitted == [(['lamp', 'desk'], 100), (['lamp', 'desk'], 10)]
@@ -0,0 +1,143 @@
+import json
+import os
+
+import pytest
+
+import prism.prism as service
+from prism.registry import Registry
+
+from .fakes import FakeLight
+
+
+@pytest.fixture
+def lights(monkeypatch):
+    """Lights served by endpoints, discovery is not started."""
+    lights = [FakeLight('id-1', 'kitchen'), FakeLight('id-2', 'hallway')]
+    registry = Registry(lambda: None, miss_ttl=0)
+    registry.update(lights)
+    monkeypatch.setattr(service.prism, '_registry', registry)
+    monkeypatch.setattr(service.prism, '_started', os.getpid())
+    return lights
+
+
+def call(endpoint, *args, path='/', method='GET', body=None, headers=None):
+    data = json.dumps(body) if body is not None else None
+    with service.app.test_request_context(path, method=method, data=data, headers=headers):
+        return endpoint(*args)
+
+
+def test_bulk_state_reports_result_per_light(lights):
+    body = {'lights': [
+        {'name': 'kitchen', 'state': {'power': True}},
+        {'name': 'unknown', 'state': {'power': True}},
+        {'name': 'hallway', 'state': {'brightness': 500}},
+    ]}
+
+    response = call(service.put_lights_state, path='/lights/state', method='PUT', body=body)
+    results = json.loads(response.get_data())['lights']
+
+    assert response.status_code == 200
+    assert [(result['name'], result['successful']) for result in results] == \
+        [('kitchen', True), ('unknown', False), ('hallway', False)]
+    assert results[0]['light']['name'] == 'kitchen'
+    assert results[1]['light'] is None
+    assert [state['power'] for state in lights[0].written] == [True]
+    assert lights[1].written == []  # invalid state is not written
+
+
+def test_bulk_state_reports_failed_light(lights):
+    lights[0].results.append(False)
+    body = {'lights': [{'name': 'kitchen', 'state': {'power': True}}, {'name': 'hallway', 'state': {'power': True}}]}
+
+    response = call(service.put_lights_state, path='/lights/state', method='PUT', body=body)
+
+    assert [result['successful'] for result in json.loads(response.get_data())['lights']] == [False, True]
+
+
+def test_group_state_reports_result_per_member(lights, monkeypatch):
+    monkeypatch.setattr(service.prism, '_groups', {'downstairs': ['kitchen', 'hallway', 'unknown']})
+    lights[1].results.append(OSError('unreachable'))
+
+    response = call(service.put_group_state, 'downstairs', path='/group/downstairs/state', method='PUT',
+                    body={'power': True})
+    results = json.loads(response.get_data())['lights']
+
+    assert [(result['name'], result['successful']) for result in results] == [('kitchen', True), ('hallway', False)]
+    assert [len(light.written) for light in lights] == [1, 1]  # applied per light
+
+
+def test_unknown_group_is_not_found(lights):
+    with pytest.raises(service.ResouceNotFound):
+        call(service.put_group_state, 'unknown', path='/group/unknown/state', method='PUT', body={'power': True})
+
+
+def get_lights(path='/lights', headers=None):
+    response = call(service.get_lights, path=path, headers=headers)
+    return response, json.loads(response.get_data()) if response.status_code == 200 else None
+
+
+def test_lights_since_includes_lights_added_after_created(lights):
+    discovered = FakeLight('id-3', 'bedroom')  # created during discovery, before clients got lights
+    _, body = get_lights()
+
+    service.prism._registry.update(lights + [discovered])  # pylint: disable=protected-access
+    _, delta = get_lights('/lights?since={}'.format(body['version']))
+
+    assert [light['name'] for light in delta['lights']] == ['bedroom']
+    assert delta['removed'] == []
+
+
+def test_lights_since_includes_removed_lights(lights):
+    _, body = get_lights()
+
+    service.prism._registry.update(lights[:1])  # pylint: disable=protected-access
+    _, delta = get_lights('/lights?since={}'.format(body['version']))
+
+    assert delta['lights'] == []
+    assert delta['removed'] == ['id-2']
+
+
+def test_lights_not_modified_per_representation(lights):
+    response, _ = get_lights()
+    etag = response.headers['ETag']
+
+    assert get_lights(headers={'If-None-Match': etag})[0].status_code == 304
+
+    for path in ('/lights?include=stale', '/lights?since=0'):
+        response, _ = get_lights(path, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        assert get_lights(path, headers={'If-None-Match': response.headers['ETag']})[0].status_code == 304
+
+
+def test_metrics_are_exposed(lights):
+    call(service.get_lights, path='/lights')
+
+    response = call(service.get_metrics, path='/metrics')
+
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4'
+    assert 'prism_request_duration_seconds_count{endpoint="get_lights"}' in response.get_data(as_text=True)
+
+
+def test_unavailable_light_responds_service_unavailable(lights):
+    threshold = lights[0]._failure_threshold  # pylint: disable=protected-access
+    lights[0].results = [OSError('unreachable')] * threshold
+    for _ in range(threshold):
+        with pytest.raises(OSError):
+            call(service.put_light_state, 'kitchen', path='/light/kitchen/state', method='PUT', body={'power': True})
+
+    response = call(service.put_light_state, 'kitchen', path='/light/kitchen/state', method='PUT', body={'power': True})
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) > 0
+    assert len(lights[0].written) == threshold
+
+
+def test_toggle_reads_state_from_light(lights, monkeypatch):
+    monkeypatch.setattr(service.prism, '_max_state_age', 0)  # state read from light, which is on
+
+    response = call(service.put_power_toggle, 'kitchen', path='/light/kitchen/state/power/toggle', method='PUT')
+
+    assert response.status_code == 200
+    assert lights[0].reads == 1
+    assert [state['power'] for state in lights[0].written] == [False]
@@ -0,0 +1,45 @@
+from prism import events
+from prism.events import EventBus
+from prism.light import LightState
+from prism.registry import Registry
+
+from .fakes import FakeLight
+
+
+def test_event_is_serialized_as_server_sent_event():
+    bus = EventBus()
+    subscription = bus.subscribe()
+
+    bus.publish(events.LIGHT_CHANGED, 7, b'{"name":"lamp"}')
+
+    assert subscription.get(timeout=1) == b'id: 7\nevent: light.changed\ndata: {"name":"lamp"}\n\n'
+
+
+def test_subscriber_that_can_not_keep_up_is_dropped():
+    bus = EventBus()
+    slow = bus.subscribe(max_queued=2)
+    fast = bus.subscribe()
+
+    for version in range(3):
+        bus.publish(events.LIGHT_CHANGED, version, b'{}')
+
+    assert slow.closed
+    assert not fast.closed
+    assert bus.has_subscribers()
+    bus.unsubscribe(fast)
+    assert not bus.has_subscribers()
+
+
+def test_light_changes_are_published(monkeypatch):
+    bus = EventBus()
+    monkeypatch.setattr(events, 'bus', bus)
+    subscription = bus.subscribe()
+    light = FakeLight('id-1', 'lamp', state=LightState(power=False))
+    registry = Registry(lambda: None)
+
+    registry.update([light])
+    light.update_state(LightState(power=True))
+    registry.update([])
+
+    published = [subscription.get(timeout=1).split(b'\n')[1] for _ in range(3)]
+    assert published == [b'event: light.appeared', b'event: light.changed', b'event: light.removed']
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from prism.health import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DeviceUnavailableError, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker('light', lambda: False, threshold=3, cooldown=60)
+
+    breaker.record(False)
+    breaker.record(False)
+    breaker.check()  # still closed
+    assert breaker.state() == CLOSED
+
+    breaker.record(False)
+    assert breaker.state() == OPEN
+    with pytest.raises(DeviceUnavailableError):
+        breaker.check()
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker('light', lambda: False, threshold=2, cooldown=60)
+
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+
+    assert breaker.state() == CLOSED
+
+
+def test_breaker_half_open_closes_on_success():
+    probing = threading.Event()
+    probed = threading.Event()
+
+    def probe():
+        probing.set()
+        probed.wait(5)  # keep circuit half-open while test runs
+        return True
+
+    breaker = CircuitBreaker('light', probe, threshold=1, cooldown=0.05)
+    breaker.record(False)
+    assert breaker.state() == OPEN
+
+    assert probing.wait(5)
+    assert breaker.state() == HALF_OPEN
+    breaker.check()  # attempts are let through
+
+    breaker.record(True)
+    probed.set()
+    assert breaker.state() == CLOSED
+
+
+def test_breaker_half_open_reopens_on_failure():
+    probed = threading.Event()
+    breaker = CircuitBreaker('light', lambda: probed.wait(5), threshold=1, cooldown=0.05)
+    breaker.record(False)
+
+    time.sleep(0.1)
+    assert breaker.state() == HALF_OPEN
+
+    breaker.record(False)
+    probed.set()
+    assert breaker.state() == OPEN
+
+
+def test_breaker_probe_closes_circuit():
+    breaker = CircuitBreaker('light', lambda: True, threshold=1, cooldown=0.05)
+    breaker.record(False)
+
+    deadline = time.monotonic() + 5
+    while breaker.state() != CLOSED and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert breaker.state() == CLOSED
+
+
+def test_token_bucket_burst_then_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('prism.health.time', clock)
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.delay(2) == 0
+    bucket.consume(2)
+    assert bucket.delay(1) == pytest.approx(0.1)
+
+    clock.now += 0.11
+    assert bucket.delay(1) == 0
+
+
+def test_token_bucket_does_not_exceed_capacity(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('prism.health.time', clock)
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    clock.now += 60
+    bucket.consume(2)
+
+    assert bucket.delay(1) == pytest.approx(0.1)
+    assert bucket.delay(5) == pytest.approx(0.2)  # more than capacity waits for a full bucket
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+
+import pytest
+
+from prism.health import DeviceUnavailableError
+from prism.light import LightState, state_version
+
+from .fakes import FakeLight
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def _start(target, *args):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(target(*args)))
+    thread.start()
+    return thread, results
+
+
+def test_set_state_coalesces_concurrent_callers():
+    light = FakeLight('light')
+    light.release.clear()
+
+    first, first_result = _start(light.set_state, LightState(power=True))
+    assert light.busy.wait(5)
+
+    # written while first write is in progress, merged into one pending state
+    waiting = [_start(light.set_state, state) for state in
+               (LightState(brightness=10), LightState(brightness=20, kelvin=3000), LightState(color=[1, 2, 3]))]
+    _wait_for(lambda: len(light._pending_writes) == 3)  # pylint: disable=protected-access
+
+    light.release.set()
+    for thread, _ in [(first, first_result)] + waiting:
+        thread.join(5)
+
+    assert len(light.written) == 2
+    assert light.written[1] == {'power': None, 'duration': None, 'brightness': 20, 'color': [1, 2, 3], 'kelvin': 3000}
+    assert first_result == [True]
+    assert all(results == [True] for _, results in waiting)
+
+
+def test_set_state_error_is_raised_in_every_coalesced_caller():
+    light = FakeLight('light')
+    light.release.clear()
+
+    first, first_result = _start(light.set_state, LightState(power=True))
+    assert light.busy.wait(5)
+
+    errors = []
+
+    def coalesced():
+        try:
+            light.set_state(LightState(power=False))
+        except OSError as err:
+            errors.append(err)
+
+    waiting = [threading.Thread(target=coalesced) for _ in range(3)]
+    for thread in waiting:
+        thread.start()
+    _wait_for(lambda: len(light._pending_writes) == 3)  # pylint: disable=protected-access
+
+    light.results = [True, OSError('unreachable')]
+    light.release.set()
+    for thread in [first] + waiting:
+        thread.join(5)
+
+    assert first_result == [True]
+    assert len(errors) == 3
+    assert len(light.written) == 2
+
+
+
+def test_light_state_update_reports_changes():
+    state = LightState(power=True, brightness=10)
+
+    assert not state.update(LightState(power=True))
+    assert state.update(LightState(brightness=20, kelvin=3000))
+    assert state.json() == {'power': True, 'duration': None, 'brightness': 20, 'color': None, 'kelvin': 3000}
+    assert not hasattr(state, '__dict__')  # slotted
+
+
+def test_json_bytes_is_cached_until_light_changes():
+    light = FakeLight('light', state=LightState(power=False))
+    light.update_state(LightState(power=False))
+
+    serialized = light.json_bytes()
+    assert light.json_bytes() is serialized
+    assert json.loads(serialized) == light.json()
+
+    light.update_state(LightState(power=True))
+    assert json.loads(light.json_bytes())['state']['power'] is True
+
+
+def test_version_increases_only_when_light_changes():
+    light = FakeLight('light', state=LightState(power=False))
+    since = state_version()
+
+    light.update_state(LightState(power=False))
+    assert light.get_version() <= since  # unchanged, not returned for ``since``
+
+    light.update_state(LightState(power=True))
+    assert light.get_version() > since
+    assert state_version() >= light.get_version()
+
+
+def test_set_state_fails_fast_when_circuit_is_open():
+    light = FakeLight('light')
+    light.results = [OSError('unreachable')] * light._failure_threshold  # pylint: disable=protected-access
+
+    for _ in range(light._failure_threshold):  # pylint: disable=protected-access
+        with pytest.raises(OSError):
+            light.set_state(LightState(power=True))
+
+    with pytest.raises(DeviceUnavailableError):
+        light.set_state(LightState(power=True))
+    assert len(light.written) == light._failure_threshold  # pylint: disable=protected-access
+
+
+def test_get_state_shares_one_read_between_concurrent_callers():
+    light = FakeLight('light')  # no known state, every caller wants a read
+    light.release.clear()
+
+    readers = [_start(light.get_state, 1) for _ in range(10)]
+    assert light.busy.wait(5)
+    time.sleep(0.05)  # remaining readers wait for read in progress
+
+    light.release.set()
+    for thread, _ in readers:
+        thread.join(5)
+
+    assert light.reads == 1
+    assert all(results[0].power() is True for _, results in readers)
+
+
+def test_get_state_without_max_age_does_not_read():
+    light = FakeLight('light', state=LightState(power=False))
+
+    assert light.get_state().power() is False
+    assert light.get_state(max_age=60).power() is False
+    assert light.reads == 0
+
@@ -0,0 +1,54 @@
+from prism import metrics
+from prism.light import LightState
+from prism.metrics import Registry
+
+from .fakes import FakeLight
+
+
+def test_counter_exposition():
+    registry = Registry()
+    counter = registry.counter('prism_test_total', 'Test counter.', ('result',))
+
+    counter.inc('ok')
+    counter.inc('ok', amount=2)
+    counter.inc('error')
+
+    assert registry.exposition() == (
+        '# HELP prism_test_total Test counter.\n'
+        '# TYPE prism_test_total counter\n'
+        'prism_test_total{result="error"} 1\n'
+        'prism_test_total{result="ok"} 3\n')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('prism_test_seconds', 'Test histogram.', ('protocol',), buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, 'lifx')
+
+    lines = registry.exposition().splitlines()
+    assert lines[2:] == [
+        'prism_test_seconds_bucket{protocol="lifx",le="0.1"} 1',
+        'prism_test_seconds_bucket{protocol="lifx",le="1.0"} 3',
+        'prism_test_seconds_bucket{protocol="lifx",le="+Inf"} 4',
+        'prism_test_seconds_count{protocol="lifx"} 4',
+        'prism_test_seconds_sum{protocol="lifx"} 6.05',
+    ]
+    assert histogram.summary() == {('lifx',): {'count': 4, 'sum': 6.05, 'mean': 1.5125}}
+
+
+def test_timer_observes_duration():
+    histogram = Registry().histogram('prism_test_seconds', 'Test histogram.')
+
+    with histogram.time():
+        pass
+
+    assert histogram.summary()[()]['count'] == 1
+
+
+def test_set_state_is_counted():
+    before = metrics.set_state_total.values().get(('Fake.v1', 'success'), 0)
+    FakeLight('light').set_state(LightState(power=True))
+
+    assert metrics.set_state_total.values()[('Fake.v1', 'success')] == before + 1
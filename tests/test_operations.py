@@ -0,0 +1,52 @@
+import threading
+import time
+
+from prism.health import DeviceUnavailableError
+from prism.operations import COMPLETED, FAILED, OperationTracker
+
+
+def _wait_finished(operation):
+    deadline = time.monotonic() + 5
+    while operation.finished is None and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_failed_operation_is_retried_after_delay():
+    tracker = OperationTracker(workers=1, retries=2, retry_delay=0.02)
+    attempts = []
+
+    operation = tracker.submit('lamp', lambda: attempts.append(time.monotonic()) or len(attempts) == 3)
+    _wait_finished(operation)
+
+    assert operation.status == COMPLETED
+    assert operation.attempts == 3
+    assert attempts[1] - attempts[0] >= 0.02
+    assert attempts[2] - attempts[1] >= 0.04  # delay doubles
+
+
+def test_unavailable_light_is_not_retried():
+    tracker = OperationTracker(workers=1, retries=2, retry_delay=0.02)
+
+    def unavailable():
+        raise DeviceUnavailableError('lamp', 30)
+
+    operation = tracker.submit('lamp', unavailable)
+    _wait_finished(operation)
+
+    assert operation.status == FAILED
+    assert operation.attempts == 1
+
+
+def test_history_only_forgets_finished_operations():
+    tracker = OperationTracker(workers=1, history=1)
+    release = threading.Event()
+
+    blocked = [tracker.submit('lamp', release.wait) for _ in range(3)]
+    assert all(tracker.get(operation.id) is operation for operation in blocked)
+
+    release.set()
+    for operation in blocked:
+        _wait_finished(operation)
+    tracker.submit('lamp', lambda: True)
+
+    assert tracker.get(blocked[0].id) is None
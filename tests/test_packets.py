@@ -0,0 +1,41 @@
+from prism.lifx_client import packets
+
+
+def test_packet_round_trip():
+    payload = packets.set_color(packets.Color(100, 200, 300, 3500), 1000)
+    packet = packets.pack(packets.LIGHT_SET_COLOR, payload, target='d0:73:d5:01:02:03', source=7, sequence=257,
+                          ack_required=True)
+
+    decoded = packets.unpack(packet)
+
+    assert decoded == packets.Packet(packets.LIGHT_SET_COLOR, 7, 'd0:73:d5:01:02:03', 1, payload)
+    assert packets.parse_set_color(decoded.payload) == (packets.Color(100, 200, 300, 3500), 1000)
+
+
+def test_stamp_sets_source_and_sequence():
+    packet = packets.pack(packets.LIGHT_SET_POWER, packets.set_power(True, 0), target='d0:73:d5:01:02:03')
+
+    decoded = packets.unpack(packets.stamp(packet, 42, 300))
+
+    assert (decoded.source, decoded.sequence) == (42, 300 & 0xFF)
+    assert packets.parse_set_power(decoded.payload) == (True, 0)
+
+
+def test_broadcast_packet_has_no_target():
+    decoded = packets.unpack(packets.pack(packets.GET_SERVICE))
+
+    assert decoded.target == '00:00:00:00:00:00'
+
+
+def test_light_state_round_trip():
+    payload = packets.light_state(packets.Color(1, 2, 3, 4000), True, 'kitchen')
+
+    assert packets.parse_light_state(payload) == \
+        packets.LightStatePayload(packets.Color(1, 2, 3, 4000), True, 'kitchen')
+
+
+def test_invalid_packets_are_rejected():
+    packet = packets.pack(packets.LIGHT_GET)
+
+    assert packets.unpack(packet[:10]) is None
+    assert packets.unpack(packet + b'\x00') is None  # size mismatch
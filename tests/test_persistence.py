@@ -0,0 +1,38 @@
+import json
+
+from prism import persistence, yeelight_client
+from prism.light import LightState
+from prism.yeelight_client.connection import get_connection
+from prism.yeelight_client.yeelight import YeelightLight
+
+
+def test_snapshot_is_restored_until_confirmed(tmp_path):
+    path = str(tmp_path / 'lights.json')
+    light = YeelightLight('bedroom', '0x0000000001', get_connection('127.0.0.1'),
+                          state=LightState(power=True, brightness=40))
+    persistence.save(path, [light])
+
+    try:
+        restored = yeelight_client.restore_lights(persistence.load(path))
+
+        assert [light.get_name() for light in restored] == ['bedroom']
+        assert restored[0].get_restored() is not None
+        assert restored[0].get_state().brightness() == 40
+        assert yeelight_client.get_cached_lights() == restored
+    finally:
+        yeelight_client.evict_lights(['0x0000000001'])
+
+
+def test_unsupported_snapshot_version_is_ignored(tmp_path):
+    path = tmp_path / 'lights.json'
+    path.write_text(json.dumps({'version': persistence.VERSION - 1, 'lights': [{'name': 'bedroom'}]}))
+
+    assert persistence.load(str(path)) is None
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    path = tmp_path / 'lights.json'
+    path.write_text('{"version": ')
+
+    assert persistence.load(str(path)) is None
+    assert persistence.load(str(tmp_path / 'missing.json')) is None
@@ -0,0 +1,162 @@
+import time
+
+from prism.light import LightState, state_version
+from prism.registry import LightIndex, Registry, expire
+
+from .fakes import FakeLight
+
+
+def test_registry_remembers_unknown_names():
+    refreshes = []
+    registry = Registry(lambda: refreshes.append(1), miss_ttl=60)
+
+    assert registry.get_light('unknown') is None
+    assert registry.get_light('unknown') is None
+    assert len(refreshes) == 1
+
+    light = FakeLight('id-1', 'unknown')
+    registry.update([light])
+    assert registry.get_light('unknown') is light
+
+
+def test_registry_looks_again_after_miss_ttl():
+    refreshes = []
+    registry = Registry(lambda: refreshes.append(1), miss_ttl=0)
+
+    assert registry.get_light('unknown') is None
+    assert registry.get_light('unknown') is None
+    assert len(refreshes) == 2
+
+
+def test_registry_finds_light_by_id():
+    light = FakeLight('id-1', 'lamp')
+    registry = Registry(lambda: None)
+    registry.update([light])
+
+    assert registry.get_light('id-1') is light
+
+
+def test_registry_forgets_oldest_removals():
+    lights = [FakeLight('id-{}'.format(number)) for number in range(3)]
+    registry = Registry(lambda: None, max_removed=1)
+    registry.update(lights)
+    since = state_version()
+
+    registry.update(lights[1:])
+    assert registry.get_removed(since) == ['id-0']
+
+    registry.update(lights[2:])
+    assert registry.get_removed(since) is None  # removal of id-0 is forgotten
+    assert registry.get_removed(state_version() - 1) == ['id-1']
+
+    registry.update(lights)
+    assert registry.get_removed(state_version() - 2) == []  # added again
+
+
+def test_expire_hides_lights_stale_by_age_but_not_restored_lights():
+    now = int(time.time())
+    fresh = FakeLight('fresh', state=LightState(power=True))
+    aged = FakeLight('aged')
+    aged.sync({'last_seen': now - 3600, 'state': {}})
+    restored = FakeLight('restored')
+    restored.mark_restored(now - 3600)
+    gone = FakeLight('gone')
+    gone.sync({'last_seen': now - 100000, 'state': {}})
+
+    kept, evicted = expire([fresh, aged, restored, gone], stale_after=300, gone_after=86400)
+    registry = Registry(lambda: None)
+    registry.update(kept)
+
+    assert evicted == [gone]
+    assert [light.get_id() for light in registry.get_lights(include_stale=False)] == ['fresh', 'restored']
+    assert len(registry.get_lights()) == 3
+
+
+def test_expire_bounds_lights_by_last_seen():
+    now = int(time.time())
+    lights = [FakeLight('id-{}'.format(age)) for age in range(3)]
+    for age, light in enumerate(lights):
+        light.sync({'last_seen': now - age, 'state': {}})
+
+    kept, evicted = expire(lights, max_lights=2)
+
+    assert kept == lights[:2]
+    assert evicted == lights[2:]
+
+
+def test_index_finds_light_by_name_and_id():
+    light = FakeLight('d0:73:d5:00:00:01', 'kitchen')
+    index = LightIndex([light])
+
+    assert index.find('kitchen') is light
+    assert index.get('d0:73:d5:00:00:01') is light
+    assert 'd0:73:d5:00:00:01' in index
+
+
+def test_rename_keeps_entry():
+    light = FakeLight('d0:73:d5:00:00:01', 'kitchen')
+    index = LightIndex([light])
+
+    index.rename(light, 'pantry')
+
+    assert light.get_name() == 'pantry'
+    assert index.find('pantry') is light
+    assert index.find('kitchen') is None
+    assert len(index) == 1
+
+
+def test_same_name_refers_to_latest_light():
+    first = FakeLight('id-1', 'lamp')
+    second = FakeLight('id-2', 'lamp')
+    index = LightIndex([first, second])
+
+    assert index.find('lamp') is second
+    assert index.get('id-1') is first  # still found by id
+    assert len(index) == 2
+
+
+def test_removed_name_is_taken_over_by_light_with_same_name():
+    first = FakeLight('id-1', 'lamp')
+    second = FakeLight('id-2', 'lamp')
+    index = LightIndex([first, second])
+
+    index.pop('id-2')
+    assert index.find('lamp') is first
+
+    index.rename(first, 'desk')
+    assert index.find('lamp') is None
+
+
+def test_renamed_light_releases_shared_name():
+    first = FakeLight('id-1', 'lamp')
+    second = FakeLight('id-2', 'lamp')
+    index = LightIndex([first, second])
+
+    index.rename(second, 'desk')
+
+    assert index.find('lamp') is first
+    assert index.find('desk') is second
+
+
+def test_readd_with_same_id_replaces_light():
+    index = LightIndex([FakeLight('id-1', 'lamp')])
+    replacement = FakeLight('id-1', 'desk')
+
+    index.add(replacement)
+
+    assert len(index) == 1
+    assert index.find('desk') is replacement
+    assert index.find('lamp') is None
+
+
+
+def test_registry_finds_renamed_light_by_id():
+    light = FakeLight('d0:73:d5:00:00:01', 'kitchen')
+    registry = Registry(lambda: None)
+    registry.update([light])
+
+    light.rename('pantry')
+    registry.update([light])
+
+    assert registry.get_light('pantry') is light
+    assert registry.get_light('d0:73:d5:00:00:01') is light
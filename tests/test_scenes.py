@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from prism.light import LightState
+from prism.lifx_client import packets
+from prism.lifx_client.aio import AsyncLifxLight
+from prism.scenes import SceneEngine
+
+from .fakes import FakeLight
+
+
+class CompilingLight(FakeLight):
+    """Light that counts compiled states."""
+
+    def __init__(self, light_id, depends_on_state=False):
+        FakeLight.__init__(self, light_id)
+        self.compiled = 0
+        self._depends = depends_on_state
+
+    def _compile(self, state):
+        self.compiled += 1
+        return state
+
+    def _depends_on_state(self, state):
+        return self._depends
+
+
+def _engine(configuration, lights):
+    lights = {light.get_name(): light for light in lights}
+    return SceneEngine.from_configuration(configuration, lights.get, ThreadPoolExecutor(max_workers=2))
+
+
+def test_scene_is_compiled_once_per_light():
+    light = CompilingLight('lamp')
+    engine = _engine([{'name': 'evening', 'lights': [{'name': 'lamp', 'state': {'brightness': 20}}]}], [light])
+
+    for _ in range(3):
+        assert engine.apply('evening') == [('lamp', light, True)]
+
+    assert light.compiled == 1
+    assert len(light.written) == 3
+
+
+def test_scene_depending_on_light_state_is_compiled_every_time():
+    light = CompilingLight('lamp', depends_on_state=True)
+    engine = _engine([{'name': 'dim', 'lights': [{'name': 'lamp', 'state': {'brightness': 20}}]}], [light])
+
+    engine.apply('dim')
+    engine.apply('dim')
+
+    assert light.compiled == 2
+
+
+def test_scene_reports_missing_lights_and_skips_invalid_scenes():
+    light = FakeLight('lamp')
+    engine = _engine([
+        {'name': 'all', 'lights': [{'name': 'lamp', 'state': {'power': True}}, {'name': 'gone', 'state': {}}]},
+        {'name': 'invalid', 'lights': [{'name': 'lamp', 'state': {'brightness': 500}}]},
+    ], [light])
+
+    assert engine.apply('all') == [('lamp', light, True), ('gone', None, False)]
+    assert [scene.name for scene in engine.get_scenes()] == ['all']
+    assert engine.apply('invalid') is None
+
+
+def test_lifx_brightness_plan_is_not_reusable():
+    light = AsyncLifxLight('lamp', 'd0:73:d5:01:02:03', ('127.0.0.1', packets.PORT),
+                           state=LightState(color=[255, 0, 0], brightness=100, kelvin=3500))
+
+    assert not light.compile_state(LightState(brightness=20)).reusable
+    assert light.compile_state(LightState(color=[0, 0, 255], brightness=20)).reusable